@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+# benchmark.py - cs.py / so_zeroizer.py 离线基准测试
+
+import os
+import sys
+import io
+import json
+import re
+import time
+import struct
+import random
+import hashlib
+import shutil
+import zipfile
+import zlib
+import tempfile
+import platform
+import argparse
+import statistics
+import contextlib
+
+import cs
+import so_zeroizer
+
+# 规模预设: APK大小(MB)、dex数量、每个dex的类数、smali类数、so大小(MB)
+PRESETS = {
+    "small": {"apk_mb": 8, "dex_count": 3, "dex_classes": 2000, "smali_classes": 1000, "so_mb": 8},
+    "medium": {"apk_mb": 48, "dex_count": 6, "dex_classes": 8000, "smali_classes": 10000, "so_mb": 40},
+    "large": {"apk_mb": 160, "dex_count": 12, "dex_classes": 20000, "smali_classes": 40000, "so_mb": 120},
+}
+
+TARGET_CLASS = "com.bench.app.MainActivity"
+INJECTION_CODE = """new-instance v0, Lcom/clickwindow/rb/CustomDialog;
+invoke-direct {v0, p0}, Lcom/clickwindow/rb/CustomDialog;-><init>(Landroid/content/Context;)V"""
+
+
+def uleb128(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+class FixtureFactory:
+    """生成可复现的测试样本: 多dex APK、smali树、带植入模式的libapp.so"""
+
+    def __init__(self, root, seed=1234):
+        self.root = root
+        self.seed = seed
+        os.makedirs(root, exist_ok=True)
+
+    def _rng(self, name):
+        return random.Random(f"{self.seed}:{name}")
+
+    # 每个类的 onCreate()V:
+    #   const-string v0, <类描述符>; if-eqz v0, +3; nop; return-void
+    # 前5个码元在一个catch-all try块中，处理器地址为 return-void
+    FIXTURE_INSNS = (0x001a, None, 0x0038, 0x0003, 0x0000, 0x000e)
+    FIXTURE_TRY = (0, 5, 5)     # (start_addr, insn_count, catch_all_addr)
+
+    def make_dex(self, descriptors):
+        """最小合法dex: 每个类一个带分支和try块的 onCreate()V，含map_list、校验和与SHA-1签名"""
+        descriptors = sorted(set(descriptors))
+        strings = sorted(set(descriptors) | {"Ljava/lang/Object;", "V", "onCreate"})
+        string_index = {value: i for i, value in enumerate(strings)}
+        types = [value for value in strings if value[0] in 'LV']
+        type_index = {value: i for i, value in enumerate(types)}
+        count = len(descriptors)
+
+        string_ids_off = 0x70
+        type_ids_off = string_ids_off + 4 * len(strings)
+        proto_ids_off = type_ids_off + 4 * len(types)
+        method_ids_off = proto_ids_off + 12
+        class_defs_off = method_ids_off + 8 * count
+        code_off = data_off = class_defs_off + 32 * count
+
+        code_items = bytearray()
+        code_offsets = []
+        start_addr, insn_count, catch_all = self.FIXTURE_TRY
+        for descriptor in descriptors:
+            code_items += bytes(-len(code_items) % 4)
+            code_offsets.append(code_off + len(code_items))
+            insns = [string_index[descriptor] if unit is None else unit for unit in self.FIXTURE_INSNS]
+            code_items += struct.pack('<4HII', 2, 1, 0, 1, 0, len(insns))
+            code_items += struct.pack(f'<{len(insns)}H', *insns)
+            code_items += struct.pack('<IHH', start_addr, insn_count, 1)
+            # 处理器列表: 1个处理器，size=0 (只有catch-all)
+            code_items += uleb128(1) + b'\x00' + uleb128(catch_all)
+        class_data_off = code_off + len(code_items)
+
+        class_data = bytearray()
+        class_data_offsets = []
+        for method_index, offset in enumerate(code_offsets):
+            class_data_offsets.append(class_data_off + len(class_data))
+            class_data += uleb128(0) * 3 + uleb128(1) + uleb128(method_index) + uleb128(0x1) + uleb128(offset)
+        string_data_off = class_data_off + len(class_data)
+
+        string_data = bytearray()
+        string_offsets = []
+        for value in strings:
+            string_offsets.append(string_data_off + len(string_data))
+            string_data += uleb128(len(value)) + value.encode() + b'\0'
+        map_off = string_data_off + len(string_data)
+        map_off += -map_off % 4
+        sections = [
+            (0x0000, 1, 0), (0x0001, len(strings), string_ids_off), (0x0002, len(types), type_ids_off),
+            (0x0003, 1, proto_ids_off), (0x0005, count, method_ids_off), (0x0006, count, class_defs_off),
+            (0x2001, count, code_off), (0x2000, count, class_data_off), (0x2002, len(strings), string_data_off),
+            (0x1000, 1, map_off),
+        ]
+        map_list = struct.pack('<I', len(sections)) + b''.join(
+            struct.pack('<HxxII', type_, size, offset) for type_, size, offset in sections)
+
+        body = bytearray(0x70)
+        body += b''.join(struct.pack('<I', offset) for offset in string_offsets)
+        body += b''.join(struct.pack('<I', string_index[value]) for value in types)
+        body += struct.pack('<3I', string_index["V"], type_index["V"], 0)
+        body += b''.join(struct.pack('<HHI', type_index[descriptor], 0, string_index["onCreate"])
+                         for descriptor in descriptors)
+        body += b''.join(struct.pack('<8I', type_index[descriptor], 0x1, type_index["Ljava/lang/Object;"],
+                                     0, 0xffffffff, 0, class_data_offsets[i], 0)
+                         for i, descriptor in enumerate(descriptors))
+        body += code_items + class_data + string_data
+        body += bytes(map_off - len(body)) + map_list
+
+        body[:8] = b'dex\n035\0'
+        struct.pack_into('<3I', body, 0x20, len(body), 0x70, 0x12345678)
+        struct.pack_into('<I', body, 0x34, map_off)
+        struct.pack_into('<4I', body, 0x38, len(strings), string_ids_off, len(types), type_ids_off)
+        struct.pack_into('<2I', body, 0x48, 1, proto_ids_off)
+        struct.pack_into('<2I', body, 0x58, count, method_ids_off)
+        struct.pack_into('<2I', body, 0x60, count, class_defs_off)
+        struct.pack_into('<2I', body, 0x68, len(body) - data_off, data_off)
+        body[12:32] = hashlib.sha1(body[32:]).digest()
+        struct.pack_into('<I', body, 8, zlib.adler32(body[12:]))
+        return bytes(body)
+
+    def apk(self, apk_mb, dex_count, dex_classes):
+        """多dex APK，目标类放在最后一个dex中，其余空间用可压缩/不可压缩资源填充"""
+        path = os.path.join(self.root, f"app_{apk_mb}mb_{dex_count}dex_{dex_classes}c.apk")
+        if os.path.exists(path):
+            return path
+        rng = self._rng(path)
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as apk:
+            apk.writestr("AndroidManifest.xml", b'\x03\x00\x08\x00' + bytes(4096))
+            for i in range(dex_count):
+                descriptors = [f"Lcom/bench/p{i}/C{j};" for j in range(dex_classes)]
+                if i == dex_count - 1:
+                    descriptors.append(cs.class_descriptor(TARGET_CLASS))
+                name = "classes.dex" if i == 0 else f"classes{i + 1}.dex"
+                apk.writestr(name, self.make_dex(descriptors))
+            apk.writestr("resources.arsc", bytes(512 * 1024), compress_type=zipfile.ZIP_STORED)
+
+            remaining = apk_mb * 1024 * 1024 - os.path.getsize(path)
+            index = 0
+            while remaining > 0:
+                size = min(remaining, 2 * 1024 * 1024)
+                if index % 2:
+                    apk.writestr(f"assets/blob_{index}.bin", rng.randbytes(size), compress_type=zipfile.ZIP_STORED)
+                else:
+                    text = b''.join(b'<item name="k%d">value %d</item>\n' % (j, j) for j in range(size // 40))
+                    apk.writestr(f"res/values/v_{index}.xml", text)
+                remaining -= size
+                index += 1
+        return path
+
+    def smali_tree(self, classes):
+        """包含N个类的smali树，其中一个是目标类"""
+        root = os.path.join(self.root, f"smali_{classes}")
+        if os.path.isdir(root):
+            return root
+        tmp_root = root + ".tmp"
+        shutil.rmtree(tmp_root, ignore_errors=True)
+        for i in range(classes):
+            class_name = TARGET_CLASS if i == 0 else f"com.bench.p{i % 97}.C{i}"
+            path = os.path.join(tmp_root, class_name.replace('.', '/') + ".smali")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(
+                    f".class public {cs.class_descriptor(class_name)}\n"
+                    ".super Landroid/app/Activity;\n\n"
+                    ".method public onCreate(Landroid/os/Bundle;)V\n"
+                    "    .registers 3\n\n"
+                    "    invoke-super {p0, p1}, Landroid/app/Activity;->onCreate(Landroid/os/Bundle;)V\n\n"
+                    "    return-void\n"
+                    ".end method\n"
+                )
+        os.replace(tmp_root, root)
+        return root
+
+    def so_file(self, so_mb, density, patterns):
+        """随机字节的libapp.so，每 density 字节植入一个模式"""
+        path = os.path.join(self.root, f"libapp_{so_mb}mb_{density}.so")
+        if os.path.exists(path):
+            return path
+        rng = self._rng(path)
+        size = so_mb * 1024 * 1024
+        data = bytearray(rng.randbytes(size))
+        for offset in range(0, size - 64, density):
+            pattern = patterns[(offset // density) % len(patterns)]
+            data[offset:offset + len(pattern)] = pattern
+        with open(path, 'wb') as f:
+            f.write(b'\x7fELF' + bytes(data[4:]))
+        return path
+
+    def overlap_so(self):
+        """长串相同字节/零填充的so: 重叠候选成串跨越多个窗口 (窗口流式模式的极端情况)"""
+        path = os.path.join(self.root, "libapp_overlap.so")
+        if os.path.exists(path):
+            return path
+        rng = self._rng(path)
+        data = bytearray(rng.randbytes(512 * 1024))
+        data[0x1000:0x31000] = b'a' * 0x30000
+        data[0x40000:0x70000] = bytes(0x30000)
+        for offset in range(0x32000, 0x3f000, 0x333):
+            data[offset:offset + 5] = b'aaaaa'
+        with open(path, 'wb') as f:
+            f.write(b'\x7fELF' + bytes(data[4:]))
+        return path
+
+
+class BenchmarkRunner:
+    """对各阶段计时，重复多次取中位数"""
+
+    def __init__(self, repeat=3, verbose=False):
+        self.repeat = repeat
+        self.verbose = verbose
+        self.results = {}
+
+    def quiet(self):
+        """屏蔽被测代码的输出 (verbose时保留)"""
+        return contextlib.redirect_stdout(sys.stdout if self.verbose else io.StringIO())
+
+    def measure(self, name, setup, func, bytes_processed=None):
+        runs = []
+        for _ in range(self.repeat):
+            with self.quiet():
+                state = setup() if setup else None
+                started = time.perf_counter()
+                func(state)
+                runs.append(time.perf_counter() - started)
+        median = statistics.median(runs)
+        result = {"seconds": round(median, 6), "runs": [round(run, 6) for run in runs]}
+        if bytes_processed:
+            result["bytes"] = bytes_processed
+            result["mb_per_s"] = round(bytes_processed / 1024 / 1024 / median, 2) if median else None
+        self.results[name] = result
+        print(f"⏱️  {name:<40} {median * 1000:10.1f} ms" +
+              (f"  {result['mb_per_s']:8.1f} MB/s" if bytes_processed else ""))
+        return result
+
+
+def run_injector_stages(runner, factory, params, work_dir):
+    """FinalInjector中不依赖JVM的阶段"""
+    size = params["preset"]
+    apk_path = factory.apk(params["apk_mb"], params["dex_count"], params["dex_classes"])
+    apk_bytes = os.path.getsize(apk_path)
+    injector = cs.FinalInjector(workspace_cache=False)
+    try:
+        def extract(_):
+            injector.temp_dir = tempfile.mkdtemp(dir=work_dir)
+            return injector.extract_dex_files(apk_path)
+
+        runner.measure(f"injector.extract[{size}]", None, extract, apk_bytes)
+        with runner.quiet():
+            extract_dir, dex_files = extract(None)
+
+        runner.measure(f"injector.dex_index[{size}]", None,
+                       lambda _: injector.index_dex_files(extract_dir, dex_files))
+
+        specs = [cs.InjectionSpec(TARGET_CLASS, "onCreate", INJECTION_CODE)]
+        with open(os.path.join(extract_dir, dex_files[-1]), 'rb') as f:
+            dex_data = f.read()
+
+        def rewrite_dex(_):
+            dex = cs.DexFile(dex_data)
+            dex.inject(specs)
+            return dex.build()
+
+        runner.measure(f"injector.dex_rewrite[{size}]", None, rewrite_dex, len(dex_data))
+
+        smali_source = factory.smali_tree(params["smali_classes"])
+
+        def copy_tree():
+            smali_dir = tempfile.mkdtemp(dir=work_dir)
+            shutil.copytree(smali_source, smali_dir, dirs_exist_ok=True)
+            return smali_dir
+
+        runner.measure(f"injector.smali_index_build[{size}]", copy_tree, cs.SmaliIndex.build)
+
+        def fresh_injector_tree():
+            smali_dir = copy_tree()
+            cs.SmaliIndex.build(smali_dir).save()
+            return smali_dir
+
+        runner.measure(f"injector.find_target_smali[{size}]", fresh_injector_tree,
+                       lambda smali_dir: injector.find_target_smali(smali_dir, TARGET_CLASS))
+        runner.measure(f"injector.inject[{size}]", fresh_injector_tree,
+                       lambda smali_dir: injector.apply_injections(smali_dir, specs))
+
+        replacement = os.path.join(extract_dir, dex_files[-1])
+        output_apk = os.path.join(work_dir, "repacked.apk")
+        runner.measure(f"injector.repack[{size}]", None,
+                       lambda _: cs.repack_apk(apk_path, output_apk, {dex_files[-1]: replacement}),
+                       apk_bytes)
+
+        key_path = os.path.join(factory.root, "bench_signing.pem")
+        with runner.quiet():
+            signer = cs.ApkSigner(cs.DebugSigningKey.load_or_create(key_path))
+        runner.measure(f"injector.sign[{size}]", None,
+                       lambda _: signer.sign(output_apk, os.path.join(work_dir, "signed.apk")),
+                       apk_bytes)
+    finally:
+        injector.cleanup()
+
+
+def run_zeroizer_stages(runner, factory, params, work_dir):
+    """SOZeroizer.process_strings 扫描+置零"""
+    size = params["preset"]
+    zeroizer = so_zeroizer.SOZeroizer()
+    source = factory.so_file(params["so_mb"], params["density"], zeroizer.strings_to_zero)
+    target = os.path.join(work_dir, "libapp.so")
+
+    def setup():
+        shutil.copyfile(source, target)
+        return so_zeroizer.SOZeroizer(so_file_path=target, interactive=False, progress=False,
+                                       backup="none")
+
+    runner.measure(f"zeroizer.process_strings[{size}]", setup,
+                   lambda instance: instance.process_strings(), os.path.getsize(source))
+
+
+def zeroize_copy(source, target, **options):
+    """在副本上运行SOZeroizer，返回 (结果字节, 命中计数)"""
+    shutil.copyfile(source, target)
+    with contextlib.redirect_stdout(io.StringIO()):
+        zeroizer = so_zeroizer.SOZeroizer(so_file_path=target, interactive=False, progress=False,
+                                          backup="none", **options)
+        zeroizer.process_strings()
+    with open(target, 'rb') as f:
+        return f.read(), zeroizer.rule_counts
+
+
+def check_zeroizer_windows(factory, work_dir):
+    """窗口流式模式与整体映射模式的结果必须逐字节一致 (含跨窗口的重叠串)"""
+    source = factory.overlap_so()
+    target = os.path.join(work_dir, "libapp_check.so")
+    cases = {
+        "aa": {"patterns": [b'aa']},
+        "zero-count": {"rules": so_zeroizer.RuleSet.from_dicts([{"hex": "00 00 00 00", "action": "count"}])},
+    }
+    for name, options in cases.items():
+        expected = zeroize_copy(source, target, **options)
+        for window in (4096, 64 * 1024):
+            actual = zeroize_copy(source, target, window_size=window, **options)
+            assert actual == expected, f"{name}: window={window} 与整体扫描结果不一致"
+
+
+def check_matcher_paths(factory, work_dir):
+    """find路径与前缀树正则路径产出的候选序列必须完全一致 (模式互相重叠，无重复项)"""
+    rng = random.Random(14)
+    for _ in range(300):
+        patterns = {bytes(rng.choice(b'ab') for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 8))}
+        data = bytes(rng.choice(b'abc') for _ in range(rng.randint(0, 64)))
+        matcher = so_zeroizer.PatternMatcher(sorted(patterns))
+        expected = list(matcher.candidates(data))
+        matcher.regex = re.compile(matcher._trie_regex(matcher.trie))
+        actual = list(matcher.candidates(data))
+        assert actual == expected, f"{sorted(patterns)} / {data!r}: 两条路径的候选不一致"
+
+
+def read_code(dex, descriptor):
+    """读取类中唯一方法的code_item: 寄存器数、指令码元、try块 (含catch-all地址)"""
+    method, = dex.class_methods(descriptor)
+    data, offset = dex.data, method["code_off"]
+    registers, _, _, tries_size, _, insns_size = struct.unpack_from('<4HII', data, offset)
+    insns = list(struct.unpack_from(f'<{insns_size}H', data, offset + 16))
+    pos = offset + 16 + insns_size * 2 + (insns_size & 1) * 2
+    handlers = pos + 8 * tries_size
+    tries = []
+    for i in range(tries_size):
+        start_addr, insn_count, handler_off = struct.unpack_from('<IHH', data, pos + 8 * i)
+        size, cursor = cs.read_sleb128(data, handlers + handler_off)
+        for _ in range(abs(size) * 2):
+            _, cursor = cs.read_uleb128(data, cursor)
+        catch_all = cs.read_uleb128(data, cursor)[0] if size <= 0 else None
+        tries.append((start_addr, insn_count, catch_all))
+    return {"method": method, "registers": registers, "insns": insns, "tries": tries}
+
+
+def check_dex_rewrite(factory, work_dir):
+    """DexFile注入往返: 头部校验和与签名、引用重映射、try/处理器地址平移"""
+    descriptors = [f"Lcom/bench/p0/C{j};" for j in range(64)] + [cs.class_descriptor(TARGET_CLASS)]
+    original = cs.DexFile(factory.make_dex(descriptors))
+    assert original.build() == original.data, "未注入时重建结果与原dex不一致"
+
+    dex = cs.DexFile(original.data)
+    assert dex.inject([cs.InjectionSpec(TARGET_CLASS, "onCreate", INJECTION_CODE)]) == 1, "注入位置数错误"
+    data = dex.build()
+    rebuilt = cs.DexFile(data)
+    assert struct.unpack_from('<I', data, 8)[0] == zlib.adler32(data[12:]), "Adler-32校验和错误"
+    assert data[12:32] == hashlib.sha1(data[32:]).digest(), "SHA-1签名错误"
+
+    fixture = list(FixtureFactory.FIXTURE_INSNS)
+    for descriptor in descriptors:
+        before, after = read_code(original, descriptor), read_code(rebuilt, descriptor)
+        assert after["method"]["signature"] == "onCreate()V", f"{descriptor}: 方法id重映射错误"
+        shift = len(after["insns"]) - len(before["insns"])
+        body = after["insns"][shift:]
+        # const-string 的字符串索引已重映射，仍指向本类描述符
+        assert rebuilt.string_at(body[1]) == descriptor, f"{descriptor}: 字符串索引重映射错误"
+        assert body[:1] + body[2:] == fixture[:1] + fixture[2:], f"{descriptor}: 原指令被改动"
+        start_addr, insn_count, catch_all = FixtureFactory.FIXTURE_TRY
+        assert after["tries"] == [(start_addr + shift, insn_count, catch_all + shift)], \
+            f"{descriptor}: try/处理器地址未正确平移"
+        if descriptor != cs.class_descriptor(TARGET_CLASS):
+            assert shift == 0, f"{descriptor}: 非目标方法被改动"
+            continue
+        # new-instance v0, CustomDialog; invoke-direct {v0, p0}, CustomDialog-><init>(Context)V
+        prologue = after["insns"][:shift]
+        assert prologue[0] & 0xff == 0x22 and rebuilt.type_at(prologue[1]) == "Lcom/clickwindow/rb/CustomDialog;", \
+            "注入的new-instance类型错误"
+        class_idx, proto_idx, name_idx = rebuilt.ids[rebuilt.TYPE_METHOD_ID][prologue[3]]
+        assert prologue[2] & 0xff == 0x70 and rebuilt.type_at(class_idx) == "Lcom/clickwindow/rb/CustomDialog;" \
+            and rebuilt.string_at(name_idx) == "<init>", "注入的invoke-direct方法引用错误"
+        assert prologue[4] == 0x0010, "invoke-direct 参数寄存器应为 {v0, p0=v1}"
+        assert after["registers"] == before["registers"], "寄存器数不应增长"
+
+
+CHECKS = [check_zeroizer_windows, check_matcher_paths, check_dex_rewrite]
+
+
+def run_checks(factory, work_dir):
+    """正确性回归检查，返回 {名称: 错误信息或None}"""
+    results = {}
+    for check in CHECKS:
+        started = time.perf_counter()
+        try:
+            check(factory, work_dir)
+            results[check.__name__] = None
+            print(f"✅ {check.__name__:<40} {(time.perf_counter() - started) * 1000:10.1f} ms")
+        except AssertionError as e:
+            results[check.__name__] = str(e)
+            print(f"❌ {check.__name__}: {e}")
+    return results
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """返回退化的阶段列表 [(名称, 基线秒数, 当前秒数)]"""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous and result["seconds"] > previous["seconds"] * (1 + threshold):
+            regressions.append((name, previous["seconds"], result["seconds"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="cs.py / so_zeroizer.py 离线基准测试")
+    parser.add_argument("--sizes", default="small", help="逗号分隔的规模预设: " + ",".join(PRESETS))
+    parser.add_argument("--only", choices=["checks", "injector", "zeroizer"], help="只运行某一组")
+    parser.add_argument("--repeat", type=int, default=3, help="每个阶段重复次数 (取中位数)")
+    parser.add_argument("--density", type=int, default=64 * 1024, help="so中每多少字节植入一个模式")
+    parser.add_argument("--fixtures", help="样本目录 (默认临时目录，指定后可复用)")
+    parser.add_argument("--output", default="benchmark_results.json", help="结果JSON")
+    parser.add_argument("--baseline", help="对比的基线JSON")
+    parser.add_argument("--save-baseline", help="把本次结果另存为基线")
+    parser.add_argument("--threshold", type=float, default=0.15, help="判定退化的相对阈值")
+    parser.add_argument("--verbose", action="store_true", help="显示被测代码的输出")
+    args = parser.parse_args(argv)
+
+    fixture_root = args.fixtures or tempfile.mkdtemp(prefix="bench_fixtures_")
+    work_dir = tempfile.mkdtemp(prefix="bench_work_")
+    factory = FixtureFactory(fixture_root)
+    runner = BenchmarkRunner(repeat=args.repeat, verbose=args.verbose)
+    checks = {}
+
+    try:
+        if args.only in (None, "checks"):
+            print("\n🔍 正确性检查")
+            checks = run_checks(factory, work_dir)
+        for preset in args.sizes.split(',') if args.only != "checks" else []:
+            params = dict(PRESETS[preset], preset=preset, density=args.density)
+            print(f"\n📐 规模: {preset} {params}")
+            if args.only in (None, "injector"):
+                run_injector_stages(runner, factory, params, work_dir)
+            if args.only in (None, "zeroizer"):
+                run_zeroizer_stages(runner, factory, params, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if not args.fixtures:
+            shutil.rmtree(fixture_root, ignore_errors=True)
+
+    report = {
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "repeat": args.repeat,
+        "results": runner.results,
+        "checks": checks,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 结果已写入: {args.output}")
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.save_baseline)
+        print(f"💾 基线已保存: {args.save_baseline}")
+
+    failed = [name for name, error in checks.items() if error]
+    if failed:
+        print(f"\n❌ {len(failed)} 项正确性检查失败: {', '.join(failed)}")
+        return 1
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_with_baseline(runner.results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n❌ 发现 {len(regressions)} 处性能退化 (阈值 {args.threshold:.0%}):")
+            for name, before, after in regressions:
+                print(f"  - {name}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms")
+            return 1
+        print("\n✅ 与基线相比无性能退化")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
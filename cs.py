@@ -9,12 +9,2821 @@ import shutil
 import subprocess
 import re
 import glob
+import json
+import hashlib
+import threading
+import mmap
+import array
+import bisect
+import struct
+import queue
+import collections
+import time
+import zlib
+import argparse
+import base64
+import secrets
+import contextlib
+import copy
+from concurrent.futures import ThreadPoolExecutor
+
+BAKSMALI_URL = "https://bitbucket.org/JesusFreke/smali/downloads/baksmali-2.5.2.jar"
+SMALI_URL = "https://bitbucket.org/JesusFreke/smali/downloads/smali-2.5.2.jar"
+
+# 持久化缓存根目录，可通过环境变量覆盖
+CACHE_ROOT = os.environ.get(
+    "FINAL_INJECTOR_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "final_injector")
+)
+
+# 内置签名器使用的调试密钥 (PEM: RSA私钥 + 自签名证书)，放在缓存目录而不是源码目录，可通过环境变量覆盖
+DEBUG_KEY_PATH = os.environ.get("FINAL_INJECTOR_SIGNING_KEY", os.path.join(CACHE_ROOT, "debug_signing.pem"))
+# jarsigner模式的keytool密钥库
+DEBUG_KEYSTORE_PATH = os.environ.get("FINAL_INJECTOR_KEYSTORE", os.path.join(CACHE_ROOT, "debug.keystore"))
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """流式计算文件SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StageMetrics:
+    """分阶段性能采集 - 墙钟/CPU时间、子进程CPU时间、峰值RSS、读写字节，输出JSON/JSONL
+
+    sink: JSONL文件路径，每个阶段结束时追加一行;
+    profile / trace_memory: 需要cProfile / tracemalloc 的阶段名 ("*" 表示全部)。
+    RSS、读写字节、子进程时间是进程级计数，并行执行的阶段会互相重叠。
+    """
+
+    def __init__(self, sink=None, profile=(), trace_memory=(), profile_dir=None, enabled=True, **context):
+        self.sink = sink
+        self.profile = set(profile)
+        self.trace_memory = set(trace_memory)
+        self.profile_dir = profile_dir or tempfile.gettempdir()
+        self.enabled = enabled
+        self.context = context
+        self.records = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _io_counters():
+        """读取 /proc/self/io 的 rchar/wchar (不可用时返回None)"""
+        try:
+            with open('/proc/self/io', 'r') as f:
+                fields = dict(line.split(':') for line in f.read().splitlines())
+            return int(fields['rchar']), int(fields['wchar'])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    @staticmethod
+    def _rusage():
+        try:
+            import resource
+        except ImportError:
+            return None
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        # Linux上ru_maxrss单位为KB，macOS为字节
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return {
+            "children_cpu": child_usage.ru_utime + child_usage.ru_stime,
+            "peak_rss": self_usage.ru_maxrss * scale,
+            "peak_child_rss": child_usage.ru_maxrss * scale,
+        }
+
+    def _selected(self, selection, name):
+        return '*' in selection or name in selection
+
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        """记录一个阶段；可在with块内向返回的字典写入 bytes_processed 等字段"""
+        record = dict(self.context, stage=name, **fields)
+        if not self.enabled:
+            yield record
+            return
+
+        profiler = None
+        if self._selected(self.profile, name):
+            import cProfile
+            profiler = cProfile.Profile()
+        started_tracing = False
+        if self._selected(self.trace_memory, name):
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+
+        io_before = self._io_counters()
+        usage_before = self._rusage()
+        cpu_before = time.process_time()
+        wall_before = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            wall = time.perf_counter() - wall_before
+            record["wall_s"] = round(wall, 6)
+            record["cpu_s"] = round(time.process_time() - cpu_before, 6)
+
+            usage_after = self._rusage()
+            if usage_before and usage_after:
+                record["subprocess_cpu_s"] = round(usage_after["children_cpu"] - usage_before["children_cpu"], 6)
+                record["peak_rss_mb"] = round(usage_after["peak_rss"] / 1024 / 1024, 2)
+                record["peak_child_rss_mb"] = round(usage_after["peak_child_rss"] / 1024 / 1024, 2)
+            io_after = self._io_counters()
+            if io_before and io_after:
+                record["bytes_read"] = io_after[0] - io_before[0]
+                record["bytes_written"] = io_after[1] - io_before[1]
+            if record.get("bytes_processed") and wall > 0:
+                record["mb_per_s"] = round(record["bytes_processed"] / 1024 / 1024 / wall, 2)
+
+            if started_tracing or self._selected(self.trace_memory, name):
+                import tracemalloc
+                record["python_peak_alloc_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+                if started_tracing:
+                    tracemalloc.stop()
+            if profiler:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                profile_path = os.path.join(
+                    self.profile_dir, f"{name}-{os.getpid()}-{threading.get_ident()}-{int(time.time() * 1000)}.prof"
+                )
+                profiler.dump_stats(profile_path)
+                record["profile"] = profile_path
+            self._emit(record)
+
+    def _emit(self, record):
+        with self._lock:
+            self.records.append(record)
+            if self.sink:
+                with open(self.sink, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def write_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.records, f, ensure_ascii=False, indent=2)
+
+    def totals(self):
+        """按阶段汇总墙钟时间 (秒)"""
+        totals = collections.OrderedDict()
+        for record in self.records:
+            totals[record["stage"]] = round(totals.get(record["stage"], 0) + record.get("wall_s", 0), 6)
+        return totals
+
+    def print_summary(self):
+        """打印各阶段墙钟时间，方便找出最慢的阶段"""
+        totals = self.totals()
+        if not totals:
+            return
+        print("\n⏱️  阶段耗时:")
+        for stage, seconds in sorted(totals.items(), key=lambda item: -item[1]):
+            print(f"  {stage:<12} {seconds:8.2f}s")
+
+
+def parse_pins(items):
+    """解析 "文件名=SHA-256" 列表 (或逗号分隔的字符串) 为字典"""
+    if isinstance(items, str):
+        items = items.split(',')
+    pins = {}
+    for item in items or ():
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, sha256 = item.partition('=')
+        sha256 = sha256.strip().lower()
+        if not sep or not re.fullmatch(r'[0-9a-f]{64}', sha256):
+            raise ValueError(f"无效的SHA-256固定值: {item} (格式: 文件名=64位十六进制)")
+        pins[name.strip()] = sha256
+    return pins
+
+
+class ToolCache:
+    """跨运行持久化的工具缓存 - 按SHA-256内容寻址
+
+    查找顺序: 本地缓存 -> 本地镜像目录 -> 网络下载。
+    缓存命中后完全离线可用；pinned 可为文件名指定期望的SHA-256 (另可由环境变量
+    FINAL_INJECTOR_PINS 给出)，首次下载即校验。未固定的下载只能信任首次结果，
+    require_pinned=True 时直接拒绝。
+    """
+
+    def __init__(self, cache_dir=None, mirror_dir=None, offline=False, pinned=None, require_pinned=False):
+        self.cache_dir = os.path.join(cache_dir or CACHE_ROOT, "tools")
+        self.mirror_dir = mirror_dir or os.environ.get("FINAL_INJECTOR_MIRROR")
+        self.offline = offline or os.environ.get("FINAL_INJECTOR_OFFLINE") == "1"
+        self.pinned = parse_pins(os.environ.get("FINAL_INJECTOR_PINS", ""))
+        self.pinned.update(pinned or {})
+        self.require_pinned = require_pinned or os.environ.get("FINAL_INJECTOR_REQUIRE_PINS") == "1"
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        self._verified = {}
+        self._lock = threading.Lock()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
+
+    def _object_path(self, sha256, name):
+        return os.path.join(self.cache_dir, "objects", sha256[:2], sha256 + os.path.splitext(name)[1])
+
+    def _store(self, src_path, sha256, name, url, move=False):
+        """把文件放入内容寻址存储并更新索引"""
+        object_path = self._object_path(sha256, name)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        if not os.path.exists(object_path):
+            tmp_path = object_path + '.part'
+            if move:
+                shutil.move(src_path, tmp_path)
+            else:
+                shutil.copyfile(src_path, tmp_path)
+            os.replace(tmp_path, object_path)
+        elif move:
+            os.remove(src_path)
+
+        index = self._load_index()
+        index[name] = {"sha256": sha256, "url": url}
+        self._save_index(index)
+        return object_path
+
+    def _from_cache(self, name, expected):
+        entry = self._load_index().get(name)
+        if not entry or (expected and entry["sha256"] != expected):
+            return None
+        object_path = self._object_path(entry["sha256"], name)
+        if os.path.exists(object_path) and file_sha256(object_path) == entry["sha256"]:
+            return object_path
+        return None
+
+    def _from_mirror(self, name, url, expected):
+        if not self.mirror_dir:
+            return None
+        for candidate in (name, os.path.basename(url)):
+            mirror_path = os.path.join(self.mirror_dir, candidate)
+            if not os.path.isfile(mirror_path):
+                continue
+            sha256 = file_sha256(mirror_path)
+            if expected and sha256 != expected:
+                print(f"⚠️  镜像文件校验失败: {mirror_path}")
+                continue
+            print(f"📂 使用本地镜像: {mirror_path}")
+            return self._store(mirror_path, sha256, name, url)
+        return None
+
+    def _download(self, url, name, expected):
+        if not expected and self.require_pinned:
+            print(f"❌ {name} 没有固定的SHA-256，拒绝下载 (用 --pin {name}=<sha256> 固定)")
+            return None
+        try:
+            import requests
+        except ImportError:
+            print(f"❌ 缺少requests模块，无法下载 {name} (pip install requests)")
+            return None
+        print(f"📥 下载 {name}...")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.download')
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as f:
+                response = requests.get(url, stream=True, timeout=60)
+                if response.status_code != 200:
+                    print(f"❌ 下载失败: HTTP {response.status_code}")
+                    return None
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    digest.update(chunk)
+                    f.write(chunk)
+            sha256 = digest.hexdigest()
+            if expected and sha256 != expected:
+                print(f"❌ SHA-256校验失败: {name} ({sha256})")
+                return None
+            if not expected:
+                print(f"⚠️  {name} 未固定SHA-256，首次下载无法校验: {sha256}")
+                print(f"   核对无误后可用 --pin {name}={sha256} 固定")
+            return self._store(tmp_path, sha256, name, url, move=True)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def fetch(self, url, filename=None):
+        """获取工具路径，缓存键为URL中的文件名(含版本号)"""
+        name = os.path.basename(url)
+        expected = self.pinned.get(name) or self.pinned.get(filename)
+
+        with self._lock:
+            if name in self._verified:
+                return self._verified[name]
+
+            path = self._from_cache(name, expected) or self._from_mirror(name, url, expected)
+            if not path:
+                if self.offline:
+                    print(f"❌ 离线模式下缓存与镜像中均无 {name}")
+                    return None
+                path = self._download(url, name, expected)
+            if path:
+                self._verified[name] = path
+            return path
+
+
+JVM_WORKER_SOURCE = r"""
+import java.io.*;
+import java.util.Collections;
+import org.jf.baksmali.Baksmali;
+import org.jf.baksmali.BaksmaliOptions;
+import org.jf.dexlib2.DexFileFactory;
+import org.jf.dexlib2.dexbacked.DexBackedDexFile;
+import org.jf.smali.Smali;
+import org.jf.smali.SmaliOptions;
+
+public class SmaliWorker {
+    public static void main(String[] args) throws Exception {
+        PrintStream protocol = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        System.setOut(System.err);
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+        String line;
+        while ((line = in.readLine()) != null) {
+            String[] parts = line.split("\t");
+            try {
+                if (parts[0].equals("PING")) {
+                    protocol.println("OK PONG");
+                } else if (parts[0].equals("DISASSEMBLE")) {
+                    DexBackedDexFile dexFile = DexFileFactory.loadDexFile(new File(parts[1]), null);
+                    boolean ok = Baksmali.disassembleDexFile(dexFile, new File(parts[2]),
+                            Runtime.getRuntime().availableProcessors(), new BaksmaliOptions());
+                    protocol.println(ok ? "OK" : "ERR baksmali failed");
+                } else if (parts[0].equals("ASSEMBLE")) {
+                    SmaliOptions options = new SmaliOptions();
+                    options.outputDexFile = parts[2];
+                    boolean ok = Smali.assemble(options, Collections.singletonList(parts[1]));
+                    protocol.println(ok ? "OK" : "ERR smali failed");
+                } else if (parts[0].equals("QUIT")) {
+                    return;
+                } else {
+                    protocol.println("ERR unknown command " + parts[0]);
+                }
+            } catch (Throwable t) {
+                protocol.println("ERR " + String.valueOf(t).replace('\n', ' '));
+            }
+        }
+    }
+}
+"""
+
+
+class JvmWorkerError(Exception):
+    """常驻JVM通信失败 (进程退出、超时等)，与任务本身失败区分"""
+
+
+class JvmWorker:
+    """常驻JVM工作进程 - 在一个JVM里通过stdin/stdout行协议执行多个smali/baksmali任务
+
+    协议: 每行一个请求 "命令\t参数..."，每行一个响应 "OK ..." 或 "ERR ..."。
+    需要Java 11+ (单文件源码启动)。
+    """
+
+    def __init__(self, baksmali_path, smali_path, jvm_memory=None, timeout=600):
+        self.baksmali_path = baksmali_path
+        self.smali_path = smali_path
+        self.jvm_memory = jvm_memory
+        self.timeout = timeout
+        self.process = None
+        self._responses = None
+        self._stderr_tail = collections.deque(maxlen=50)
+
+    def _source_path(self):
+        worker_dir = os.path.join(CACHE_ROOT, "jvm_worker")
+        source_path = os.path.join(worker_dir, "SmaliWorker.java")
+        try:
+            with open(source_path, 'r', encoding='utf-8') as f:
+                if f.read() == JVM_WORKER_SOURCE:
+                    return source_path
+        except OSError:
+            pass
+        os.makedirs(worker_dir, exist_ok=True)
+        with open(source_path, 'w', encoding='utf-8') as f:
+            f.write(JVM_WORKER_SOURCE)
+        return source_path
+
+    def start(self):
+        """启动JVM并等待健康检查通过"""
+        cmd = ["java"]
+        if self.jvm_memory:
+            cmd.append(f"-Xmx{self.jvm_memory}")
+        cmd += ["-cp", os.pathsep.join([self.baksmali_path, self.smali_path]), self._source_path()]
+        
+        print("☕ 启动常驻JVM...")
+        self.process = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, encoding='utf-8', bufsize=1
+        )
+        self._responses = queue.Queue()
+        threading.Thread(target=self._pump, args=(self.process.stdout, self._responses.put), daemon=True).start()
+        threading.Thread(target=self._pump, args=(self.process.stderr, self._stderr_tail.append), daemon=True).start()
+        
+        # 首次启动需要编译worker源码，放宽超时
+        if not self.ping(timeout=120):
+            self.close()
+            raise JvmWorkerError("常驻JVM启动失败: " + " | ".join(self._stderr_tail))
+
+    @staticmethod
+    def _pump(stream, sink):
+        for line in stream:
+            sink(line.rstrip('\n'))
+        sink(None)
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def _request(self, *parts, timeout=None):
+        if any('\t' in part or '\n' in part for part in parts):
+            raise JvmWorkerError("参数包含制表符或换行，无法通过行协议发送")
+        if not self.is_alive():
+            raise JvmWorkerError("常驻JVM未运行")
+        try:
+            self.process.stdin.write('\t'.join(parts) + '\n')
+            self.process.stdin.flush()
+            response = self._responses.get(timeout=timeout or self.timeout)
+        except (OSError, queue.Empty) as e:
+            self.close()
+            raise JvmWorkerError(f"常驻JVM无响应: {e}")
+        if response is None:
+            self.close()
+            raise JvmWorkerError("常驻JVM意外退出: " + " | ".join(self._stderr_tail))
+        return response.startswith("OK"), response[3:].strip()
+
+    def ping(self, timeout=10):
+        """健康检查"""
+        try:
+            ok, _ = self._request("PING", timeout=timeout)
+            return ok
+        except JvmWorkerError:
+            return False
+
+    def ensure_alive(self):
+        """健康检查失败时自动重启"""
+        if not self.ping():
+            self.close()
+            self.start()
+
+    def disassemble(self, dex_path, output_dir):
+        return self._request("DISASSEMBLE", os.path.abspath(dex_path), os.path.abspath(output_dir))
+
+    def assemble(self, smali_dir, output_dex):
+        return self._request("ASSEMBLE", os.path.abspath(smali_dir), os.path.abspath(output_dex))
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            if self.process.poll() is None:
+                self.process.stdin.write("QUIT\n")
+                self.process.stdin.flush()
+                self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+        self.process = None
+
+
+class WorkspaceCache:
+    """持久化工作区缓存 - 保存反编译的smali树和重建后的dex
+
+    smali树以 dex的SHA-256 + baksmali版本 为键，重建的dex以 输入dex哈希 +
+    注入/payload规格哈希 为键。总大小超过上限时按最近使用时间(LRU)淘汰。
+    读取时把条目复制到调用方目录，复制期间条目被钉住，其它线程的写入不会将其淘汰；
+    使用时间先记在内存中，随下一次写入或 flush() 批量落盘。
+    """
+
+    _locks = {}     # 缓存目录 -> (锁, 钉住计数)，同一进程内的多个实例共用
+    _locks_guard = threading.Lock()
+
+    def __init__(self, cache_dir=None, max_bytes=2 * 1024 ** 3):
+        self.root = os.path.join(cache_dir or CACHE_ROOT, "workspace")
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(self.root, "index.json")
+        with self._locks_guard:
+            self._lock, self._pins = self._locks.setdefault(
+                os.path.abspath(self.root), (threading.Lock(), collections.Counter()))
+        self._used = {}
+
+    @staticmethod
+    def smali_key(dex_sha256):
+        return hashlib.sha256(f"smali:{dex_sha256}:{os.path.basename(BAKSMALI_URL)}".encode()).hexdigest()
+
+    @staticmethod
+    def dex_key(dex_sha256, spec_sha256):
+        return hashlib.sha256(f"dex:{dex_sha256}:{spec_sha256}:{os.path.basename(SMALI_URL)}".encode()).hexdigest()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _entry_path(self, kind, key):
+        return os.path.join(self.root, kind, key + ('.dex' if kind == 'dex' else ''))
+
+    def _get(self, kind, key, dest):
+        """把条目复制到dest，命中时返回dest，否则返回None"""
+        with self._lock:
+            path = self._entry_path(kind, key)
+            if key not in self._load_index() or not os.path.exists(path):
+                return None
+            self._used[key] = time.time()
+            self._pins[key] += 1
+        try:
+            if kind == 'dex':
+                shutil.copyfile(path, dest)
+            else:
+                shutil.copytree(path, dest, dirs_exist_ok=True)
+            return dest
+        finally:
+            with self._lock:
+                self._pins[key] -= 1
+                if not self._pins[key]:
+                    del self._pins[key]
+
+    def _merge_used(self, index):
+        for key, used in self._used.items():
+            if key in index:
+                index[key]["used"] = max(index[key]["used"], used)
+        self._used.clear()
+
+    def flush(self):
+        """把内存中的使用时间写入索引"""
+        with self._lock:
+            if self._used:
+                index = self._load_index()
+                self._merge_used(index)
+                self._save_index(index)
+
+    def _put(self, kind, key, src_path):
+        path = self._entry_path(kind, key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if kind == 'dex':
+            shutil.copyfile(src_path, tmp_path)
+            size = os.path.getsize(tmp_path)
+        else:
+            shutil.copytree(src_path, tmp_path)
+            size = sum(
+                os.path.getsize(os.path.join(root, name))
+                for root, _, files in os.walk(tmp_path) for name in files
+            )
+        
+        with self._lock:
+            if os.path.exists(path):
+                if kind == 'dex':
+                    os.remove(tmp_path)
+                else:
+                    shutil.rmtree(tmp_path)
+            else:
+                os.replace(tmp_path, path)
+            index = self._load_index()
+            self._merge_used(index)
+            index[key] = {"kind": kind, "size": size, "used": time.time()}
+            self._evict(index, keep=key)
+            self._save_index(index)
+        return path
+
+    def _evict(self, index, keep=None):
+        """按LRU淘汰到上限以内；刚写入的条目和正在被读取的条目不淘汰"""
+        total = sum(entry["size"] for entry in index.values())
+        for key, entry in sorted(index.items(), key=lambda item: item[1]["used"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep or self._pins[key]:
+                continue
+            path = self._entry_path(entry["kind"], key)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+            total -= entry["size"]
+            del index[key]
+            print(f"🧹 缓存淘汰: {entry['kind']}/{key[:12]}")
+
+    def get_smali_tree(self, key, dest):
+        return self._get('smali', key, dest)
+
+    def put_smali_tree(self, key, smali_dir):
+        return self._put('smali', key, smali_dir)
+
+    def get_dex(self, key, dest):
+        return self._get('dex', key, dest)
+
+    def put_dex(self, key, dex_path):
+        return self._put('dex', key, dex_path)
+
+
+class ApkWriter:
+    """流式APK写入器
+
+    未改动的条目按原始压缩数据逐字节复制(不解压不重压)，新增/替换的条目
+    流式压缩写入，内存占用与条目大小无关。不支持ZIP64。
+
+    align=True 时输出等同zipalign -p: resources.arsc 和 lib/*.so 强制不压缩
+    (已压缩的源条目边复制边解压)，不压缩条目的数据按4字节对齐，.so 按页对齐，
+    对齐通过本地头的extra字段填充实现，与写出在同一遍完成。
+    """
+
+    COPY_BUFFER = 1024 * 1024
+    # 必须不压缩存储的条目: 系统直接mmap resources.arsc，.so 可不解压直接从APK加载
+    STORED_ENTRIES = re.compile(r'(resources\.arsc|lib/[^/]+/[^/]+\.so)$')
+    ALIGNMENT = 4
+    PAGE_SIZE = 16 * 1024   # 16 KiB页对齐同时满足4 KiB页设备
+    ALIGNMENT_EXTRA_ID = 0xd935     # 与apksigner相同的对齐extra字段
+
+    def __init__(self, output_path, tee=None, align=True, page_size=PAGE_SIZE):
+        """tee: 可选回调，按顺序接收条目区写出的全部字节 (用于边写边算v2摘要);
+        align: 按zipalign规则存储并对齐条目; page_size: .so 的对齐字节数 (4096或16384)
+        """
+        self.fp = open(output_path, 'wb')
+        self.central_records = []
+        self.tee = tee
+        self.align = align
+        self.page_size = page_size
+
+    def _write(self, data):
+        self.fp.write(data)
+        if self.tee:
+            self.tee(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.fp.close()
+
+    @staticmethod
+    def _encode_name(info):
+        if info.flag_bits & 0x800:
+            return info.filename.encode('utf-8'), info.flag_bits
+        try:
+            return info.filename.encode('ascii'), info.flag_bits
+        except UnicodeEncodeError:
+            return info.filename.encode('utf-8'), info.flag_bits | 0x800
+
+    @staticmethod
+    def _dos_datetime(date_time):
+        year, month, day, hour, minute, second = date_time
+        dos_date = (max(year, 1980) - 1980) << 9 | month << 5 | day
+        dos_time = hour << 11 | minute << 5 | (second // 2)
+        return dos_time, dos_date
+
+    def _copy_bytes(self, src, length):
+        while length > 0:
+            chunk = src.read(min(self.COPY_BUFFER, length))
+            if not chunk:
+                raise ValueError("源APK数据被截断")
+            self._write(chunk)
+            length -= len(chunk)
+
+    def compress_type_for(self, arcname, compress_type):
+        """按存储策略决定条目的压缩方式"""
+        if self.align and self.STORED_ENTRIES.match(arcname):
+            return zipfile.ZIP_STORED
+        return compress_type
+
+    def _alignment(self, info):
+        if not self.align or info.compress_type != zipfile.ZIP_STORED:
+            return 1
+        return self.page_size if info.filename.endswith('.so') else self.ALIGNMENT
+
+    def _aligned_extra(self, info, name, local_extra):
+        """去掉旧的对齐填充，再补上使数据起点对齐所需的extra字段"""
+        fields = bytearray()
+        pos = 0
+        while pos + 4 <= len(local_extra):
+            field_id, size = struct.unpack_from('<HH', local_extra, pos)
+            end = pos + 4 + size
+            if end > len(local_extra):
+                break   # zipalign留下的零填充等不完整字段
+            if field_id not in (0, self.ALIGNMENT_EXTRA_ID):
+                fields += local_extra[pos:end]
+            pos = end
+        alignment = self._alignment(info)
+        if alignment == 1:
+            return bytes(fields)
+        data_start = self.fp.tell() + 30 + len(name) + len(fields) + 6
+        padding = -data_start % alignment
+        return bytes(fields) + struct.pack('<HHH', self.ALIGNMENT_EXTRA_ID, 2 + padding, alignment) + bytes(padding)
+
+    def _write_local_header(self, info, name, flags, local_extra):
+        if self.align:
+            local_extra = self._aligned_extra(info, name, local_extra)
+        dos_time, dos_date = self._dos_datetime(info.date_time)
+        self._write(struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, info.extract_version, flags, info.compress_type,
+            dos_time, dos_date, info.CRC, info.compress_size, info.file_size,
+            len(name), len(local_extra)
+        ) + name + local_extra)
+
+    def _add_central_record(self, info, name, flags, header_offset):
+        if max(info.compress_size, info.file_size, header_offset) >= 0xFFFFFFFF:
+            raise ValueError(f"条目过大，不支持ZIP64: {info.filename}")
+        self.central_records.append((info, name, flags, header_offset))
+
+    def copy_entry(self, src, info):
+        """从源APK原样复制一个条目 (src为源文件句柄, info为其ZipInfo)"""
+        src.seek(info.header_offset)
+        header = src.read(30)
+        if header[:4] != b'PK\x03\x04':
+            raise ValueError(f"本地文件头损坏: {info.filename}")
+        name_len, extra_len = struct.unpack('<HH', header[26:30])
+        src.seek(name_len, os.SEEK_CUR)
+        local_extra = src.read(extra_len)
+
+        inflate = (info.compress_type == zipfile.ZIP_DEFLATED and
+                   self.compress_type_for(info.filename, info.compress_type) == zipfile.ZIP_STORED)
+        if inflate:
+            source_size = info.compress_size
+            info = copy.copy(info)
+            info.compress_type = zipfile.ZIP_STORED
+            info.compress_size = info.file_size
+            info.extract_version = 10
+
+        name, flags = self._encode_name(info)
+        flags &= ~0x08  # 大小已写入本地头，不再需要数据描述符
+        header_offset = self.fp.tell()
+        self._add_central_record(info, name, flags, header_offset)
+        self._write_local_header(info, name, flags, local_extra)
+        if inflate:
+            self._inflate_bytes(src, source_size, info)
+        else:
+            self._copy_bytes(src, info.compress_size)
+
+    def _inflate_bytes(self, src, length, info):
+        """边读边解压一个deflate条目，按不压缩数据写出"""
+        decompressor = zlib.decompressobj(-15)
+        written = 0
+        while length > 0:
+            chunk = src.read(min(self.COPY_BUFFER, length))
+            if not chunk:
+                raise ValueError("源APK数据被截断")
+            length -= len(chunk)
+            data = decompressor.decompress(chunk)
+            written += len(data)
+            self._write(data)
+        data = decompressor.flush()
+        written += len(data)
+        self._write(data)
+        if written != info.file_size:
+            raise ValueError(f"解压后大小不符: {info.filename}")
+
+    @staticmethod
+    def _new_info(arcname, compress_type, date_time, template=None):
+        if template is not None:
+            info = zipfile.ZipInfo(arcname, date_time=template.date_time)
+            info.external_attr = template.external_attr
+            info.create_system = template.create_system
+        else:
+            info = zipfile.ZipInfo(arcname, date_time=date_time)
+            info.external_attr = 0o644 << 16
+        info.compress_type = compress_type
+        info.extract_version = 20 if compress_type == zipfile.ZIP_DEFLATED else 10
+        return info
+
+    def write_bytes(self, arcname, data, compress_type=zipfile.ZIP_DEFLATED):
+        """写入内存中的小条目 (无需回填本地头)"""
+        compress_type = self.compress_type_for(arcname, compress_type)
+        info = self._new_info(arcname, compress_type, time.localtime()[:6])
+        info.file_size = len(data)
+        info.CRC = zlib.crc32(data)
+        if compress_type == zipfile.ZIP_DEFLATED:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            data = compressor.compress(data) + compressor.flush()
+        info.compress_size = len(data)
+
+        name, flags = self._encode_name(info)
+        header_offset = self.fp.tell()
+        self._add_central_record(info, name, flags, header_offset)
+        self._write_local_header(info, name, flags, b'')
+        self._write(data)
+
+    def write_file(self, arcname, path, compress_type=zipfile.ZIP_DEFLATED, template=None):
+        """流式写入一个新条目；template为被替换条目的ZipInfo，用于保留时间戳和属性"""
+        if self.tee:
+            raise ValueError("tee模式下不能回填本地头，请使用write_bytes")
+        compress_type = self.compress_type_for(arcname, compress_type)
+        info = self._new_info(arcname, compress_type, time.localtime(os.path.getmtime(path))[:6], template)
+        info.file_size = os.path.getsize(path)
+        info.compress_size = 0
+        info.CRC = 0
+
+        name, flags = self._encode_name(info)
+        header_offset = self.fp.tell()
+        self._write_local_header(info, name, flags, b'')
+
+        crc = 0
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15) if compress_type == zipfile.ZIP_DEFLATED else None
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.COPY_BUFFER), b''):
+                crc = zlib.crc32(chunk, crc)
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                info.compress_size += len(chunk)
+                self.fp.write(chunk)
+        if compressor:
+            tail = compressor.flush()
+            info.compress_size += len(tail)
+            self.fp.write(tail)
+        info.CRC = crc
+
+        # 回填CRC与大小
+        end = self.fp.tell()
+        self.fp.seek(header_offset + 14)
+        self.fp.write(struct.pack('<III', info.CRC, info.compress_size, info.file_size))
+        self.fp.seek(end)
+        self._add_central_record(info, name, flags, header_offset)
+
+    def close(self):
+        """写入中央目录与EOCD"""
+        cd_offset = self.fp.tell()
+        for info, name, flags, header_offset in self.central_records:
+            dos_time, dos_date = self._dos_datetime(info.date_time)
+            extra = info.extra or b''
+            comment = info.comment or b''
+            self.fp.write(struct.pack(
+                '<IHHHHHHIIIHHHHHII', 0x02014b50,
+                info.create_version | info.create_system << 8, info.extract_version,
+                flags, info.compress_type, dos_time, dos_date, info.CRC,
+                info.compress_size, info.file_size, len(name), len(extra), len(comment),
+                0, info.internal_attr, info.external_attr, header_offset
+            ))
+            self.fp.write(name)
+            self.fp.write(extra)
+            self.fp.write(comment)
+        cd_size = self.fp.tell() - cd_offset
+        count = len(self.central_records)
+        if count > 0xFFFF or cd_offset >= 0xFFFFFFFF:
+            raise ValueError("条目过多或APK过大，不支持ZIP64")
+        self.fp.write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, count, count, cd_size, cd_offset, 0))
+        self.fp.close()
+
+
+def repack_apk(apk_path, output_apk, replacements=None, additions=None, page_size=ApkWriter.PAGE_SIZE):
+    """重新打包APK: replacements {条目名: 文件} 替换已有条目(保留原压缩方式)，
+    additions [(条目名, 文件)] 追加新条目，其余条目原样复制；
+    输出按zipalign规则对齐，.so 按page_size对齐
+    """
+    replacements = dict(replacements or {})
+    with zipfile.ZipFile(apk_path, 'r') as original_zip, open(apk_path, 'rb') as src:
+        with ApkWriter(output_apk, page_size=page_size) as writer:
+            for info in original_zip.infolist():
+                if info.filename in replacements:
+                    writer.write_file(info.filename, replacements.pop(info.filename),
+                                      info.compress_type, template=info)
+                else:
+                    writer.copy_entry(src, info)
+            for arcname, path in list(replacements.items()) + list(additions or []):
+                writer.write_file(arcname, path)
+
+
+def _der(tag, content):
+    """DER编码: tag + 长度 + 内容"""
+    length = len(content)
+    if length < 0x80:
+        header = bytes([length])
+    else:
+        size = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+        header = bytes([0x80 | len(size)]) + size
+    return bytes([tag]) + header + content
+
+
+def _der_int(value):
+    return _der(0x02, value.to_bytes(value.bit_length() // 8 + 1, 'big'))
+
+
+def _der_seq(*items):
+    return _der(0x30, b''.join(items))
+
+
+def _der_oid(dotted):
+    parts = [int(part) for part in dotted.split('.')]
+    body = bytearray([parts[0] * 40 + parts[1]])
+    for part in parts[2:]:
+        encoded = [part & 0x7f]
+        part >>= 7
+        while part:
+            encoded.append(0x80 | (part & 0x7f))
+            part >>= 7
+        body.extend(reversed(encoded))
+    return _der(0x06, bytes(body))
+
+
+def _der_read(data, offset=0):
+    """读取一个DER元素，返回 (tag, 内容, 下一个偏移)"""
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        size = length & 0x7f
+        length = int.from_bytes(data[offset:offset + size], 'big')
+        offset += size
+    return tag, data[offset:offset + length], offset + length
+
+
+def _der_time(timestamp):
+    """2050年前用UTCTime，之后用GeneralizedTime (RFC 5280)"""
+    moment = time.gmtime(timestamp)
+    if moment.tm_year < 2050:
+        return _der(0x17, time.strftime('%y%m%d%H%M%SZ', moment).encode())
+    return _der(0x18, time.strftime('%Y%m%d%H%M%SZ', moment).encode())
+
+
+def _pem(label, der):
+    body = base64.encodebytes(der).decode().replace('\n', '')
+    lines = [body[i:i + 64] for i in range(0, len(body), 64)]
+    return f"-----BEGIN {label}-----\n" + '\n'.join(lines) + f"\n-----END {label}-----\n"
+
+
+def _pem_blocks(text):
+    return {
+        label: base64.b64decode(''.join(body.split()))
+        for label, body in re.findall(r'-----BEGIN ([A-Z ]+)-----(.*?)-----END \1-----', text, re.S)
+    }
+
+
+OID_RSA_ENCRYPTION = '1.2.840.113549.1.1.1'
+OID_SHA256_WITH_RSA = '1.2.840.113549.1.1.11'
+OID_SHA256 = '2.16.840.1.101.3.4.2.1'
+OID_PKCS7_DATA = '1.2.840.113549.1.7.1'
+OID_PKCS7_SIGNED_DATA = '1.2.840.113549.1.7.2'
+SHA256_DIGEST_INFO = bytes.fromhex('3031300d060960864801650304020105000420')
+
+
+def _is_probable_prime(n, rounds=40):
+    """Miller-Rabin素性测试"""
+    for p in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        if n % p == 0:
+            return n == p
+    d, r = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        r += 1
+    for _ in range(rounds):
+        x = pow(secrets.randbelow(n - 3) + 2, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(r - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def _random_prime(bits):
+    while True:
+        # 最高两位置1保证 p*q 恰好为 2*bits 位
+        candidate = secrets.randbits(bits) | (3 << (bits - 2)) | 1
+        if _is_probable_prime(candidate):
+            return candidate
+
+
+class DebugSigningKey:
+    """调试签名密钥 - RSA 2048 + 自签名证书，以PEM保存，纯Python生成，无需keytool"""
+
+    def __init__(self, n, e, d, p, q, certificate):
+        self.n, self.e, self.d, self.p, self.q = n, e, d, p, q
+        self.certificate = certificate
+
+    @classmethod
+    def generate(cls, common_name="Android Debug", bits=2048, validity_days=10000):
+        e = 65537
+        while True:
+            p, q = _random_prime(bits // 2), _random_prime(bits // 2)
+            phi = (p - 1) * (q - 1)
+            if p != q and phi % e:
+                break
+        key = cls(p * q, e, pow(e, -1, phi), p, q, None)
+        key.certificate = key._self_signed_certificate(common_name, validity_days)
+        return key
+
+    @classmethod
+    def load_or_create(cls, path):
+        if os.path.exists(path):
+            return cls.load(path)
+        print("🔑 生成调试签名密钥...")
+        key = cls.generate()
+        key.save(path)
+        return key
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='ascii') as f:
+            blocks = _pem_blocks(f.read())
+        _, body, _ = _der_read(blocks["RSA PRIVATE KEY"])
+        values = []
+        offset = 0
+        while offset < len(body):
+            _, content, offset = _der_read(body, offset)
+            values.append(int.from_bytes(content, 'big'))
+        _, n, e, d, p, q = values[:6]
+        return cls(n, e, d, p, q, blocks["CERTIFICATE"])
+
+    def save(self, path):
+        dp, dq = self.d % (self.p - 1), self.d % (self.q - 1)
+        private_key = _der_seq(*(_der_int(value) for value in (
+            0, self.n, self.e, self.d, self.p, self.q, dp, dq, pow(self.q, -1, self.p)
+        )))
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, 'w', encoding='ascii') as f:
+            f.write(_pem("RSA PRIVATE KEY", private_key))
+            f.write(_pem("CERTIFICATE", self.certificate))
+        os.replace(tmp_path, path)
+
+    def public_key_info(self):
+        """SubjectPublicKeyInfo DER"""
+        return _der_seq(
+            _der_seq(_der_oid(OID_RSA_ENCRYPTION), _der(0x05, b'')),
+            _der(0x03, b'\x00' + _der_seq(_der_int(self.n), _der_int(self.e)))
+        )
+
+    def sign(self, data):
+        """RSASSA-PKCS1-v1_5 + SHA-256 (CRT加速)"""
+        size = (self.n.bit_length() + 7) // 8
+        digest_info = SHA256_DIGEST_INFO + hashlib.sha256(data).digest()
+        encoded = b'\x00\x01' + b'\xff' * (size - len(digest_info) - 3) + b'\x00' + digest_info
+        m = int.from_bytes(encoded, 'big')
+        s1 = pow(m, self.d % (self.p - 1), self.p)
+        s2 = pow(m, self.d % (self.q - 1), self.q)
+        s = s2 + self.q * ((pow(self.q, -1, self.p) * (s1 - s2)) % self.p)
+        return s.to_bytes(size, 'big')
+
+    def _self_signed_certificate(self, common_name, validity_days):
+        name = _der_seq(
+            _der(0x31, _der_seq(_der_oid('2.5.4.3'), _der(0x0c, common_name.encode()))),
+            _der(0x31, _der_seq(_der_oid('2.5.4.10'), _der(0x0c, b'Android'))),
+            _der(0x31, _der_seq(_der_oid('2.5.4.6'), _der(0x13, b'US'))),
+        )
+        algorithm = _der_seq(_der_oid(OID_SHA256_WITH_RSA), _der(0x05, b''))
+        now = int(time.time())
+        tbs = _der_seq(
+            _der(0xa0, _der_int(2)),
+            _der_int(secrets.randbits(63) | 1),
+            algorithm,
+            name,
+            _der_seq(_der_time(now), _der_time(now + validity_days * 86400)),
+            name,
+            self.public_key_info(),
+        )
+        return _der_seq(tbs, algorithm, _der(0x03, b'\x00' + self.sign(tbs)))
+
+    def issuer_and_serial(self):
+        """从证书中取出 issuer Name 与序列号 (PKCS#7 SignerInfo需要)"""
+        _, cert_body, _ = _der_read(self.certificate)
+        _, tbs_body, _ = _der_read(cert_body)
+        offset = 0
+        _, _, offset = _der_read(tbs_body, offset)            # version
+        serial_start = offset
+        _, _, offset = _der_read(tbs_body, offset)            # serialNumber
+        serial = tbs_body[serial_start:offset]
+        _, _, offset = _der_read(tbs_body, offset)            # signature
+        issuer_start = offset
+        _, _, offset = _der_read(tbs_body, offset)            # issuer
+        return tbs_body[issuer_start:offset], serial
+
+
+class ChunkDigester:
+    """APK v2 分块摘要 - 按1MB切块，在线程池中并行计算 SHA-256(0xa5 | 长度 | 块)"""
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, executor, max_pending=16):
+        self.executor = executor
+        self.max_pending = max_pending
+        self.futures = []
+        self.buffer = bytearray()
+
+    @staticmethod
+    def chunk_digest(chunk):
+        digest = hashlib.sha256(b'\xa5' + struct.pack('<I', len(chunk)))
+        digest.update(chunk)
+        return digest.digest()
+
+    def _submit(self, chunk):
+        # 限制在途块数量，保证内存有界
+        if len(self.futures) >= self.max_pending:
+            self.futures[-self.max_pending].result()
+        self.futures.append(self.executor.submit(self.chunk_digest, chunk))
+
+    def update(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.CHUNK_SIZE:
+            self._submit(bytes(self.buffer[:self.CHUNK_SIZE]))
+            del self.buffer[:self.CHUNK_SIZE]
+
+    def finish_section(self):
+        """结束当前区段 (块不跨区段)"""
+        if self.buffer:
+            self._submit(bytes(self.buffer))
+            self.buffer = bytearray()
+
+    def digest(self):
+        self.finish_section()
+        top = hashlib.sha256(b'\x5a' + struct.pack('<I', len(self.futures)))
+        for future in self.futures:
+            top.update(future.result())
+        return top.digest()
+
+
+class ApkSigner:
+    """内置APK签名 - v1 (JAR, SHA-256) + APK Signature Scheme v2，无需JVM
+
+    v2分块摘要在重写APK时边写边算(多线程)，写完后只需读回中央目录和EOCD，
+    再把签名块插入中央目录之前。
+    """
+
+    V2_BLOCK_ID = 0x7109871a
+    V2_RSA_PKCS1_SHA256 = 0x0103
+    SIGNATURE_FILE = re.compile(r'META-INF/([^/]+\.(SF|RSA|DSA|EC)|SIG-[^/]*|MANIFEST\.MF)$', re.I)
+
+    def __init__(self, key, threads=None, page_size=ApkWriter.PAGE_SIZE):
+        self.key = key
+        self.threads = threads or min(8, os.cpu_count() or 1)
+        self.page_size = page_size
+
+    @staticmethod
+    def _manifest_line(line):
+        """MANIFEST行超过72字节时折行，续行以空格开头"""
+        data = line.encode('utf-8')
+        if len(data) <= 72:
+            return data + b'\r\n'
+        parts = [data[:72]] + [b' ' + data[i:i + 71] for i in range(72, len(data), 71)]
+        return b'\r\n'.join(parts) + b'\r\n'
+
+    def _entry_digest(self, zip_file, info):
+        digest = hashlib.sha256()
+        with zip_file.open(info) as f:
+            for chunk in iter(lambda: f.read(ApkWriter.COPY_BUFFER), b''):
+                digest.update(chunk)
+        return base64.b64encode(digest.digest()).decode()
+
+    def _v1_files(self, zip_file, entries, executor):
+        """生成 MANIFEST.MF / CERT.SF / CERT.RSA"""
+        files = [info for info in entries if not info.is_dir()]
+        digests = list(executor.map(lambda info: self._entry_digest(zip_file, info), files))
+
+        manifest = bytearray(b'Manifest-Version: 1.0\r\nCreated-By: 1.0 (Android)\r\n\r\n')
+        sections = []
+        for info, entry_digest in zip(files, digests):
+            section = (self._manifest_line(f"Name: {info.filename}") +
+                       self._manifest_line(f"SHA-256-Digest: {entry_digest}") + b'\r\n')
+            sections.append((info.filename, section))
+            manifest += section
+
+        b64 = lambda data: base64.b64encode(hashlib.sha256(data).digest()).decode()
+        signature_file = bytearray(
+            b'Signature-Version: 1.0\r\nCreated-By: 1.0 (Android)\r\n' +
+            self._manifest_line(f"SHA-256-Digest-Manifest: {b64(bytes(manifest))}") +
+            b'X-Android-APK-Signed: 2\r\n\r\n'
+        )
+        for name, section in sections:
+            signature_file += (self._manifest_line(f"Name: {name}") +
+                               self._manifest_line(f"SHA-256-Digest: {b64(section)}") + b'\r\n')
+        return bytes(manifest), bytes(signature_file), self._pkcs7(bytes(signature_file))
+
+    def _pkcs7(self, signed_content):
+        """分离式PKCS#7 SignedData (无签名属性)"""
+        sha256 = _der_seq(_der_oid(OID_SHA256), _der(0x05, b''))
+        issuer, serial = self.key.issuer_and_serial()
+        signer_info = _der_seq(
+            _der_int(1),
+            _der_seq(issuer, serial),
+            sha256,
+            _der_seq(_der_oid(OID_RSA_ENCRYPTION), _der(0x05, b'')),
+            _der(0x04, self.key.sign(signed_content)),
+        )
+        signed_data = _der_seq(
+            _der_int(1),
+            _der(0x31, sha256),
+            _der_seq(_der_oid(OID_PKCS7_DATA)),
+            _der(0xa0, self.key.certificate),
+            _der(0x31, signer_info),
+        )
+        return _der_seq(_der_oid(OID_PKCS7_SIGNED_DATA), _der(0xa0, signed_data))
+
+    @staticmethod
+    def _lp(data):
+        return struct.pack('<I', len(data)) + data
+
+    def _v2_block(self, content_digest):
+        lp = self._lp
+        algorithm = struct.pack('<I', self.V2_RSA_PKCS1_SHA256)
+        signed_data = (
+            lp(lp(algorithm + lp(content_digest))) +
+            lp(lp(self.key.certificate)) +
+            lp(b'')
+        )
+        signer = (
+            lp(signed_data) +
+            lp(lp(algorithm + lp(self.key.sign(signed_data)))) +
+            lp(self.key.public_key_info())
+        )
+        value = lp(lp(signer))
+        pair = struct.pack('<QI', len(value) + 4, self.V2_BLOCK_ID) + value
+        size = len(pair) + 8 + 16
+        return struct.pack('<Q', size) + pair + struct.pack('<Q', size) + b'APK Sig Block 42'
+
+    def sign(self, apk_path, output_path=None):
+        """签名APK (默认原地替换)"""
+        output_path = output_path or apk_path
+        tmp_path = output_path + '.signing'
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            with zipfile.ZipFile(apk_path, 'r') as zip_file, open(apk_path, 'rb') as src:
+                # 旧签名文件全部丢弃
+                entries = [info for info in zip_file.infolist()
+                           if not self.SIGNATURE_FILE.match(info.filename)]
+                manifest, signature_file, signature_block = self._v1_files(zip_file, entries, executor)
+
+                digester = ChunkDigester(executor)
+                with ApkWriter(tmp_path, tee=digester.update, page_size=self.page_size) as writer:
+                    writer.write_bytes("META-INF/MANIFEST.MF", manifest)
+                    writer.write_bytes("META-INF/CERT.SF", signature_file)
+                    writer.write_bytes("META-INF/CERT.RSA", signature_block)
+                    for info in entries:
+                        writer.copy_entry(src, info)
+                    writer.tee = None
+                    cd_offset = writer.fp.tell()
+
+            # 只读回中央目录和EOCD (其余区段已在写出时完成摘要)
+            with open(tmp_path, 'r+b') as f:
+                f.seek(cd_offset)
+                tail = f.read()
+                central_directory, eocd = tail[:-22], tail[-22:]
+                digester.finish_section()
+                digester.update(central_directory)
+                digester.finish_section()
+                digester.update(eocd)
+                block = self._v2_block(digester.digest())
+
+                f.seek(cd_offset)
+                f.truncate()
+                f.write(block)
+                f.write(central_directory)
+                f.write(eocd[:16] + struct.pack('<I', cd_offset + len(block)) + eocd[20:])
+        os.replace(tmp_path, output_path)
+        return output_path
+
+
+def class_descriptor(class_name):
+    """Java类名 -> DEX类型描述符 (com.a.B -> Lcom/a/B;)"""
+    if class_name.startswith('L') and class_name.endswith(';'):
+        return class_name
+    return 'L' + class_name.replace('.', '/') + ';'
+
+
+def read_uleb128(data, offset):
+    """读取ULEB128，返回 (值, 新偏移)"""
+    result = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
+
+def read_sleb128(data, offset):
+    """读取SLEB128，返回 (值, 新偏移)"""
+    result = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            if byte & 0x40:
+                result -= 1 << shift
+            return result, offset
+
+
+def write_uleb128(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def write_sleb128(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if (value == 0 and not byte & 0x40) or (value == -1 and byte & 0x40):
+            out.append(byte)
+            return bytes(out)
+        out.append(byte | 0x80)
+
+
+def mutf8_decode(data):
+    """MUTF-8 -> str (增补字符保留为UTF-16代理对)"""
+    return bytes(data).replace(b'\xc0\x80', b'\0').decode('utf-8', 'surrogatepass')
+
+
+def mutf8_encode(text):
+    """str -> MUTF-8 (\\0 编码为 C0 80，增补字符拆成UTF-16代理对分别编码)"""
+    chars = []
+    for ch in text:
+        code = ord(ch)
+        if code > 0xffff:
+            code -= 0x10000
+            chars += [chr(0xd800 + (code >> 10)), chr(0xdc00 + (code & 0x3ff))]
+        else:
+            chars.append(ch)
+    return ''.join(chars).encode('utf-8', 'surrogatepass').replace(b'\0', b'\xc0\x80')
+
+
+def utf16_key(text):
+    """dex字符串的排序键: 按UTF-16码元比较"""
+    return text.encode('utf-16-be', 'surrogatepass')
+
+
+class SmaliIndex:
+    """smali树类索引 - 类描述符(取自每个文件的.class行) -> 相对路径
+
+    在smali树生成后建立一次，保存在树根目录，随树一起缓存复用。
+    """
+
+    FILE_NAME = ".smali_index.json"
+
+    def __init__(self, root, classes=None):
+        self.root = root
+        self.classes = dict(classes or {})
+
+    @staticmethod
+    def read_class_line(path):
+        """读取smali文件的.class声明，返回类描述符"""
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('.class'):
+                    return line.split()[-1]
+                if line and not line.startswith('#'):
+                    return None
+        return None
+
+    @classmethod
+    def build(cls, root):
+        index = cls(root)
+        for dir_path, _, files in os.walk(root):
+            for name in files:
+                if name.endswith('.smali'):
+                    path = os.path.join(dir_path, name)
+                    descriptor = cls.read_class_line(path)
+                    if descriptor:
+                        index.classes[descriptor] = os.path.relpath(path, root)
+        return index
+
+    @classmethod
+    def load(cls, root):
+        try:
+            with open(os.path.join(root, cls.FILE_NAME), 'r', encoding='utf-8') as f:
+                return cls(root, json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def load_or_build(cls, root):
+        index = cls.load(root)
+        if index is None:
+            index = cls.build(root)
+            index.save()
+        return index
+
+    def save(self):
+        with open(os.path.join(self.root, self.FILE_NAME), 'w', encoding='utf-8') as f:
+            json.dump(self.classes, f)
+
+    def update(self, other):
+        """合并另一棵以相同相对布局复制进来的树的索引"""
+        self.classes.update(other.classes)
+
+    def find(self, class_name):
+        rel_path = self.classes.get(class_descriptor(class_name))
+        return os.path.join(self.root, rel_path) if rel_path else None
+
+
+class InjectionSpec:
+    """一处注入: 目标类、方法、代码与位置
+
+    method: 完整签名 "onCreate(Landroid/os/Bundle;)V" 精确匹配，或仅方法名(匹配所有重载)
+    position: "start" 第一条指令前; "before"/"after" 第一条匹配anchor(正则)的指令前/后;
+              "return" 每条return指令前
+    """
+
+    POSITIONS = ("start", "before", "after", "return")
+
+    def __init__(self, target_class, method, code, position="start", anchor=None):
+        if position not in self.POSITIONS:
+            raise ValueError(f"未知注入位置: {position}")
+        if position in ("before", "after") and not anchor:
+            raise ValueError(f"注入位置 {position} 需要anchor")
+        self.target_class = target_class
+        self.method = method
+        self.code = code
+        self.position = position
+        self.anchor = anchor
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["target_class"], data.get("method", "onCreate"), data["code"],
+                   data.get("position", "start"), data.get("anchor"))
+
+    def to_dict(self):
+        return {
+            "target_class": self.target_class, "method": self.method, "code": self.code,
+            "position": self.position, "anchor": self.anchor,
+        }
+
+    def code_lines(self):
+        return [line.strip() for line in self.code.split('\n') if line.strip()]
+
+
+class SmaliMethod:
+    """smali方法: 签名及其在文件中的行范围"""
+
+    def __init__(self, signature, start, end, body_start):
+        self.signature = signature
+        self.name = signature.split('(', 1)[0]
+        self.start = start              # .method 行
+        self.end = end                  # .end method 行
+        self.body_start = body_start    # 第一条指令(或标签)所在行
+
+    def matches(self, selector):
+        return self.signature == selector if '(' in selector else self.name == selector
+
+
+class SmaliClass:
+    """解析后的smali文件 - 一次解析，累积多处插入，最后一次性写回"""
+
+    def __init__(self, path, lines):
+        self.path = path
+        self.lines = lines
+        self._inserts = collections.defaultdict(list)
+        self._parse()
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            return cls(path, f.read().split('\n'))
+
+    def _parse(self):
+        self.descriptor = None
+        self.methods = []
+        method_start = None
+        body_start = None
+        annotation_depth = 0
+        for i, line in enumerate(self.lines):
+            stripped = line.strip()
+            if stripped.startswith('.class') and self.descriptor is None:
+                self.descriptor = stripped.split()[-1]
+            elif stripped.startswith('.method'):
+                method_start, body_start, annotation_depth = i, None, 0
+            elif stripped.startswith('.end method') and method_start is not None:
+                signature = self.lines[method_start].split()[-1]
+                self.methods.append(SmaliMethod(signature, method_start, i, body_start or i))
+                method_start = None
+            elif method_start is not None and body_start is None:
+                # 跳过.registers/.param/.annotation等声明，定位第一条指令
+                if stripped.startswith(('.annotation', '.subannotation')):
+                    annotation_depth += 1
+                elif stripped.startswith(('.end annotation', '.end subannotation')):
+                    annotation_depth -= 1
+                elif annotation_depth == 0 and stripped and not stripped.startswith(('.', '#')):
+                    body_start = i
+
+    def find_methods(self, selector):
+        return [method for method in self.methods if method.matches(selector)]
+
+    def _instruction_lines(self, method):
+        for i in range(method.body_start, method.end):
+            stripped = self.lines[i].strip()
+            if stripped and not stripped.startswith('#'):
+                yield i, stripped
+
+    def plan(self, method, spec):
+        """登记一处注入，返回插入位置(行号)列表"""
+        if spec.position == "start":
+            targets = [method.body_start]
+        elif spec.position == "return":
+            targets = [i for i, stripped in self._instruction_lines(method)
+                       if stripped.startswith('return')]
+        else:
+            pattern = re.compile(spec.anchor)
+            targets = [i for i, stripped in self._instruction_lines(method) if pattern.search(stripped)][:1]
+            if spec.position == "after":
+                targets = [i + 1 for i in targets]
+        
+        indented = ['    ' + line for line in spec.code_lines()]
+        for target in targets:
+            self._inserts[target].extend(indented)
+        return targets
+
+    def save(self):
+        """一次性写回所有插入，无改动时不写文件"""
+        if not self._inserts:
+            return False
+        new_lines = []
+        for i, line in enumerate(self.lines):
+            new_lines.extend(self._inserts.get(i, ()))
+            new_lines.append(line)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(new_lines))
+        self.lines = new_lines
+        self._inserts.clear()
+        self._parse()
+        return True
+
+
+class DexClassIndex:
+    """纯Python DEX类索引 - 直接读取header/string_ids/type_ids/class_defs
+
+    通过mmap定位每个dex中定义的类，不需要启动JVM。
+    """
+
+    def __init__(self):
+        self.class_to_dex = {}
+
+    @staticmethod
+    def read_class_descriptors(dex_path):
+        """返回dex中定义的全部类描述符"""
+        with open(dex_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[:4] != b'dex\n':
+                    raise ValueError(f"不是有效的dex文件: {dex_path}")
+                (string_ids_size, string_ids_off,
+                 type_ids_size, type_ids_off) = struct.unpack_from('<4I', mm, 0x38)
+                class_defs_size, class_defs_off = struct.unpack_from('<2I', mm, 0x60)
+
+                descriptors = []
+                for i in range(class_defs_size):
+                    class_idx, = struct.unpack_from('<I', mm, class_defs_off + i * 32)
+                    if class_idx >= type_ids_size:
+                        raise ValueError(f"class_idx越界: {class_idx}")
+                    string_idx, = struct.unpack_from('<I', mm, type_ids_off + class_idx * 4)
+                    if string_idx >= string_ids_size:
+                        raise ValueError(f"descriptor_idx越界: {string_idx}")
+                    data_off, = struct.unpack_from('<I', mm, string_ids_off + string_idx * 4)
+                    # string_data_item: uleb128 utf16长度 + MUTF-8字节 + '\0'
+                    _, start = read_uleb128(mm, data_off)
+                    end = mm.find(b'\0', start)
+                    descriptors.append(mm[start:end].decode('utf-8', errors='replace'))
+                return descriptors
+
+    def add_dex(self, dex_name, dex_path):
+        """索引单个dex，返回其中定义的类数量"""
+        descriptors = self.read_class_descriptors(dex_path)
+        for descriptor in descriptors:
+            self.class_to_dex.setdefault(descriptor, []).append(dex_name)
+        return len(descriptors)
+
+    def find(self, class_name):
+        """返回定义了该类的dex名称列表"""
+        return list(self.class_to_dex.get(class_descriptor(class_name), []))
+
+
+class DexRewriteError(Exception):
+    """原地改写dex遇到不支持的情况，调用方应回退到smali流程"""
+
+
+def _dex_opcode_table():
+    """操作码 -> (格式, 引用类型)"""
+    table = [("10x", None)] * 256
+    ranges = [
+        (0x01, 0x01, "12x", None), (0x02, 0x02, "22x", None), (0x03, 0x03, "32x", None),
+        (0x04, 0x04, "12x", None), (0x05, 0x05, "22x", None), (0x06, 0x06, "32x", None),
+        (0x07, 0x07, "12x", None), (0x08, 0x08, "22x", None), (0x09, 0x09, "32x", None),
+        (0x0a, 0x0d, "11x", None), (0x0f, 0x11, "11x", None),
+        (0x12, 0x12, "11n", None), (0x13, 0x13, "21s", None), (0x14, 0x14, "31i", None), (0x15, 0x15, "21h", None),
+        (0x16, 0x16, "21s", None), (0x17, 0x17, "31i", None), (0x18, 0x18, "51l", None), (0x19, 0x19, "21h", None),
+        (0x1a, 0x1a, "21c", "string"), (0x1b, 0x1b, "31c", "string"), (0x1c, 0x1c, "21c", "type"),
+        (0x1d, 0x1e, "11x", None), (0x1f, 0x1f, "21c", "type"), (0x20, 0x20, "22c", "type"),
+        (0x21, 0x21, "12x", None), (0x22, 0x22, "21c", "type"), (0x23, 0x23, "22c", "type"),
+        (0x24, 0x24, "35c", "type"), (0x25, 0x25, "3rc", "type"), (0x26, 0x26, "31t", None),
+        (0x27, 0x27, "11x", None), (0x28, 0x28, "10t", None), (0x29, 0x29, "20t", None), (0x2a, 0x2a, "30t", None),
+        (0x2b, 0x2c, "31t", None), (0x2d, 0x31, "23x", None), (0x32, 0x37, "22t", None), (0x38, 0x3d, "21t", None),
+        (0x44, 0x51, "23x", None), (0x52, 0x5f, "22c", "field"), (0x60, 0x6d, "21c", "field"),
+        (0x6e, 0x72, "35c", "method"), (0x74, 0x78, "3rc", "method"),
+        (0x7b, 0x8f, "12x", None), (0x90, 0xaf, "23x", None), (0xb0, 0xcf, "12x", None),
+        (0xd0, 0xd7, "22s", None), (0xd8, 0xe2, "22b", None),
+        (0xfa, 0xfa, "45cc", "method"), (0xfb, 0xfb, "4rcc", "method"),
+        (0xfc, 0xfc, "35c", "call_site"), (0xfd, 0xfd, "3rc", "call_site"),
+        (0xfe, 0xfe, "21c", "method_handle"), (0xff, 0xff, "21c", "proto"),
+    ]
+    for first, last, fmt, ref in ranges:
+        for opcode in range(first, last + 1):
+            table[opcode] = (fmt, ref)
+    return table
+
+
+DEX_OPCODES = _dex_opcode_table()
+DEX_OPCODE_UNITS = [int(fmt[0]) for fmt, _ in DEX_OPCODES]
+# 操作寄存器对的指令 (move-wide*, move-result-wide, iget/iput/sget/sput-wide)
+DEX_WIDE_OPCODES = {0x04, 0x05, 0x06, 0x0b, 0x53, 0x5a, 0x61, 0x68}
+
+
+def _dex_mnemonics():
+    """原地改写支持的smali指令子集: 助记符 -> 操作码"""
+    mnemonics = {
+        "nop": 0x00, "move": 0x01, "move/from16": 0x02, "move/16": 0x03,
+        "move-wide": 0x04, "move-wide/from16": 0x05, "move-wide/16": 0x06,
+        "move-object": 0x07, "move-object/from16": 0x08, "move-object/16": 0x09,
+        "move-result": 0x0a, "move-result-wide": 0x0b, "move-result-object": 0x0c,
+        "const/4": 0x12, "const/16": 0x13, "const": 0x14, "const/high16": 0x15,
+        "const-string": 0x1a, "const-string/jumbo": 0x1b, "const-class": 0x1c,
+        "check-cast": 0x1f, "instance-of": 0x20, "new-instance": 0x22, "new-array": 0x23,
+    }
+    for i, suffix in enumerate(("", "-wide", "-object", "-boolean", "-byte", "-char", "-short")):
+        mnemonics["iget" + suffix] = 0x52 + i
+        mnemonics["iput" + suffix] = 0x59 + i
+        mnemonics["sget" + suffix] = 0x60 + i
+        mnemonics["sput" + suffix] = 0x67 + i
+    for i, kind in enumerate(("virtual", "super", "direct", "static", "interface")):
+        mnemonics["invoke-" + kind] = 0x6e + i
+        mnemonics[f"invoke-{kind}/range"] = 0x74 + i
+    return mnemonics
+
+
+DEX_MNEMONICS = _dex_mnemonics()
+
+
+def split_descriptors(text):
+    """"ILjava/lang/String;[J" -> ["I", "Ljava/lang/String;", "[J"]"""
+    descriptors = []
+    i = 0
+    while i < len(text):
+        j = i
+        while text[j] == '[':
+            j += 1
+        if text[j] == 'L':
+            j = text.index(';', j)
+        descriptors.append(text[i:j + 1])
+        i = j + 1
+    return descriptors
+
+
+def shorty_descriptor(return_type, parameters):
+    return ''.join('L' if descriptor[0] in 'L[' else descriptor[0]
+                   for descriptor in (return_type,) + tuple(parameters))
+
+
+def _smali_unescape(text):
+    escapes = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+    def replace(match):
+        escape = match.group(1)
+        return chr(int(escape[1:], 16)) if escape[0] == 'u' else escapes[escape]
+    return re.sub(r'\\(u[0-9a-fA-F]{4}|.)', replace, text)
+
+
+class DexFile:
+    """纯Python dex改写 - 在方法开头插入指令，不经过baksmali/smali
+
+    解析id表和map_list登记的全部数据项；注入代码需要的 string/type/proto/method id 不存在时按排序规则插入，
+    全部引用按新编号重写，整体重新布局后重算偏移、map_list、SHA-1签名和Adler-32校验和。
+    局部寄存器不够时增加寄存器，并在注入代码之后把参数移回原来的寄存器，原有指令不需要改动。
+    只支持 position="start" 和常用指令子集 (无跳转)，其余情况抛出 DexRewriteError。
+    """
+
+    HEADER_SIZE = 0x70
+    NO_INDEX = 0xffffffff
+    ACC_STATIC = 0x8
+
+    TYPE_HEADER = 0x0000
+    TYPE_STRING_ID = 0x0001
+    TYPE_TYPE_ID = 0x0002
+    TYPE_PROTO_ID = 0x0003
+    TYPE_FIELD_ID = 0x0004
+    TYPE_METHOD_ID = 0x0005
+    TYPE_CLASS_DEF = 0x0006
+    TYPE_CALL_SITE_ID = 0x0007
+    TYPE_METHOD_HANDLE = 0x0008
+    TYPE_MAP_LIST = 0x1000
+    TYPE_TYPE_LIST = 0x1001
+    TYPE_ANNOTATION_SET_REF_LIST = 0x1002
+    TYPE_ANNOTATION_SET = 0x1003
+    TYPE_CLASS_DATA = 0x2000
+    TYPE_CODE = 0x2001
+    TYPE_STRING_DATA = 0x2002
+    TYPE_DEBUG_INFO = 0x2003
+    TYPE_ANNOTATION = 0x2004
+    TYPE_ENCODED_ARRAY = 0x2005
+    TYPE_ANNOTATIONS_DIRECTORY = 0x2006
+    TYPE_HIDDENAPI = 0xf000
+
+    ID_FORMATS = {
+        TYPE_STRING_ID: '<I', TYPE_TYPE_ID: '<I', TYPE_PROTO_ID: '<3I', TYPE_FIELD_ID: '<HHI',
+        TYPE_METHOD_ID: '<HHI', TYPE_CLASS_DEF: '<8I', TYPE_CALL_SITE_ID: '<I', TYPE_METHOD_HANDLE: '<4H',
+    }
+    # 按字节对齐的数据项，其余(含id表)按4字节对齐
+    BYTE_ALIGNED = {TYPE_CLASS_DATA, TYPE_STRING_DATA, TYPE_DEBUG_INFO, TYPE_ANNOTATION, TYPE_ENCODED_ARRAY}
+    # 头部中各id表的 (大小, 偏移) 字段位置
+    HEADER_FIELDS = {TYPE_STRING_ID: 0x38, TYPE_TYPE_ID: 0x40, TYPE_PROTO_ID: 0x48, TYPE_FIELD_ID: 0x50,
+                     TYPE_METHOD_ID: 0x58, TYPE_CLASS_DEF: 0x60}
+    # 调试信息操作码 -> LEB128参数个数
+    DEBUG_ARGS = {0x01: 1, 0x02: 1, 0x03: 3, 0x04: 4, 0x05: 1, 0x06: 1, 0x09: 1}
+
+    def __init__(self, data):
+        self.data = data = bytes(data)
+        if data[:4] != b'dex\n' or len(data) < self.HEADER_SIZE:
+            raise DexRewriteError("不是有效的dex文件")
+        if not b'035' <= data[4:7] <= b'040':
+            raise DexRewriteError(f"不支持的dex版本: {data[4:7].decode(errors='replace')}")
+        header_size, endian_tag, link_size, _, map_off = struct.unpack_from('<5I', data, 0x24)
+        if header_size != self.HEADER_SIZE or endian_tag != 0x12345678 or link_size:
+            raise DexRewriteError("不支持的dex头 (非标准大小/字节序或含link段)")
+
+        count, = struct.unpack_from('<I', data, map_off)
+        self.map = sorted((struct.unpack_from('<HxxII', data, map_off + 4 + i * 12) for i in range(count)),
+                          key=lambda entry: entry[2])
+        self.ids = {type_: [] for type_ in self.ID_FORMATS}
+        self.items = {}     # 数据项类型 -> [(起始偏移, 结束偏移)]
+        for type_, size, offset in self.map:
+            if type_ in self.ID_FORMATS:
+                fmt = self.ID_FORMATS[type_]
+                self.ids[type_] = list(struct.iter_unpack(fmt, data[offset:offset + size * struct.calcsize(fmt)]))
+            elif type_ not in (self.TYPE_HEADER, self.TYPE_MAP_LIST):
+                self.items[type_] = self._parse_items(type_, size, offset)
+        self.string_ids = [offset for offset, in self.ids[self.TYPE_STRING_ID]]
+        self.type_ids = [index for index, in self.ids[self.TYPE_TYPE_ID]]
+
+        self._injections = collections.OrderedDict()   # code_item偏移 -> (方法信息, 指令列表)
+        self._refs = set()
+        self._next_key = -1
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+    # ---- 解析 ----
+
+    def _skip_leb(self, pos):
+        data = self.data
+        while data[pos] & 0x80:
+            pos += 1
+        return pos + 1
+
+    def _parse_items(self, type_, count, offset):
+        item_end = {
+            self.TYPE_TYPE_LIST: lambda pos: pos + 4 + 2 * struct.unpack_from('<I', self.data, pos)[0],
+            self.TYPE_ANNOTATION_SET_REF_LIST: lambda pos: pos + 4 + 4 * struct.unpack_from('<I', self.data, pos)[0],
+            self.TYPE_ANNOTATION_SET: lambda pos: pos + 4 + 4 * struct.unpack_from('<I', self.data, pos)[0],
+            self.TYPE_CLASS_DATA: self._class_data_end,
+            self.TYPE_CODE: self._code_end,
+            self.TYPE_STRING_DATA: lambda pos: self.data.index(b'\0', self._skip_leb(pos)) + 1,
+            self.TYPE_DEBUG_INFO: self._debug_info_end,
+            self.TYPE_ANNOTATION: lambda pos: self._skip_annotation(pos + 1),
+            self.TYPE_ENCODED_ARRAY: self._skip_array,
+            self.TYPE_ANNOTATIONS_DIRECTORY:
+                lambda pos: pos + 16 + 8 * sum(struct.unpack_from('<3I', self.data, pos + 4)),
+            self.TYPE_HIDDENAPI: lambda pos: pos + struct.unpack_from('<I', self.data, pos)[0],
+        }.get(type_)
+        if item_end is None:
+            raise DexRewriteError(f"不支持的数据项类型: 0x{type_:04x}")
+        aligned = type_ not in self.BYTE_ALIGNED
+        items = []
+        pos = offset
+        for _ in range(count):
+            if aligned:
+                pos = (pos + 3) & ~3
+            end = item_end(pos)
+            items.append((pos, end))
+            pos = end
+        return items
+
+    def _class_data_end(self, pos):
+        sizes = []
+        for _ in range(4):
+            value, pos = read_uleb128(self.data, pos)
+            sizes.append(value)
+        for _ in range((sizes[0] + sizes[1]) * 2 + (sizes[2] + sizes[3]) * 3):
+            pos = self._skip_leb(pos)
+        return pos
+
+    def _code_end(self, pos):
+        _, _, _, tries_size, _, insns_size = struct.unpack_from('<4HII', self.data, pos)
+        end = pos + 16 + insns_size * 2
+        if not tries_size:
+            return end
+        pos = end + (insns_size & 1) * 2 + tries_size * 8
+        size, pos = read_uleb128(self.data, pos)
+        for _ in range(size):
+            count, pos = read_sleb128(self.data, pos)
+            for _ in range(abs(count) * 2 + (count <= 0)):
+                pos = self._skip_leb(pos)
+        return pos
+
+    def _debug_info_end(self, pos):
+        data = self.data
+        pos = self._skip_leb(pos)
+        count, pos = read_uleb128(data, pos)
+        for _ in range(count):
+            pos = self._skip_leb(pos)
+        while True:
+            opcode = data[pos]
+            pos += 1
+            if opcode == 0x00:
+                return pos
+            for _ in range(self.DEBUG_ARGS.get(opcode, 0)):
+                pos = self._skip_leb(pos)
+
+    def _skip_value(self, pos):
+        header = self.data[pos]
+        kind = header & 0x1f
+        if kind == 0x1c:
+            return self._skip_array(pos + 1)
+        if kind == 0x1d:
+            return self._skip_annotation(pos + 1)
+        if kind in (0x1e, 0x1f):
+            return pos + 1
+        return pos + (header >> 5) + 2
+
+    def _skip_array(self, pos):
+        size, pos = read_uleb128(self.data, pos)
+        for _ in range(size):
+            pos = self._skip_value(pos)
+        return pos
+
+    def _skip_annotation(self, pos):
+        pos = self._skip_leb(pos)
+        size, pos = read_uleb128(self.data, pos)
+        for _ in range(size):
+            pos = self._skip_value(self._skip_leb(pos))
+        return pos
+
+    # ---- 查询 ----
+
+    def string_at(self, index):
+        _, pos = read_uleb128(self.data, self.string_ids[index])
+        return mutf8_decode(self.data[pos:self.data.index(b'\0', pos)])
+
+    def type_at(self, index):
+        return self.string_at(self.type_ids[index])
+
+    def _type_list(self, offset):
+        if not offset:
+            return ()
+        size, = struct.unpack_from('<I', self.data, offset)
+        return struct.unpack_from(f'<{size}H', self.data, offset + 4)
+
+    def _find_string(self, text):
+        """二分查找字符串，返回 (是否存在, 在旧表中的位置)"""
+        key = utf16_key(text)
+        lo, hi = 0, len(self.string_ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if utf16_key(self.string_at(mid)) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo < len(self.string_ids) and self.string_at(lo) == text, lo
+
+    def _find_type(self, descriptor):
+        found, string_index = self._find_string(descriptor)
+        if not found:
+            return None
+        position = bisect.bisect_left(self.type_ids, string_index)
+        if position < len(self.type_ids) and self.type_ids[position] == string_index:
+            return position
+        return None
+
+    def class_methods(self, descriptor):
+        """目标类定义的方法: [{"index", "access", "code_off", "name", "signature", "parameters"}]"""
+        type_index = self._find_type(descriptor)
+        if type_index is None:
+            return None
+        class_def = next((item for item in self.ids[self.TYPE_CLASS_DEF] if item[0] == type_index), None)
+        if class_def is None:
+            return None
+        methods = []
+        if not class_def[6]:
+            return methods
+        pos = class_def[6]
+        sizes = []
+        for _ in range(4):
+            value, pos = read_uleb128(self.data, pos)
+            sizes.append(value)
+        for _ in range((sizes[0] + sizes[1]) * 2):
+            pos = self._skip_leb(pos)
+        for count in sizes[2:]:
+            index = 0
+            for _ in range(count):
+                diff, pos = read_uleb128(self.data, pos)
+                access, pos = read_uleb128(self.data, pos)
+                code_off, pos = read_uleb128(self.data, pos)
+                index += diff
+                _, proto_index, name_index = self.ids[self.TYPE_METHOD_ID][index]
+                _, return_type, parameters_off = self.ids[self.TYPE_PROTO_ID][proto_index]
+                parameters = [self.type_at(i) for i in self._type_list(parameters_off)]
+                name = self.string_at(name_index)
+                methods.append({
+                    "index": index, "access": access, "code_off": code_off, "name": name,
+                    "signature": f"{name}({''.join(parameters)}){self.type_at(return_type)}",
+                    "parameters": parameters,
+                })
+        return methods
+
+    # ---- 注入 ----
+
+    def inject(self, specs):
+        """登记注入 (只支持方法开头)，返回注入位置数；目标类不在此dex中的规格跳过"""
+        sites = 0
+        for spec in specs:
+            methods = self.class_methods(class_descriptor(spec.target_class))
+            if methods is None:
+                continue
+            if spec.position != "start":
+                raise DexRewriteError(f"只支持在方法开头注入 (position={spec.position})")
+            instructions = [self.parse_instruction(line) for line in spec.code_lines()
+                            if not line.startswith('#')]
+            for method in methods:
+                selected = (method["signature"] == spec.method if '(' in spec.method
+                            else method["name"] == spec.method)
+                if not selected or not method["code_off"]:
+                    continue
+                self._injections.setdefault(method["code_off"], (method, []))[1].extend(instructions)
+                self._refs.update(reference for _, _, _, reference in instructions if reference)
+                sites += 1
+        return sites
+
+    @staticmethod
+    def _split_operands(text):
+        operands, current, depth, quoted, escaped = [], '', 0, False, False
+        for ch in text:
+            if quoted:
+                quoted = ch != '"' or escaped
+                escaped = ch == '\\' and not escaped
+            elif ch == '"':
+                quoted = True
+            elif ch == '{':
+                depth += 1
+            elif ch == '}':
+                depth -= 1
+            elif ch == ',' and depth == 0:
+                operands.append(current.strip())
+                current = ''
+                continue
+            current += ch
+        if current.strip():
+            operands.append(current.strip())
+        return operands
+
+    @staticmethod
+    def _parse_register(token):
+        match = re.match(r'([vp])(\d+)$', token.strip())
+        if not match:
+            raise DexRewriteError(f"无效的寄存器: {token}")
+        return match.group(1), int(match.group(2))
+
+    def _parse_reference(self, kind, token):
+        if kind == "string":
+            if not (len(token) >= 2 and token[0] == token[-1] == '"'):
+                raise DexRewriteError(f"无效的字符串: {token}")
+            # 与dex中解码出的字符串保持同一形式 (增补字符为代理对)
+            return "string", mutf8_decode(mutf8_encode(_smali_unescape(token[1:-1])))
+        if kind == "type":
+            split_descriptors(token)
+            return "type", token
+        match = re.match(r'(\[*L[^;]+;|\[+[^;]+)->([^(:]+)(?:\((.*)\)(.+)|:(.+))$', token)
+        if kind == "field" and match and match.group(5):
+            return "field", (match.group(1), match.group(2), match.group(5))
+        if kind == "method" and match and match.group(4):
+            return "method", (match.group(1), match.group(2),
+                              (match.group(4), tuple(split_descriptors(match.group(3)))))
+        raise DexRewriteError(f"无效的{kind}引用: {token}")
+
+    def parse_instruction(self, line):
+        """一行smali -> (操作码, 寄存器列表, 字面量, 引用)"""
+        mnemonic, _, rest = line.strip().partition(' ')
+        opcode = DEX_MNEMONICS.get(mnemonic)
+        if opcode is None:
+            raise DexRewriteError(f"不支持的指令: {mnemonic}")
+        fmt, kind = DEX_OPCODES[opcode]
+        operands = self._split_operands(rest)
+        registers, literal, reference = [], None, None
+        try:
+            if fmt in ("35c", "3rc"):
+                inner = operands[0].strip()[1:-1].strip()
+                if fmt == "3rc":
+                    first, last = (self._parse_register(token) for token in inner.split('..'))
+                    if first[0] != last[0] or last[1] < first[1]:
+                        raise DexRewriteError(f"无效的寄存器范围: {operands[0]}")
+                    registers = [(first[0], first[1] + i) for i in range(last[1] - first[1] + 1)]
+                elif inner:
+                    registers = [self._parse_register(token) for token in inner.split(',')]
+                reference = self._parse_reference(kind, operands[1])
+            elif kind:
+                registers = [self._parse_register(token) for token in operands[:-1]]
+                reference = self._parse_reference(kind, operands[-1])
+            elif fmt in ("11n", "21s", "21h", "31i"):
+                registers = [self._parse_register(operands[0])]
+                literal = int(operands[1].rstrip('tsTS'), 0)
+            else:
+                registers = [self._parse_register(token) for token in operands]
+        except (IndexError, ValueError) as e:
+            raise DexRewriteError(f"无法解析指令 {line!r}: {e}")
+        expected = {"10x": 0, "11x": 1, "12x": 2, "22x": 2, "32x": 2, "21c": 1, "31c": 1, "22c": 2}
+        if len(registers) != expected.get(fmt, len(registers)) or (fmt == "35c" and len(registers) > 5):
+            raise DexRewriteError(f"寄存器数量不正确: {line}")
+        return opcode, registers, literal, reference
+
+    # ---- 改写 ----
+
+    def _new_key(self):
+        """新增数据项的键 (负数，与原有数据项的偏移区分)"""
+        self._next_key -= 1
+        return self._next_key
+
+    @staticmethod
+    def _merge_ids(count, additions):
+        """additions: [(在旧表中的插入位置, 排序键, 值)] -> (旧编号->新编号 映射或None, {值: 新编号})"""
+        if not additions:
+            return None, {}
+        additions = sorted(additions)
+        mapping = []
+        previous = 0
+        for shift, position in enumerate([item[0] for item in additions] + [count]):
+            mapping.extend(range(previous + shift, position + shift))
+            previous = position
+        return mapping, {value: position + rank for rank, (position, _, value) in enumerate(additions)}
+
+    @staticmethod
+    def _merge_table(entries, mapping, new_entries):
+        if mapping is None:
+            return list(entries)
+        table = [None] * (len(entries) + len(new_entries))
+        for index, entry in zip(mapping, entries):
+            table[index] = entry
+        for index, entry in new_entries.items():
+            table[index] = entry
+        return table
+
+    def _plan_ids(self):
+        """确定需要新增的id，生成旧编号->新编号映射、新id表和引用的最终编号"""
+        strings, types, protos, methods, fields = set(), set(), set(), set(), set()
+        for kind, value in self._refs:
+            if kind == "string":
+                strings.add(value)
+            elif kind == "type":
+                types.add(value)
+            elif kind == "field":
+                fields.add(value)
+                types.update((value[0], value[2]))
+                strings.add(value[1])
+            elif kind == "method":
+                methods.add(value)
+                types.add(value[0])
+                strings.add(value[1])
+                protos.add(value[2])
+        for return_type, parameters in protos:
+            types.add(return_type)
+            types.update(parameters)
+            strings.add(shorty_descriptor(return_type, parameters))
+        strings.update(types)
+        self._new_items = collections.defaultdict(list)
+        self._type_lists = None
+        index = self._index = {}
+
+        # string_ids: 按UTF-16码元排序
+        additions, found = [], {}
+        for text in strings:
+            exists, position = self._find_string(text)
+            if exists:
+                found[text] = position
+            else:
+                additions.append((position, utf16_key(text), text))
+        smap, new_strings = self._merge_ids(len(self.string_ids), additions)
+        new_entries = {}
+        for text, position in new_strings.items():
+            key = self._new_key()
+            new_entries[position] = key
+            data = write_uleb128(len(utf16_key(text)) // 2) + mutf8_encode(text) + b'\0'
+            self._new_items[self.TYPE_STRING_DATA].append((key, data))
+        self.tables = {self.TYPE_STRING_ID: self._merge_table(self.string_ids, smap, new_entries)}
+        for text, position in found.items():
+            index["string", text] = smap[position] if smap else position
+        for text, position in new_strings.items():
+            index["string", text] = position
+        sm = (lambda i: smap[i]) if smap else (lambda i: i)
+
+        # type_ids: 按描述符的字符串编号排序
+        old_types = [sm(i) for i in self.type_ids]
+        additions, found = [], {}
+        for descriptor in types:
+            string_index = index["string", descriptor]
+            position = bisect.bisect_left(old_types, string_index)
+            if position < len(old_types) and old_types[position] == string_index:
+                found[descriptor] = position
+            else:
+                additions.append((position, string_index, descriptor))
+        tmap, new_types = self._merge_ids(len(old_types), additions)
+        table = self._merge_table(old_types, tmap, {position: index["string", descriptor]
+                                                    for descriptor, position in new_types.items()})
+        if len(table) > 0x10000:
+            raise DexRewriteError("type_ids超过65536")
+        self.tables[self.TYPE_TYPE_ID] = table
+        for descriptor, position in found.items():
+            index["type", descriptor] = tmap[position] if tmap else position
+        for descriptor, position in new_types.items():
+            index["type", descriptor] = position
+        tm = (lambda i: tmap[i]) if tmap else (lambda i: i)
+
+        # proto_ids: 按 (返回类型, 参数列表) 排序
+        old_protos = [(tm(return_type), tuple(tm(i) for i in self._type_list(parameters_off)))
+                      for _, return_type, parameters_off in self.ids[self.TYPE_PROTO_ID]]
+        additions, found = [], {}
+        for proto in protos:
+            key = (index["type", proto[0]], tuple(index["type", descriptor] for descriptor in proto[1]))
+            position = bisect.bisect_left(old_protos, key)
+            if position < len(old_protos) and old_protos[position] == key:
+                found[proto] = position
+            else:
+                additions.append((position, key, proto))
+        pmap, new_protos = self._merge_ids(len(old_protos), additions)
+        entries = [(sm(shorty), tm(return_type), parameters_off)
+                   for shorty, return_type, parameters_off in self.ids[self.TYPE_PROTO_ID]]
+        new_entries = {}
+        for proto, position in new_protos.items():
+            parameters = tuple(index["type", descriptor] for descriptor in proto[1])
+            new_entries[position] = (index["string", shorty_descriptor(*proto)], index["type", proto[0]],
+                                     self._type_list_key(parameters, tm))
+        table = self._merge_table(entries, pmap, new_entries)
+        if len(table) > 0x10000:
+            raise DexRewriteError("proto_ids超过65536")
+        self.tables[self.TYPE_PROTO_ID] = table
+        for proto, position in found.items():
+            index["proto", proto] = pmap[position] if pmap else position
+        index.update({("proto", proto): position for proto, position in new_protos.items()})
+        pm = (lambda i: pmap[i]) if pmap else (lambda i: i)
+
+        # method_ids: 按 (类, 名称, 原型) 排序
+        old_methods = [(tm(class_index), sm(name), pm(proto))
+                       for class_index, proto, name in self.ids[self.TYPE_METHOD_ID]]
+        additions, found = [], {}
+        for method in methods:
+            key = (index["type", method[0]], index["string", method[1]], index["proto", method[2]])
+            position = bisect.bisect_left(old_methods, key)
+            if position < len(old_methods) and old_methods[position] == key:
+                found[method] = position
+            else:
+                additions.append((position, key, method))
+        method_map, new_methods = self._merge_ids(len(old_methods), additions)
+        table = self._merge_table([(c, p, n) for c, n, p in old_methods], method_map,
+                                  {position: (index["type", method[0]], index["proto", method[2]],
+                                              index["string", method[1]])
+                                   for method, position in new_methods.items()})
+        if len(table) > 0x10000:
+            raise DexRewriteError("method_ids超过65536")
+        self.tables[self.TYPE_METHOD_ID] = table
+        for method, position in found.items():
+            index["method", method] = method_map[position] if method_map else position
+        index.update({("method", method): position for method, position in new_methods.items()})
+
+        # field_ids: 只查找已有的字段
+        old_fields = [(tm(class_index), sm(name), tm(type_index))
+                      for class_index, type_index, name in self.ids[self.TYPE_FIELD_ID]]
+        for field in fields:
+            key = (index["type", field[0]], index["string", field[1]], index["type", field[2]])
+            position = bisect.bisect_left(old_fields, key)
+            if position >= len(old_fields) or old_fields[position] != key:
+                raise DexRewriteError(f"字段不在此dex中: {field[0]}->{field[1]}:{field[2]}")
+            index["field", field] = position
+        self.tables[self.TYPE_FIELD_ID] = [(c, t, n) for c, n, t in old_fields]
+
+        keep = lambda i, remap: i if i == self.NO_INDEX else remap(i)
+        self.tables[self.TYPE_CLASS_DEF] = [
+            (tm(class_index), access, keep(superclass, tm), interfaces, keep(source_file, sm),
+             annotations, class_data, static_values)
+            for class_index, access, superclass, interfaces, source_file, annotations, class_data, static_values
+            in self.ids[self.TYPE_CLASS_DEF]
+        ]
+        self.tables[self.TYPE_CALL_SITE_ID] = [offset for offset, in self.ids[self.TYPE_CALL_SITE_ID]]
+        self.tables[self.TYPE_METHOD_HANDLE] = [
+            (kind, unused, method if kind <= 0x03 or not method_map else method_map[method], unused2)
+            for kind, unused, method, unused2 in self.ids[self.TYPE_METHOD_HANDLE]
+        ]
+        self._string_map, self._type_map, self._proto_map, self._method_map = smap, tmap, pmap, method_map
+        self._value_maps = {kind: remap for kind, remap in
+                            ((0x15, pmap), (0x17, smap), (0x18, tmap), (0x1a, method_map))
+                            if remap is not None}
+
+    def _type_list_key(self, types, tm):
+        """返回内容相同的type_list的键，没有时新增一个"""
+        if not types:
+            return 0
+        if self._type_lists is None:
+            self._type_lists = {tuple(tm(i) for i in self._type_list(start)): start
+                                for start, _ in self.items.get(self.TYPE_TYPE_LIST, ())}
+        if types not in self._type_lists:
+            key = self._new_key()
+            self._new_items[self.TYPE_TYPE_LIST].append(
+                (key, struct.pack(f'<I{len(types)}H', len(types), *types)))
+            self._type_lists[types] = key
+        return self._type_lists[types]
+
+    def _encode_instruction(self, instruction, base, ins_size):
+        """按最终编号编码一条注入指令，返回 (码元列表, 调用参数字数)"""
+        opcode, registers, literal, reference = instruction
+        fmt, _ = DEX_OPCODES[opcode]
+        numbers = []
+        for prefix, number in registers:
+            if prefix == 'p':
+                if number >= ins_size:
+                    raise DexRewriteError(f"参数寄存器 p{number} 超出范围")
+                number += base
+            numbers.append(number)
+        index = self._index[reference] if reference else 0
+
+        def check(value, bits):
+            if not 0 <= value < 1 << bits:
+                raise DexRewriteError(f"寄存器/索引超出{bits}位: {value}")
+            return value
+
+        if fmt == "21c" and opcode == 0x1a and index > 0xffff:
+            opcode, fmt = 0x1b, "31c"
+        if fmt == "10x":
+            return [opcode], 0
+        if fmt == "12x":
+            return [opcode | check(numbers[0], 4) << 8 | check(numbers[1], 4) << 12], 0
+        if fmt == "11x":
+            return [opcode | check(numbers[0], 8) << 8], 0
+        if fmt == "22x":
+            return [opcode | check(numbers[0], 8) << 8, check(numbers[1], 16)], 0
+        if fmt == "32x":
+            return [opcode, check(numbers[0], 16), check(numbers[1], 16)], 0
+        if fmt == "11n":
+            if not -8 <= literal <= 7:
+                raise DexRewriteError(f"const/4 字面量超出范围: {literal}")
+            return [opcode | check(numbers[0], 4) << 8 | (literal & 0xf) << 12], 0
+        if fmt == "21s":
+            if not -0x8000 <= literal <= 0x7fff:
+                raise DexRewriteError(f"const/16 字面量超出范围: {literal}")
+            return [opcode | check(numbers[0], 8) << 8, literal & 0xffff], 0
+        if fmt == "21h":
+            if literal & 0xffff or not -0x80000000 <= literal <= 0xffffffff:
+                raise DexRewriteError(f"const/high16 字面量无效: {literal}")
+            return [opcode | check(numbers[0], 8) << 8, (literal >> 16) & 0xffff], 0
+        if fmt == "31i":
+            if not -0x80000000 <= literal <= 0xffffffff:
+                raise DexRewriteError(f"const 字面量超出范围: {literal}")
+            return [opcode | check(numbers[0], 8) << 8, literal & 0xffff, (literal >> 16) & 0xffff], 0
+        if fmt == "21c":
+            return [opcode | check(numbers[0], 8) << 8, check(index, 16)], 0
+        if fmt == "31c":
+            return [opcode | check(numbers[0], 8) << 8, index & 0xffff, index >> 16], 0
+        if fmt == "22c":
+            return [opcode | check(numbers[0], 4) << 8 | check(numbers[1], 4) << 12, check(index, 16)], 0
+        if fmt == "35c":
+            nibbles = [check(number, 4) for number in numbers] + [0] * (5 - len(numbers))
+            return [opcode | nibbles[4] << 8 | len(numbers) << 12, check(index, 16),
+                    nibbles[0] | nibbles[1] << 4 | nibbles[2] << 8 | nibbles[3] << 12], len(numbers)
+        if fmt == "3rc":
+            first = numbers[0] if numbers else 0
+            return [opcode | check(len(numbers), 8) << 8, check(index, 16), check(first, 16)], len(numbers)
+        raise DexRewriteError(f"不支持的指令格式: {fmt}")
+
+    def _plan_code(self):
+        """生成各目标方法的新code_item头、插入的码元和调试信息改动"""
+        self._code_patches = {}
+        self._debug_patches = {}
+        debug_refs = collections.Counter(
+            struct.unpack_from('<I', self.data, start + 8)[0] for start, _ in self.items.get(self.TYPE_CODE, ()))
+        for code_off, (method, instructions) in self._injections.items():
+            registers, ins_size, outs_size, _, debug_off, _ = struct.unpack_from('<4HII', self.data, code_off)
+            locals_size = registers - ins_size
+            needed = 0
+            for opcode, numbers, _, _ in instructions:
+                wide = 2 if opcode in DEX_WIDE_OPCODES else 1
+                for prefix, number in numbers:
+                    if prefix == 'v':
+                        needed = max(needed, number + wide)
+            grow = max(0, needed - locals_size)
+            if registers + grow > 0xffff:
+                raise DexRewriteError("寄存器数超过65535")
+            base = locals_size + grow
+
+            units = []
+            for instruction in instructions:
+                encoded, words = self._encode_instruction(instruction, base, ins_size)
+                units += encoded
+                outs_size = max(outs_size, words)
+            if grow:
+                # 参数随寄存器数上移，注入代码之后移回原位置，原有指令保持不变
+                kinds = ([] if method["access"] & self.ACC_STATIC else ['L']) + [p[0] for p in method["parameters"]]
+                slot = 0
+                for kind in kinds:
+                    opcode = 0x06 if kind in 'JD' else 0x09 if kind in 'L[' else 0x03
+                    units += [opcode, locals_size + slot, base + slot]
+                    slot += 2 if kind in 'JD' else 1
+            if len(units) & 1:
+                units.append(0x0000)   # nop: 保持switch/数组payload的4字节对齐
+
+            debug_key = debug_off
+            if debug_off and debug_refs[debug_off] > 1:
+                # 调试信息被多个方法共用，复制一份再修改
+                debug_key = self._new_key()
+                end = self._debug_info_end(debug_off)
+                self._new_items[self.TYPE_DEBUG_INFO].append(
+                    (debug_key, self._encode_debug_info(debug_off, end, len(units))))
+            elif debug_off:
+                self._debug_patches[debug_off] = len(units)
+            self._code_patches[code_off] = {
+                "registers": registers + grow, "outs": outs_size, "units": units, "debug": debug_key,
+            }
+
+    def _remap_insns(self, insns):
+        maps = {"string": self._string_map, "type": self._type_map, "method": self._method_map,
+                "proto": self._proto_map}
+        remaps = [maps.get(ref) for _, ref in DEX_OPCODES]
+        proto_map = self._proto_map
+        units = DEX_OPCODE_UNITS
+        i, n = 0, len(insns)
+        while i < n:
+            unit = insns[i]
+            opcode = unit & 0xff
+            if opcode == 0 and unit:
+                # payload伪指令
+                if unit == 0x0100:
+                    i += insns[i + 1] * 2 + 4
+                elif unit == 0x0200:
+                    i += insns[i + 1] * 4 + 2
+                elif unit == 0x0300:
+                    i += (insns[i + 1] * (insns[i + 2] | insns[i + 3] << 16) + 1) // 2 + 4
+                else:
+                    i += 1
+                continue
+            remap = remaps[opcode]
+            if remap is not None:
+                if opcode == 0x1b:
+                    value = remap[insns[i + 1] | insns[i + 2] << 16]
+                    insns[i + 1] = value & 0xffff
+                    insns[i + 2] = value >> 16
+                else:
+                    value = remap[insns[i + 1]]
+                    if value > 0xffff:
+                        raise DexRewriteError("const-string的字符串编号超出16位")
+                    insns[i + 1] = value
+            if proto_map is not None and opcode in (0xfa, 0xfb):
+                insns[i + 3] = proto_map[insns[i + 3]]
+            i += units[opcode]
+
+    def _encode_code(self, start, end):
+        data = self.data
+        registers, ins_size, outs_size, tries_size, debug_off, insns_size = struct.unpack_from('<4HII', data, start)
+        patch = self._code_patches.get(start)
+        remap = self._string_map or self._type_map or self._proto_map or self._method_map
+        if patch is None and not remap:
+            return data[start:end], [(8, debug_off)] if debug_off else []
+
+        insns = array.array('H', data[start + 16:start + 16 + insns_size * 2])
+        if sys.byteorder == 'big':
+            insns.byteswap()
+        if remap:
+            self._remap_insns(insns)
+        prefix = array.array('H', patch["units"] if patch else ())
+        if patch:
+            registers, outs_size, debug_off = patch["registers"], patch["outs"], patch["debug"]
+        total = len(prefix) + insns_size
+        code = prefix + insns
+        if sys.byteorder == 'big':
+            code.byteswap()
+        out = bytearray(struct.pack('<4HII', registers, ins_size, outs_size, tries_size, 0, total))
+        out += code.tobytes()
+        if tries_size:
+            if total & 1:
+                out += b'\0\0'
+            tries_pos = start + 16 + insns_size * 2 + (insns_size & 1) * 2
+            shift = len(prefix)
+            if not shift and not self._type_map:
+                out += data[tries_pos:end]
+            else:
+                handlers, handler_offsets = self._encode_handlers(tries_pos + tries_size * 8, shift)
+                for i in range(tries_size):
+                    start_addr, count, handler_off = struct.unpack_from('<IHH', data, tries_pos + i * 8)
+                    out += struct.pack('<IHH', start_addr + shift, count, handler_offsets[handler_off])
+                out += handlers
+        return bytes(out), [(8, debug_off)] if debug_off else []
+
+    def _encode_handlers(self, list_pos, shift):
+        """重写encoded_catch_handler_list，返回 (字节, 旧相对偏移->新相对偏移)"""
+        data = self.data
+        tmap = self._type_map
+        out = bytearray()
+        offsets = {}
+        size, pos = read_uleb128(data, list_pos)
+        out += write_uleb128(size)
+        for _ in range(size):
+            offsets[pos - list_pos] = len(out)
+            count, pos = read_sleb128(data, pos)
+            out += write_sleb128(count)
+            for _ in range(abs(count)):
+                type_index, pos = read_uleb128(data, pos)
+                address, pos = read_uleb128(data, pos)
+                out += write_uleb128(tmap[type_index] if tmap else type_index) + write_uleb128(address + shift)
+            if count <= 0:
+                address, pos = read_uleb128(data, pos)
+                out += write_uleb128(address + shift)
+        return bytes(out), offsets
+
+    def _encode_class_data(self, start, offsets, owners=None):
+        data = self.data
+        sizes = []
+        pos = start
+        for _ in range(4):
+            value, pos = read_uleb128(data, pos)
+            sizes.append(value)
+        fields_end = pos
+        for _ in range((sizes[0] + sizes[1]) * 2):
+            fields_end = self._skip_leb(fields_end)
+        out = bytearray(data[start:fields_end])
+        pos = fields_end
+        method_map = self._method_map
+        for count in sizes[2:]:
+            previous = new_previous = 0
+            for _ in range(count):
+                diff, pos = read_uleb128(data, pos)
+                previous += diff
+                index = method_map[previous] if method_map else previous
+                out += write_uleb128(index - new_previous)
+                new_previous = index
+                access_start = pos
+                pos = self._skip_leb(pos)
+                out += data[access_start:pos]
+                code_off, pos = read_uleb128(data, pos)
+                if owners is not None and code_off in self._code_patches:
+                    owners[code_off] += 1
+                out += write_uleb128(offsets.get(code_off, code_off))
+        return bytes(out)
+
+    def _copy_leb(self, pos, out, remap=None, plus_one=False):
+        """复制一个ULEB128，按remap改写 (plus_one: uleb128p1，0表示NO_INDEX)"""
+        value, end = read_uleb128(self.data, pos)
+        if remap is None or (plus_one and not value):
+            out += self.data[pos:end]
+        elif plus_one:
+            out += write_uleb128(remap[value - 1] + 1)
+        else:
+            out += write_uleb128(remap[value])
+        return end
+
+    def _encode_debug_info(self, start, end, advance=0):
+        smap, tmap = self._string_map, self._type_map
+        if not (smap or tmap or advance):
+            return self.data[start:end]
+        data = self.data
+        out = bytearray()
+        pos = self._copy_leb(start, out)
+        count, _ = read_uleb128(data, pos)
+        pos = self._copy_leb(pos, out)
+        for _ in range(count):
+            pos = self._copy_leb(pos, out, smap, True)
+        if advance:
+            out.append(0x01)    # DBG_ADVANCE_PC: 原有位置信息整体后移
+            out += write_uleb128(advance)
+        while True:
+            opcode = data[pos]
+            out.append(opcode)
+            pos += 1
+            if opcode == 0x00:
+                return bytes(out)
+            if opcode in (0x03, 0x04):
+                pos = self._copy_leb(pos, out)
+                pos = self._copy_leb(pos, out, smap, True)
+                pos = self._copy_leb(pos, out, tmap, True)
+                if opcode == 0x04:
+                    pos = self._copy_leb(pos, out, smap, True)
+            elif opcode == 0x09:
+                pos = self._copy_leb(pos, out, smap, True)
+            elif opcode in self.DEBUG_ARGS:
+                end = self._skip_leb(pos)
+                out += data[pos:end]
+                pos = end
+
+    def _copy_value(self, pos, out):
+        data = self.data
+        header = data[pos]
+        kind = header & 0x1f
+        out.append(header)
+        if kind == 0x1c:
+            return self._copy_array(pos + 1, out)
+        if kind == 0x1d:
+            return self._copy_annotation(pos + 1, out)
+        if kind in (0x1e, 0x1f):
+            return pos + 1
+        size = (header >> 5) + 1
+        remap = self._value_maps.get(kind)
+        if remap is None:
+            out += data[pos + 1:pos + 1 + size]
+        else:
+            value = remap[int.from_bytes(data[pos + 1:pos + 1 + size], 'little')]
+            length = max(1, (value.bit_length() + 7) // 8)
+            out[-1] = (length - 1) << 5 | kind
+            out += value.to_bytes(length, 'little')
+        return pos + 1 + size
+
+    def _copy_array(self, pos, out):
+        size, _ = read_uleb128(self.data, pos)
+        pos = self._copy_leb(pos, out)
+        for _ in range(size):
+            pos = self._copy_value(pos, out)
+        return pos
+
+    def _copy_annotation(self, pos, out):
+        pos = self._copy_leb(pos, out, self._type_map)
+        size, _ = read_uleb128(self.data, pos)
+        pos = self._copy_leb(pos, out)
+        for _ in range(size):
+            pos = self._copy_leb(pos, out, self._string_map)
+            pos = self._copy_value(pos, out)
+        return pos
+
+    def _encode_item(self, type_, start, end):
+        """编码一个原有数据项，返回 (字节, [(项内位置, 被引用项的旧偏移)])"""
+        data = self.data
+        if type_ == self.TYPE_CODE:
+            return self._encode_code(start, end)
+        if type_ == self.TYPE_CLASS_DATA:
+            return self._encode_class_data(start, {}, self._code_owners), []
+        if type_ == self.TYPE_DEBUG_INFO:
+            return self._encode_debug_info(start, end, self._debug_patches.get(start, 0)), []
+        if type_ == self.TYPE_TYPE_LIST and self._type_map:
+            types = self._type_list(start)
+            return struct.pack(f'<I{len(types)}H', len(types), *(self._type_map[i] for i in types)), []
+        if type_ in (self.TYPE_ANNOTATION_SET_REF_LIST, self.TYPE_ANNOTATION_SET):
+            size, = struct.unpack_from('<I', data, start)
+            offsets = struct.unpack_from(f'<{size}I', data, start + 4)
+            return data[start:end], [(4 + i * 4, offset) for i, offset in enumerate(offsets) if offset]
+        if type_ == self.TYPE_ANNOTATIONS_DIRECTORY:
+            out = bytearray(data[start:end])
+            class_annotations, fields, methods, parameters = struct.unpack_from('<4I', out, 0)
+            relocs = [(0, class_annotations)] if class_annotations else []
+            for i in range(fields + methods + parameters):
+                index, offset = struct.unpack_from('<2I', out, 16 + i * 8)
+                if i >= fields and self._method_map:
+                    struct.pack_into('<I', out, 16 + i * 8, self._method_map[index])
+                relocs.append((20 + i * 8, offset))
+            return bytes(out), relocs
+        if type_ == self.TYPE_ANNOTATION and self._value_maps:
+            out = bytearray(data[start:start + 1])
+            self._copy_annotation(start + 1, out)
+            return bytes(out), []
+        if type_ == self.TYPE_ENCODED_ARRAY and self._value_maps:
+            out = bytearray()
+            self._copy_array(start, out)
+            return bytes(out), []
+        return data[start:end], []
+
+    def _encode_ids(self, type_):
+        """编码id表，返回 (字节, 偏移重定位)"""
+        table = self.tables[type_]
+        if type_ == self.TYPE_STRING_ID:
+            return bytes(4 * len(table)), [(i * 4, key) for i, key in enumerate(table)]
+        if type_ == self.TYPE_TYPE_ID:
+            return struct.pack(f'<{len(table)}I', *table), []
+        if type_ == self.TYPE_PROTO_ID:
+            out = b''.join(struct.pack('<3I', shorty, return_type, 0) for shorty, return_type, _ in table)
+            return out, [(i * 12 + 8, key) for i, (_, _, key) in enumerate(table) if key]
+        if type_ in (self.TYPE_FIELD_ID, self.TYPE_METHOD_ID):
+            return b''.join(struct.pack('<HHI', *entry) for entry in table), []
+        if type_ == self.TYPE_CLASS_DEF:
+            out = b''.join(struct.pack('<8I', *entry[:3], 0, entry[4], 0, 0, 0) for entry in table)
+            return out, [(i * 32 + field * 4, entry[field]) for i, entry in enumerate(table)
+                         for field in (3, 5, 6, 7) if entry[field]]
+        if type_ == self.TYPE_CALL_SITE_ID:
+            return bytes(4 * len(table)), [(i * 4, key) for i, key in enumerate(table)]
+        return b''.join(struct.pack('<4H', *entry) for entry in table), []
+
+    def build(self):
+        """生成改写后的dex字节"""
+        self._plan_ids()
+        self._plan_code()
+        self._code_owners = collections.Counter()
+
+        sections = []   # [类型, 项数, [(键, 字节, 重定位)]]
+        for type_, size, offset in self.map:
+            if type_ == self.TYPE_HEADER:
+                items = [(None, bytes(self.HEADER_SIZE), [])]
+                count = 1
+            elif type_ in self.ID_FORMATS:
+                items = [(None,) + self._encode_ids(type_)]
+                count = len(self.tables[type_])
+            elif type_ == self.TYPE_MAP_LIST:
+                items = [(offset, None, [])]
+                count = 1
+            else:
+                items = [(start,) + self._encode_item(type_, start, end) for start, end in self.items[type_]]
+                items += [(key, data, []) for key, data in self._new_items.pop(type_, ())]
+                count = len(items)
+            sections.append([type_, count, items])
+        # 原来没有的段: id表按标准顺序放在前一个id表之后，数据段放在map_list之前
+        # (例如只含无参方法的dex没有type_list)
+        present = {section[0] for section in sections}
+        for type_ in sorted(self.ID_FORMATS):
+            if type_ not in present and self.tables.get(type_):
+                index = max(i for i, section in enumerate(sections) if section[0] < type_) + 1
+                sections.insert(index, [type_, len(self.tables[type_]), [(None,) + self._encode_ids(type_)]])
+        map_index = next(i for i, section in enumerate(sections) if section[0] == self.TYPE_MAP_LIST)
+        for type_, new_items in sorted(self._new_items.items()):
+            sections.insert(map_index, [type_, len(new_items), [(key, data, []) for key, data in new_items]])
+        if any(count > 1 for count in self._code_owners.values()):
+            raise DexRewriteError("目标方法的code_item被多个方法共用")
+        map_size = 4 + 12 * len(sections)
+
+        # 布局: class_data中的code_off是ULEB128，长度随偏移变化，重复到稳定为止
+        # code_item位置不变时class_data编码不变，无需重新编码
+        encoded_for = None
+        for _ in range(8):
+            offsets = {}
+            positions = []
+            pos = 0
+            for type_, _, items in sections:
+                aligned = type_ not in self.BYTE_ALIGNED
+                item_positions = []
+                for key, blob, _ in items:
+                    if aligned:
+                        pos = (pos + 3) & ~3
+                    if key is not None:
+                        offsets[key] = pos
+                    item_positions.append(pos)
+                    pos += map_size if blob is None else len(blob)
+                positions.append(item_positions)
+            code_positions = [item_positions for (type_, _, _), item_positions
+                              in zip(sections, positions) if type_ == self.TYPE_CODE]
+            if code_positions == encoded_for:
+                break
+            encoded_for = code_positions
+            changed = False
+            for type_, _, items in sections:
+                if type_ != self.TYPE_CLASS_DATA:
+                    continue
+                for i, (key, blob, relocs) in enumerate(items):
+                    encoded = self._encode_class_data(key, offsets)
+                    changed |= len(encoded) != len(blob)
+                    items[i] = (key, encoded, relocs)
+            if not changed:
+                break
+        else:
+            raise DexRewriteError("class_data布局不收敛")
+
+        out = bytearray(pos)
+        map_entries = []
+        for (type_, count, items), item_positions in zip(sections, positions):
+            map_entries.append((type_, count, item_positions[0]))
+            for (key, blob, relocs), item_pos in zip(items, item_positions):
+                if blob is None:
+                    continue
+                out[item_pos:item_pos + len(blob)] = blob
+                for rel_pos, target in relocs:
+                    if target not in offsets:
+                        raise DexRewriteError(f"偏移 0x{target:x} 不指向任何数据项")
+                    struct.pack_into('<I', out, item_pos + rel_pos, offsets[target])
+        map_off = next(offset for type_, _, offset in map_entries if type_ == self.TYPE_MAP_LIST)
+        out[map_off:map_off + map_size] = struct.pack('<I', len(map_entries)) + b''.join(
+            struct.pack('<HxxII', type_, count, offset) for type_, count, offset in map_entries)
+
+        out[:self.HEADER_SIZE] = self.data[:self.HEADER_SIZE]
+        struct.pack_into('<I', out, 0x20, len(out))
+        struct.pack_into('<I', out, 0x34, map_off)
+        for type_, field in self.HEADER_FIELDS.items():
+            entry = next(((count, offset) for t, count, offset in map_entries if t == type_), (0, 0))
+            struct.pack_into('<2I', out, field, *entry)
+        data_off = next(offset for type_, _, offset in map_entries
+                        if type_ not in self.ID_FORMATS and type_ != self.TYPE_HEADER)
+        struct.pack_into('<2I', out, 0x68, len(out) - data_off, data_off)
+        out[12:32] = hashlib.sha1(out[32:]).digest()
+        struct.pack_into('<I', out, 8, zlib.adler32(out[12:]))
+        return bytes(out)
+
+
+class PayloadStore:
+    """外部payload下载/解压缓存，可在多个FinalInjector之间共享"""
 
-class FinalInjector:
     def __init__(self):
         self.temp_dir = tempfile.mkdtemp()
+        self.build_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._payloads = {}
+
+    def fetch(self, zip_url):
+        """返回 (解压目录, zip的SHA-256)，同一URL只下载一次"""
+        with self._lock:
+            if zip_url in self._payloads:
+                return self._payloads[zip_url]
+            
+            try:
+                import requests
+            except ImportError:
+                print("❌ 缺少requests模块，无法下载payload (pip install requests)")
+                return None
+            
+            try:
+                # 下载zip文件
+                response = requests.get(zip_url, timeout=60)
+                if response.status_code != 200:
+                    print(f"❌ 下载失败: HTTP {response.status_code}")
+                    return None
+                
+                # 保存zip文件
+                payload_sha256 = hashlib.sha256(response.content).hexdigest()
+                zip_path = os.path.join(self.temp_dir, payload_sha256 + ".zip")
+                with open(zip_path, 'wb') as f:
+                    f.write(response.content)
+                
+                print("✅ Zip文件下载完成")
+                
+                # 解压zip文件
+                extract_dir = os.path.join(self.temp_dir, payload_sha256)
+                os.makedirs(extract_dir, exist_ok=True)
+                
+                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                    zip_ref.extractall(extract_dir)
+                
+                print("✅ Zip文件解压完成")
+                self._payloads[zip_url] = (extract_dir, payload_sha256)
+                return self._payloads[zip_url]
+                
+            except Exception as e:
+                print(f"❌ Zip文件下载失败: {e}")
+                return None
+
+    def cleanup(self):
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+
+class FinalInjector:
+    def __init__(self, tool_cache=None, workers=1, jvm_memory=None, use_jvm_worker=False,
+                 workspace_cache=None, payload_store=None, signer="builtin", metrics=None, dex_rewrite=True,
+                 page_size=ApkWriter.PAGE_SIZE):
+        """workers: 并发处理的dex数量; jvm_memory: 每个JVM的堆上限 (如 "512m");
+        use_jvm_worker: 使用常驻JVM执行smali/baksmali，避免每次调用的JVM启动开销;
+        workspace_cache: smali树/dex缓存，传False禁用;
+        payload_store: 共享的payload缓存 (批量模式下多个任务共用);
+        signer: "builtin" 内置v1+v2签名，"jarsigner" 使用JDK的keytool/jarsigner;
+        metrics: StageMetrics，记录 extract/decompile/integrate/inject/compile/repack/sign 各阶段;
+        dex_rewrite: 先尝试用DexFile直接改写dex (无需java)，不支持的注入再走smali流程;
+        page_size: 输出APK中 .so 的对齐字节数 (4096或16384)
+        """
+        self.temp_dir = tempfile.mkdtemp()
+        self.tool_cache = tool_cache or ToolCache()
+        self.workspace_cache = WorkspaceCache() if workspace_cache is None else workspace_cache
+        self.workers = max(1, workers)
+        self.jvm_memory = jvm_memory
+        self._owns_payload_store = payload_store is None
+        self.payload_store = payload_store or PayloadStore()
+        self.signer = signer
+        self._signing_key = None
+        self.metrics = metrics or StageMetrics(enabled=False)
+        self.dex_rewrite = dex_rewrite
+        self.page_size = page_size
+        self._smali_indexes = {}
+        self.use_jvm_worker = use_jvm_worker
+        self._jvm_workers = queue.Queue()
+        self._jvm_worker_lock = threading.Lock()
+        self._jvm_worker_count = 0
         
     def cleanup(self):
+        while not self._jvm_workers.empty():
+            self._jvm_workers.get().close()
+        if self._owns_payload_store:
+            self.payload_store.cleanup()
+        if self.workspace_cache:
+            self.workspace_cache.flush()
         if os.path.exists(self.temp_dir):
             shutil.rmtree(self.temp_dir)
     
@@ -38,33 +2847,73 @@ class FinalInjector:
             return None, []
 
     def download_tool(self, url, filename):
-        """下载工具"""
-        tool_path = os.path.join(self.temp_dir, filename)
-        
+        """获取工具 (持久化缓存 -> 本地镜像 -> 下载)"""
         try:
-            import requests
-            print(f"📥 下载 {filename}...")
-            response = requests.get(url)
-            with open(tool_path, 'wb') as f:
-                f.write(response.content)
-            return tool_path
+            return self.tool_cache.fetch(url, filename)
         except Exception as e:
             print(f"❌ 下载失败: {e}")
             return None
 
+    def java_command(self, jar_path, *args):
+        """构造java命令，按配置附加堆内存上限"""
+        cmd = ["java"]
+        if self.jvm_memory:
+            cmd.append(f"-Xmx{self.jvm_memory}")
+        return cmd + ["-jar", jar_path] + list(args)
+
+    def _acquire_jvm_worker(self):
+        """借出一个常驻JVM，数量不超过workers"""
+        with self._jvm_worker_lock:
+            if self._jvm_workers.empty() and self._jvm_worker_count < self.workers:
+                baksmali_path = self.download_tool(BAKSMALI_URL, "baksmali.jar")
+                smali_path = self.download_tool(SMALI_URL, "smali.jar")
+                if not baksmali_path or not smali_path:
+                    raise JvmWorkerError("工具下载失败")
+                self._jvm_worker_count += 1
+                return JvmWorker(baksmali_path, smali_path, self.jvm_memory)
+        return self._jvm_workers.get()
+
+    def run_in_jvm_worker(self, command, *args):
+        """在常驻JVM中执行任务，通信失败时重启重试一次；返回 (成功, 信息) 或 None(需回退到子进程)"""
+        try:
+            worker = self._acquire_jvm_worker()
+        except JvmWorkerError as e:
+            print(f"⚠️  {e}，回退到独立进程")
+            return None
+        try:
+            for attempt in range(2):
+                try:
+                    if worker.is_alive():
+                        worker.ensure_alive()
+                    else:
+                        worker.start()
+                    return getattr(worker, command)(*args)
+                except JvmWorkerError as e:
+                    print(f"⚠️  常驻JVM异常 ({e})" + ("，重启重试" if attempt == 0 else "，回退到独立进程"))
+                    worker.close()
+            return None
+        finally:
+            self._jvm_workers.put(worker)
+
     def decompile_dex(self, dex_path, output_dir):
         """反编译dex为smali"""
         print(f"🔧 反编译 {os.path.basename(dex_path)}...")
         
         try:
+            if self.use_jvm_worker:
+                result = self.run_in_jvm_worker("disassemble", dex_path, output_dir)
+                if result is not None:
+                    ok, message = result
+                    print(f"✅ 反编译成功: {output_dir}" if ok else f"❌ 反编译失败: {message}")
+                    return ok
+            
             # 下载baksmali工具
-            baksmali_url = "https://bitbucket.org/JesusFreke/smali/downloads/baksmali-2.5.2.jar"
-            baksmali_path = self.download_tool(baksmali_url, "baksmali.jar")
+            baksmali_path = self.download_tool(BAKSMALI_URL, "baksmali.jar")
             if not baksmali_path:
                 return False
             
             # 反编译dex
-            cmd = ["java", "-jar", baksmali_path, "d", dex_path, "-o", output_dir]
+            cmd = self.java_command(baksmali_path, "d", dex_path, "-o", output_dir)
             result = subprocess.run(cmd, capture_output=True, text=True)
             
             if result.returncode == 0:
@@ -78,98 +2927,55 @@ class FinalInjector:
             print(f"❌ 反编译过程出错: {e}")
             return False
 
+    def smali_index(self, smali_dir):
+        """返回smali树的类索引 (优先读取保存在树中的索引)"""
+        index = self._smali_indexes.get(smali_dir)
+        if index is None:
+            index = SmaliIndex.load_or_build(smali_dir)
+            self._smali_indexes[smali_dir] = index
+        return index
+
     def find_target_smali(self, smali_dir, target_class):
         """查找目标smali文件"""
         print("🔍 查找目标smali文件...")
         
-        # 将Java包名转换为smali路径
-        smali_path = target_class.replace('.', '/') + ".smali"
-        target_file = os.path.join(smali_dir, smali_path)
-        
-        if os.path.exists(target_file):
+        target_file = self.smali_index(smali_dir).find(target_class)
+        if target_file and os.path.exists(target_file):
             print(f"✅ 找到目标文件: {target_file}")
             return target_file
         
-        # 如果没找到，搜索所有smali文件
-        print("⚠️  标准路径未找到，开始全局搜索...")
-        for root, dirs, files in os.walk(smali_dir):
-            for file in files:
-                if file == os.path.basename(smali_path):
-                    full_path = os.path.join(root, file)
-                    print(f"✅ 深度搜索找到目标文件: {full_path}")
-                    return full_path
-        
         print("❌ 未找到目标smali文件")
         return None
 
+    def find_target_smalis(self, smali_dir, target_classes):
+        """批量查找多个目标类，返回 {类名: 文件路径或None}"""
+        index = self.smali_index(smali_dir)
+        return {target_class: index.find(target_class) for target_class in target_classes}
+
     def inject_code_proper(self, smali_file, injection_code):
-        """注入代码到正确位置 - .registers声明之后"""
+        """注入代码到正确位置 - onCreate方法.registers声明之后、第一条指令之前"""
         print(f"💉 向 {smali_file} 注入代码...")
         
         try:
-            with open(smali_file, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-            
-            # 备份原始文件
-            backup_file = smali_file + '.bak'
-            shutil.copy2(smali_file, backup_file)
-            
-            # 查找onCreate方法
-            lines = content.split('\n')
-            new_lines = []
-            in_oncreate = False
-            found_registers = False
-            injected = False
-            
-            for i, line in enumerate(lines):
-                new_lines.append(line)
-                
-                # 检查是否进入onCreate方法
-                if line.strip().startswith('.method') and 'onCreate' in line:
-                    print(f"✅ 找到onCreate方法: {line.strip()}")
-                    in_oncreate = True
-                    continue
-                
-                # 检查是否离开onCreate方法
-                if line.strip().startswith('.end method') and in_oncreate:
-                    in_oncreate = False
-                    continue
-                
-                # 在onCreate方法内
-                if in_oncreate and not injected:
-                    # 查找.registers声明
-                    if line.strip().startswith('.registers'):
-                        found_registers = True
-                        continue
-                    
-                    # 在.registers声明之后立即注入
-                    if found_registers and line.strip() and not line.strip().startswith('.'):
-                        print(f"📍 在.registers声明后立即注入 (第{i+1}行前)")
-                        
-                        # 添加注入代码
-                        injection_lines = injection_code.split('\n')
-                        for inj_line in reversed(injection_lines):
-                            if inj_line.strip():
-                                # 使用适当的缩进（通常是4空格）
-                                indent = '    '
-                                new_lines.insert(len(new_lines) - 1, f"{indent}{inj_line}")
-                        
-                        injected = True
-            
-            if injected:
-                # 写入文件
-                with open(smali_file, 'w', encoding='utf-8') as f:
-                    f.write('\n'.join(new_lines))
-                
-                print("✅ 代码注入完成")
-                return True
-            else:
+            smali_class = SmaliClass.load(smali_file)
+            methods = smali_class.find_methods("onCreate")
+            if not methods:
                 print("❌ 未找到合适的注入位置")
-                # 显示方法开头部分帮助调试
-                print("📄 方法开头内容:")
-                for j, line in enumerate(lines[:20]):
+                # 显示文件开头部分帮助调试
+                print("📄 文件开头内容:")
+                for j, line in enumerate(smali_class.lines[:20]):
                     print(f"  {j+1}: {line}")
                 return False
+            
+            method = methods[0]
+            print(f"✅ 找到onCreate方法: {smali_class.lines[method.start].strip()}")
+            spec = InjectionSpec(smali_class.descriptor, method.signature, injection_code)
+            for target in smali_class.plan(method, spec):
+                print(f"📍 在.registers声明后立即注入 (第{target+1}行前)")
+            smali_class.save()
+            
+            print("✅ 代码注入完成")
+            return True
                 
         except Exception as e:
             print(f"❌ 注入过程出错: {e}")
@@ -177,35 +2983,39 @@ class FinalInjector:
             traceback.print_exc()
             return False
 
+    def apply_injections(self, smali_dir, specs):
+        """单遍批量注入: 每个目标文件只解析一次、写回一次，返回成功注入的规格数"""
+        by_class = collections.OrderedDict()
+        for spec in specs:
+            by_class.setdefault(class_descriptor(spec.target_class), []).append(spec)
+        
+        index = self.smali_index(smali_dir)
+        applied = 0
+        for descriptor, class_specs in by_class.items():
+            smali_file = index.find(descriptor)
+            if not smali_file:
+                continue
+            smali_class = SmaliClass.load(smali_file)
+            for spec in class_specs:
+                methods = smali_class.find_methods(spec.method)
+                sites = [target for method in methods for target in smali_class.plan(method, spec)]
+                if sites:
+                    applied += 1
+                    print(f"💉 {descriptor}->{spec.method}: {len(sites)} 处 ({spec.position})")
+                else:
+                    print(f"⚠️  {descriptor}->{spec.method}: 未找到注入位置")
+            smali_class.save()
+        return applied
+
     def download_and_integrate_zip(self, zip_url, smali_dir):
         """从GitHub下载zip文件并整合到smali中"""
         print(f"📥 下载并整合zip文件: {zip_url}")
         
         try:
-            import requests
-            import zipfile
-            
-            # 下载zip文件
-            response = requests.get(zip_url)
-            if response.status_code != 200:
-                print(f"❌ 下载失败: HTTP {response.status_code}")
+            payload = self.fetch_payload(zip_url)
+            if not payload:
                 return False
-            
-            # 保存zip文件
-            zip_path = os.path.join(self.temp_dir, "external_classes.zip")
-            with open(zip_path, 'wb') as f:
-                f.write(response.content)
-            
-            print("✅ Zip文件下载完成")
-            
-            # 解压zip文件
-            extract_dir = os.path.join(self.temp_dir, "external_classes")
-            os.makedirs(extract_dir, exist_ok=True)
-            
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_dir)
-            
-            print("✅ Zip文件解压完成")
+            extract_dir, _ = payload
             
             # 复制smali文件到目标目录
             extracted_smali_dirs = glob.glob(os.path.join(extract_dir, "*"))
@@ -232,6 +3042,12 @@ class FinalInjector:
                                     shutil.copy2(src_file, dst_file)
                                     print(f"✅ 复制文件: {os.path.join(rel_path, file)}")
             
+            # 复制进来的类同步到该树的索引
+            index = self._smali_indexes.get(smali_dir)
+            if index is not None:
+                index.update(SmaliIndex.build(extract_dir))
+                index.save()
+            
             print("✅ Zip文件整合完成")
             return True
             
@@ -241,19 +3057,63 @@ class FinalInjector:
             traceback.print_exc()
             return False
 
+    def fetch_payload(self, zip_url):
+        """下载并解压外部payload，每次运行只下载一次，返回 (解压目录, zip的SHA-256)"""
+        return self.payload_store.fetch(zip_url)
+
+    def build_payload_dex(self, zip_url):
+        """把payload单独编译为dex，按zip内容哈希+smali版本缓存"""
+        payload = self.fetch_payload(zip_url)
+        if not payload:
+            return None
+        extract_dir, payload_sha256 = payload
+        
+        cache_key = hashlib.sha256(
+            f"{payload_sha256}:{os.path.basename(SMALI_URL)}".encode()
+        ).hexdigest()
+        cached_dex = os.path.join(CACHE_ROOT, "payload", cache_key + ".dex")
+        # 共享同一PayloadStore的任务只编译一次
+        with self.payload_store.build_lock:
+            if os.path.exists(cached_dex):
+                print(f"♻️  使用缓存的payload dex: {cache_key[:12]}")
+                return cached_dex
+            
+            os.makedirs(os.path.dirname(cached_dex), exist_ok=True)
+            tmp_dex = cached_dex + f".{os.getpid()}.tmp"
+            if not self.compile_smali_to_dex(extract_dir, tmp_dex):
+                return None
+            os.replace(tmp_dex, cached_dex)
+            return cached_dex
+
+    @staticmethod
+    def next_dex_name(dex_files):
+        """返回下一个可用的 classesN.dex 名称"""
+        numbers = []
+        for dex_file in dex_files:
+            match = re.fullmatch(r'classes(\d*)\.dex', dex_file)
+            if match:
+                numbers.append(int(match.group(1) or 1))
+        return f"classes{max(numbers, default=0) + 1}.dex"
+
     def compile_smali_to_dex(self, smali_dir, output_dex):
         """编译smali为dex"""
         print(f"🔨 编译smali为 {os.path.basename(output_dex)}...")
         
         try:
+            if self.use_jvm_worker:
+                result = self.run_in_jvm_worker("assemble", smali_dir, output_dex)
+                if result is not None:
+                    ok, message = result
+                    print(f"✅ 编译成功: {output_dex}" if ok else f"❌ 编译失败: {message}")
+                    return ok
+            
             # 下载smali工具
-            smali_url = "https://bitbucket.org/JesusFreke/smali/downloads/smali-2.5.2.jar"
-            smali_path = self.download_tool(smali_url, "smali.jar")
+            smali_path = self.download_tool(SMALI_URL, "smali.jar")
             if not smali_path:
                 return False
             
             # 编译smali
-            cmd = ["java", "-jar", smali_path, "assemble", smali_dir, "-o", output_dex]
+            cmd = self.java_command(smali_path, "assemble", smali_dir, "-o", output_dex)
             result = subprocess.run(cmd, capture_output=True, text=True)
             
             if result.returncode == 0:
@@ -268,12 +3128,21 @@ class FinalInjector:
             return False
 
     def create_debug_keystore(self):
-        """创建调试密钥库"""
-        keystore_path = os.path.join(os.path.dirname(__file__), "debug.keystore")
+        """创建调试密钥 (内置签名器用PEM密钥，jarsigner模式用keytool密钥库)"""
+        if self.signer == "builtin":
+            try:
+                self._signing_key = DebugSigningKey.load_or_create(DEBUG_KEY_PATH)
+                return True
+            except Exception as e:
+                print(f"❌ 创建调试签名密钥失败: {e}")
+                return False
+        
+        keystore_path = DEBUG_KEYSTORE_PATH
         if os.path.exists(keystore_path):
             return True
         
         try:
+            os.makedirs(os.path.dirname(os.path.abspath(keystore_path)), exist_ok=True)
             cmd = [
                 "keytool", "-genkey", "-v",
                 "-keystore", keystore_path,
@@ -304,7 +3173,14 @@ class FinalInjector:
         print("🔏 签名APK...")
         
         try:
-            keystore_path = os.path.join(os.path.dirname(__file__), "debug.keystore")
+            if self.signer == "builtin":
+                if self._signing_key is None and not self.create_debug_keystore():
+                    return False
+                ApkSigner(self._signing_key, page_size=self.page_size).sign(apk_path)
+                print(f"✅ APK签名成功 (v1+v2): {apk_path}")
+                return True
+            
+            keystore_path = DEBUG_KEYSTORE_PATH
             
             # 签名APK
             sign_cmd = [
@@ -319,6 +3195,10 @@ class FinalInjector:
             sign_result = subprocess.run(sign_cmd, capture_output=True, text=True)
             
             if sign_result.returncode == 0:
+                # jarsigner重写zip时丢失对齐；v1签名只覆盖条目内容，重新对齐不影响签名
+                aligned_path = apk_path + '.aligning'
+                repack_apk(apk_path, aligned_path, page_size=self.page_size)
+                os.replace(aligned_path, apk_path)
                 print(f"✅ APK签名成功: {apk_path}")
                 return True
             else:
@@ -329,78 +3209,204 @@ class FinalInjector:
             print(f"❌ 签名过程出错: {e}")
             return False
 
-    def process_injection(self, apk_path, target_class, injection_code, zip_url=None):
-        """主处理流程"""
+    def index_dex_files(self, extract_dir, dex_files):
+        """建立 类描述符 -> dex 的索引，解析失败时返回None"""
+        print("🗂️  建立dex类索引...")
+        index = DexClassIndex()
+        try:
+            for dex_file in dex_files:
+                count = index.add_dex(dex_file, os.path.join(extract_dir, dex_file))
+                print(f"✅ {dex_file}: {count} 个类")
+            return index
+        except Exception as e:
+            print(f"⚠️  dex索引失败，将处理全部dex: {e}")
+            return None
+
+    def injection_spec_hash(self, specs, zip_url=None):
+        """注入规格哈希，payload按内容而非URL计入"""
+        payload_sha256 = None
+        if zip_url:
+            payload = self.fetch_payload(zip_url)
+            payload_sha256 = payload[1] if payload else None
+        spec = {
+            "injections": [item.to_dict() for item in specs],
+            "payload_sha256": payload_sha256,
+        }
+        return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+    def rewrite_dex(self, dex_path, specs, output_dex):
+        """直接改写dex字节码注入，返回注入位置数；无法原地改写时返回None"""
+        try:
+            dex = DexFile.load(dex_path)
+            sites = dex.inject(specs)
+            if sites:
+                with open(output_dex, 'wb') as f:
+                    f.write(dex.build())
+            return sites
+        except Exception as e:
+            print(f"⚠️  {os.path.basename(dex_path)}: 无法原地改写 ({e})，改用smali流程")
+            return None
+
+    def process_dex(self, extract_dir, dex_file, specs, zip_url=None):
+        """处理单个dex，返回用于重新打包的dex路径（失败时为原始dex）"""
+        dex_path = os.path.join(extract_dir, dex_file)
+        smali_dir = os.path.join(self.temp_dir, f"smali_{os.path.splitext(dex_file)[0]}")
+        new_dex_path = os.path.join(self.temp_dir, dex_file)
+        os.makedirs(smali_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(new_dex_path), exist_ok=True)
+        
+        cache = self.workspace_cache
+        if cache:
+            dex_sha256 = file_sha256(dex_path)
+            dex_key = cache.dex_key(dex_sha256, self.injection_spec_hash(specs, zip_url))
+            if cache.get_dex(dex_key, new_dex_path):
+                print(f"♻️  {dex_file}: 输入未变化，使用缓存的重建dex")
+                return new_dex_path
+        
+        # 不需要合并payload时先直接改写dex，省去 baksmali -> smali 往返
+        if self.dex_rewrite and not zip_url:
+            with self.metrics.stage("inject", dex=dex_file, mode="dex") as record:
+                record["bytes_processed"] = os.path.getsize(dex_path)
+                record["sites"] = self.rewrite_dex(dex_path, specs, new_dex_path)
+            if record["sites"]:
+                print(f"⚡ {dex_file}: 已直接改写dex ({record['sites']} 处)")
+                if cache:
+                    cache.put_dex(dex_key, new_dex_path)
+                return new_dex_path
+            if record["sites"] == 0:
+                print(f"⚠️  {dex_file}: 没有可注入的位置，保留原始dex")
+                return dex_path
+        
+        if cache:
+            smali_key = cache.smali_key(dex_sha256)
+            cached_tree = cache.get_smali_tree(smali_key, smali_dir)
+        else:
+            cached_tree = None
+        
+        if cached_tree:
+            print(f"♻️  {dex_file}: 使用缓存的smali树")
+        else:
+            with self.metrics.stage("decompile", dex=dex_file) as record:
+                record["bytes_processed"] = os.path.getsize(dex_path)
+                decompiled = self.decompile_dex(dex_path, smali_dir)
+            if not decompiled:
+                # 如果反编译失败，使用原始dex
+                return dex_path
+
+            # 树生成后立即建立类索引，随树一起缓存
+            self.smali_index(smali_dir)
+            if cache:
+                cache.put_smali_tree(smali_key, smali_dir)
+        
+        # 3. 整合zip文件（如果提供了zip_url）
+        if zip_url:
+            with self.metrics.stage("integrate", dex=dex_file):
+                self.download_and_integrate_zip(zip_url, smali_dir)
+        
+        # 4. 按索引定位目标类，单遍应用全部注入
+        with self.metrics.stage("inject", dex=dex_file) as record:
+            record["sites"] = self.apply_injections(smali_dir, specs)
+        if not record["sites"]:
+            # 如果没找到目标或注入失败，使用原始dex
+            print(f"⚠️  {dex_file}: 没有可注入的位置，保留原始dex")
+            return dex_path
+        
+        # 5. 重新编译修改后的smali
+        with self.metrics.stage("compile", dex=dex_file):
+            compiled = self.compile_smali_to_dex(smali_dir, new_dex_path)
+        if compiled:
+            if cache:
+                cache.put_dex(dex_key, new_dex_path)
+            return new_dex_path
+        # 如果编译失败，使用原始dex
+        return dex_path
+
+    def process_injection(self, apk_path, target_class, injection_code, zip_url=None, payload_mode="merge",
+                          injections=None, output_apk=None):
+        """主处理流程
+
+        payload_mode: "merge" 把payload smali合并进目标dex;
+                      "dex" 把payload单独编译为下一个 classesN.dex (需要原生multidex, minSdk >= 21)
+        injections: InjectionSpec列表，一次运行注入多个类/方法；为None时
+                    在 target_class 的 onCreate 开头注入 injection_code
+        """
+        if injections is None:
+            injections = [InjectionSpec(target_class, "onCreate", injection_code)]
         print("=" * 50)
         print("🚀 开始最终注入流程")
         print("=" * 50)
         
         # 1. 提取原始APK的dex文件
-        extract_dir, dex_files = self.extract_dex_files(apk_path)
+        with self.metrics.stage("extract") as record:
+            record["bytes_processed"] = os.path.getsize(apk_path)
+            extract_dir, dex_files = self.extract_dex_files(apk_path)
         if not extract_dir:
             return None
         
-        # 2. 反编译所有dex文件
-        modified_dex_files = []
-        for dex_file in dex_files:
-            dex_path = os.path.join(extract_dir, dex_file)
-            smali_dir = os.path.join(self.temp_dir, f"smali_{os.path.splitext(dex_file)[0]}")
-            os.makedirs(smali_dir, exist_ok=True)
-            
-            if self.decompile_dex(dex_path, smali_dir):
-                # 3. 整合zip文件（如果提供了zip_url）
-                if zip_url:
-                    self.download_and_integrate_zip(zip_url, smali_dir)
-                
-                # 4. 查找目标smali文件并注入代码
-                smali_file = self.find_target_smali(smali_dir, target_class)
-                if smali_file:
-                    if self.inject_code_proper(smali_file, injection_code):
-                        # 5. 重新编译修改后的smali
-                        new_dex_path = os.path.join(self.temp_dir, dex_file)
-                        if self.compile_smali_to_dex(smali_dir, new_dex_path):
-                            modified_dex_files.append(new_dex_path)
-                        else:
-                            # 如果编译失败，使用原始dex
-                            modified_dex_files.append(dex_path)
-                    else:
-                        # 如果注入失败，使用原始dex
-                        modified_dex_files.append(dex_path)
-                else:
-                    # 如果没找到目标文件，使用原始dex
-                    modified_dex_files.append(dex_path)
-            else:
-                # 如果反编译失败，使用原始dex
-                modified_dex_files.append(dex_path)
+        # payload独立成dex时只需编译一次，目标dex不再合并payload
+        payload_dex = None
+        if zip_url and payload_mode == "dex":
+            with self.metrics.stage("integrate", payload_mode="dex"):
+                payload_dex = self.build_payload_dex(zip_url)
+            if not payload_dex:
+                return None
+            zip_url = None
+        
+        # 只处理定义了目标类的dex，其余原样保留
+        index = self.index_dex_files(extract_dir, dex_files)
+        target_dex_files = []
+        if index:
+            for spec in injections:
+                for dex_file in index.find(spec.target_class):
+                    if dex_file not in target_dex_files:
+                        target_dex_files.append(dex_file)
+        if target_dex_files:
+            print(f"🎯 目标类位于: {', '.join(target_dex_files)}")
+        else:
+            if index:
+                print("⚠️  索引中未找到目标类，将处理全部dex")
+            target_dex_files = dex_files
+
+        # 2-5. 逐个dex执行 反编译 -> 整合 -> 注入 -> 编译，结果按原始顺序收集
+        def run_one(dex_file):
+            if dex_file not in target_dex_files:
+                return os.path.join(extract_dir, dex_file)
+            return self.process_dex(extract_dir, dex_file, injections, zip_url)
+
+        if self.workers > 1 and len(target_dex_files) > 1:
+            print(f"⚡ 并发处理 {len(target_dex_files)} 个dex (workers={self.workers})")
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                modified_dex_files = list(executor.map(run_one, dex_files))
+        else:
+            modified_dex_files = [run_one(dex_file) for dex_file in dex_files]
         
-        # 6. 创建新的APK（保留所有原始文件，只替换dex）
-        output_apk = apk_path.replace('.apk', '_modified.apk')
+        # 只有实际重新编译过的dex需要替换
+        replacements = {
+            dex_file: dex_path
+            for dex_file, dex_path in zip(dex_files, modified_dex_files)
+            if dex_path != os.path.join(extract_dir, dex_file)
+        }
+        additions = []
+        if payload_dex:
+            payload_name = self.next_dex_name(dex_files)
+            additions.append((payload_name, payload_dex))
+            print(f"✅ payload作为 {payload_name} 加入APK")
+        
+        # 6. 创建新的APK（未改动条目原样复制，只重写替换/新增的dex）
+        output_apk = output_apk or apk_path.replace('.apk', '_modified.apk')
         print(f"📦 创建新的APK: {output_apk}")
         
         try:
-            with zipfile.ZipFile(apk_path, 'r') as original_zip:
-                with zipfile.ZipFile(output_apk, 'w', zipfile.ZIP_DEFLATED) as new_zip:
-                    # 复制所有文件，替换修改过的dex
-                    for item in original_zip.infolist():
-                        if item.filename.endswith('.dex'):
-                            # 跳过原始dex文件
-                            continue
-                        else:
-                            # 复制其他所有文件
-                            new_zip.writestr(item, original_zip.read(item.filename))
-                    
-                    # 添加修改后的dex文件
-                    for dex_path in modified_dex_files:
-                        dex_name = os.path.basename(dex_path)
-                        new_zip.write(dex_path, dex_name)
-            
-            print("✅ APK打包完成")
+            with self.metrics.stage("repack") as record:
+                record["bytes_processed"] = os.path.getsize(apk_path)
+                repack_apk(apk_path, output_apk, replacements, additions, self.page_size)
+            print(f"✅ APK打包完成 (替换 {len(replacements)} 个, 新增 {len(additions)} 个条目)")
             
             # 7. 签名APK
-            if not self.create_debug_keystore():
-                return None
-                
-            if not self.sign_apk(output_apk):
+            with self.metrics.stage("sign") as record:
+                record["bytes_processed"] = os.path.getsize(output_apk)
+                signed = self.create_debug_keystore() and self.sign_apk(output_apk)
+            if not signed:
                 return None
             
             print(f"\n🎉 最终注入完成！")
@@ -413,8 +3419,239 @@ class FinalInjector:
             traceback.print_exc()
             return None
 
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+
+def load_manifest(path):
+    """读取JSON/YAML任务清单
+
+    格式: {"defaults": {...}, "jobs": [{...}, ...]} 或直接为任务列表。
+    任务字段: apk, output, target_class, method, injection_code / injection_file,
+             injections (InjectionSpec字典列表), zip_url, payload_mode, name
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if path.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("读取YAML清单需要PyYAML: pip install pyyaml")
+        data = yaml.safe_load(text)
+    else:
+        data = json.loads(text)
+    if isinstance(data, list):
+        data = {"jobs": data}
+    
+    base_dir = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for i, job in enumerate(data.get("jobs") or []):
+        merged = dict(data.get("defaults") or {})
+        merged.update(job)
+        if "apk" not in merged:
+            raise ValueError(f"任务 {i} 缺少 apk")
+        # 相对路径以清单所在目录为基准
+        for key in ("apk", "output", "injection_file"):
+            if merged.get(key):
+                merged[key] = os.path.join(base_dir, os.path.expanduser(merged[key]))
+        merged.setdefault("name", os.path.basename(merged["apk"]))
+        job_injections(merged)
+        jobs.append(merged)
+    if not jobs:
+        raise ValueError("清单中没有任务")
+    return jobs
+
+
+def job_injections(job):
+    """从任务字典构造InjectionSpec列表"""
+    if job.get("injections"):
+        return [InjectionSpec.from_dict(item) for item in job["injections"]]
+    code = job.get("injection_code")
+    if code is None and job.get("injection_file"):
+        with open(job["injection_file"], 'r', encoding='utf-8') as f:
+            code = f.read()
+    if not job.get("target_class") or not code:
+        raise ValueError(f"任务 {job.get('name', job.get('apk'))} 需要 target_class 和 injection_code/injection_file 或 injections")
+    return [InjectionSpec(job["target_class"], job.get("method", "onCreate"), code)]
+
+
+def run_job(job, tool_cache=None, workspace_cache=None, payload_store=None, workers=1,
+            jvm_memory=None, use_jvm_worker=False, signer="builtin", metrics=None, dex_rewrite=True,
+            page_size=ApkWriter.PAGE_SIZE):
+    """执行单个任务，返回结果字典 (不抛异常)"""
+    started = time.time()
+    result = {"name": job["name"], "apk": job["apk"], "output": None, "ok": False, "error": None}
+    injector = FinalInjector(
+        tool_cache=tool_cache, workers=workers, jvm_memory=jvm_memory,
+        use_jvm_worker=use_jvm_worker, workspace_cache=workspace_cache, payload_store=payload_store,
+        signer=signer, metrics=metrics, dex_rewrite=dex_rewrite, page_size=page_size
+    )
+    try:
+        if not os.path.exists(job["apk"]):
+            raise FileNotFoundError(f"APK文件不存在: {job['apk']}")
+        output = injector.process_injection(
+            job["apk"], job.get("target_class"), job.get("injection_code"),
+            zip_url=job.get("zip_url"), payload_mode=job.get("payload_mode", "merge"),
+            injections=job_injections(job), output_apk=job.get("output")
+        )
+        result["output"] = output
+        result["ok"] = output is not None
+        if not output:
+            result["error"] = "注入失败"
+    except Exception as e:
+        result["error"] = str(e)
+    finally:
+        injector.cleanup()
+        result["seconds"] = round(time.time() - started, 3)
+        if metrics and metrics.enabled:
+            result["stages"] = metrics.totals()
+    return result
+
+
+def run_batch(jobs, max_jobs=2, workers=1, jvm_memory=None, use_jvm_worker=False,
+              tool_cache=None, workspace_cache=None, signer="builtin", metrics_options=None, dex_rewrite=True,
+              page_size=ApkWriter.PAGE_SIZE):
+    """批量注入API - 有界并发执行任务，共享工具缓存、工作区缓存和payload构建
+
+    jobs为任务字典列表(见load_manifest)，返回与jobs同序的结果列表。
+    metrics_options: 传给StageMetrics的参数 (sink/profile/trace_memory)，记录中附带任务名
+    """
+    tool_cache = tool_cache or ToolCache()
+    workspace_cache = WorkspaceCache() if workspace_cache is None else workspace_cache
+    payload_store = PayloadStore()
+    try:
+        def run_one(job):
+            metrics = StageMetrics(job=job["name"], **metrics_options) if metrics_options else None
+            return run_job(job, tool_cache, workspace_cache, payload_store, workers, jvm_memory,
+                           use_jvm_worker, signer, metrics, dex_rewrite, page_size)
+
+        with ThreadPoolExecutor(max_workers=max(1, max_jobs)) as executor:
+            return list(executor.map(run_one, jobs))
+    finally:
+        payload_store.cleanup()
+
+
+def print_batch_summary(results):
+    print("\n" + "=" * 50)
+    print("📋 批量任务结果")
+    print("=" * 50)
+    for result in results:
+        status = "✅" if result["ok"] else "❌"
+        detail = result["output"] if result["ok"] else result["error"]
+        print(f"{status} {result['name']} ({result['seconds']:.1f}s): {detail}")
+    failed = sum(1 for result in results if not result["ok"])
+    print(f"\n成功 {len(results) - failed} / {len(results)}")
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="APK注入工具 (不带参数运行进入交互模式)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(sub):
+        sub.add_argument("--workers", type=int, default=1, help="每个APK并发处理的dex数")
+        sub.add_argument("--jvm-memory", help="每个JVM的堆上限，如 512m")
+        sub.add_argument("--jvm-worker", action="store_true", help="使用常驻JVM")
+        sub.add_argument("--mirror", help="工具jar本地镜像目录")
+        sub.add_argument("--offline", action="store_true", help="禁止下载工具")
+        sub.add_argument("--pin", action="append", default=[], metavar="NAME=SHA256",
+                         help="固定工具jar的SHA-256 (可重复)，下载/镜像/缓存不符时拒绝")
+        sub.add_argument("--require-pins", action="store_true", help="拒绝下载未固定SHA-256的工具")
+        sub.add_argument("--signer", choices=["builtin", "jarsigner"], default="builtin",
+                         help="签名方式: 内置v1+v2 或 JDK jarsigner")
+        sub.add_argument("--metrics", help="阶段指标输出 (JSONL，每阶段一行)")
+        sub.add_argument("--profile", default="", help="逗号分隔的阶段名，对其启用cProfile (* 为全部)")
+        sub.add_argument("--trace-memory", default="", help="逗号分隔的阶段名，对其启用tracemalloc")
+        sub.add_argument("--smali-only", action="store_true", help="不直接改写dex，始终走baksmali/smali流程")
+        sub.add_argument("--page-size", type=int, choices=[4, 16], default=16, help=".so 页对齐大小 (KiB)")
+
+    batch = subparsers.add_parser("batch", help="按清单批量注入")
+    batch.add_argument("manifest", help="JSON/YAML任务清单")
+    batch.add_argument("--jobs", type=int, default=2, help="同时处理的APK数")
+    batch.add_argument("--report", help="把结果写入JSON文件")
+    add_common(batch)
+
+    inject = subparsers.add_parser("inject", help="无交互注入单个APK")
+    inject.add_argument("--apk", required=True)
+    inject.add_argument("--target", required=True, help="目标类名")
+    inject.add_argument("--method", default="onCreate", help="方法名或完整签名")
+    code = inject.add_mutually_exclusive_group(required=True)
+    code.add_argument("--code", help="注入的smali代码")
+    code.add_argument("--code-file", help="包含注入代码的文件")
+    inject.add_argument("--zip-url", help="外部payload zip")
+    inject.add_argument("--payload-mode", choices=["merge", "dex"], default="merge")
+    inject.add_argument("--output", help="输出APK路径")
+    add_common(inject)
+    return parser
+
+
+def metrics_options(args):
+    """命令行参数 -> StageMetrics参数，未请求指标时返回None"""
+    profile = [name for name in args.profile.split(',') if name]
+    trace_memory = [name for name in args.trace_memory.split(',') if name]
+    if not (args.metrics or profile or trace_memory):
+        return None
+    profile_dir = os.path.dirname(os.path.abspath(args.metrics)) if args.metrics else None
+    return {"sink": args.metrics, "profile": profile, "trace_memory": trace_memory, "profile_dir": profile_dir}
+
+
+def cli(argv):
+    """无交互命令行入口，返回退出码: 0 全部成功, 1 有任务失败, 2 参数/清单错误"""
+    parser = build_arg_parser()
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit as e:
+        return EXIT_OK if e.code == 0 else EXIT_USAGE
+
+    try:
+        pinned = parse_pins(args.pin)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return EXIT_USAGE
+    tool_cache = ToolCache(mirror_dir=args.mirror, offline=args.offline, pinned=pinned,
+                           require_pinned=args.require_pins)
+    try:
+        if args.command == "batch":
+            jobs = load_manifest(args.manifest)
+        else:
+            jobs = [{
+                "name": os.path.basename(args.apk), "apk": args.apk, "output": args.output,
+                "target_class": args.target, "method": args.method,
+                "injection_code": args.code, "injection_file": args.code_file,
+                "zip_url": args.zip_url, "payload_mode": args.payload_mode,
+            }]
+            job_injections(jobs[0])
+    except (OSError, ValueError) as e:
+        print(f"❌ 任务清单错误: {e}")
+        return EXIT_USAGE
+
+    results = run_batch(
+        jobs, max_jobs=getattr(args, "jobs", 1), workers=args.workers,
+        jvm_memory=args.jvm_memory, use_jvm_worker=args.jvm_worker, tool_cache=tool_cache,
+        signer=args.signer, metrics_options=metrics_options(args), dex_rewrite=not args.smali_only,
+        page_size=args.page_size * 1024
+    )
+    print_batch_summary(results)
+    if getattr(args, "report", None):
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return EXIT_OK if all(result["ok"] for result in results) else EXIT_FAILED
+
+
 def main():
-    injector = FinalInjector()
+    injector = FinalInjector(
+        workers=int(os.environ.get("FINAL_INJECTOR_WORKERS", "1")),
+        jvm_memory=os.environ.get("FINAL_INJECTOR_JVM_MEMORY"),
+        use_jvm_worker=os.environ.get("FINAL_INJECTOR_JVM_WORKER") == "1",
+        signer=os.environ.get("FINAL_INJECTOR_SIGNER", "builtin"),
+        dex_rewrite=os.environ.get("FINAL_INJECTOR_SMALI_ONLY") != "1",
+        page_size=int(os.environ.get("FINAL_INJECTOR_PAGE_SIZE_KB", "16")) * 1024,
+        metrics=StageMetrics(sink=os.environ.get("FINAL_INJECTOR_METRICS"),
+                             enabled=bool(os.environ.get("FINAL_INJECTOR_METRICS"))),
+        workspace_cache=WorkspaceCache(
+            max_bytes=int(os.environ.get("FINAL_INJECTOR_CACHE_MAX_MB", "2048")) * 1024 * 1024
+        )
+    )
     
     try:
         print("=== 最终APK注入工具 ===")
@@ -430,8 +3667,8 @@ def main():
         
         zip_url = "https://github.com/18680500078/MD/raw/main/classes.zip"
         
-        injection_code = """invoke-direct {v0, p0}, Lcom/clickwindow/rb/CustomDialog;-><init>(Landroid/content/Context;)V
-new-instance v0, Lcom/clickwindow/rb/CustomDialog;"""
+        injection_code = """new-instance v0, Lcom/clickwindow/rb/CustomDialog;
+invoke-direct {v0, p0}, Lcom/clickwindow/rb/CustomDialog;-><init>(Landroid/content/Context;)V"""
         
         print(f"\n📋 配置信息:")
         print(f"目标APK: {apk_path}")
@@ -448,7 +3685,9 @@ new-instance v0, Lcom/clickwindow/rb/CustomDialog;"""
             print("操作取消")
             return
         
-        result = injector.process_injection(apk_path, target_class, injection_code, zip_url)
+        result = injector.process_injection(apk_path, target_class, injection_code, zip_url, payload_mode="dex")
+        
+        injector.metrics.print_summary()
         
         if result:
             print("\n✅ 注入成功！")
@@ -468,29 +3707,24 @@ new-instance v0, Lcom/clickwindow/rb/CustomDialog;"""
         injector.cleanup()
 
 if __name__ == "__main__":
-    # 检查必要工具
-    required_tools = ["java", "keytool", "jarsigner"]
-    missing_tools = []
-    
-    for tool in required_tools:
-        try:
-            subprocess.run([tool, "--version"], capture_output=True)
-        except:
-            missing_tools.append(tool)
+    # 检查必要工具 (只查PATH，不为每个工具启动一次JVM)；内置签名器不需要keytool/jarsigner，
+    # 直接改写dex不需要java，只有强制smali流程时才必须有java
+    smali_only = os.environ.get("FINAL_INJECTOR_SMALI_ONLY") == "1" or "--smali-only" in sys.argv
+    required_tools = ["java"] if smali_only else []
+    if shutil.which("java") is None and not smali_only:
+        print("⚠️  未找到java: 只能直接改写dex，smali回退和payload编译不可用")
+    if os.environ.get("FINAL_INJECTOR_SIGNER") == "jarsigner" or "jarsigner" in sys.argv:
+        required_tools += ["keytool", "jarsigner"]
+    missing_tools = [tool for tool in required_tools if shutil.which(tool) is None]
     
-if missing_tools:
-    print("❌ 缺少必要工具:")
-    for tool in missing_tools:
-        print(f"  - {tool}")
-    print("\n请安装缺少的工具后再运行脚本")
-    print("安装java: pkg install openjdk-17")
-else:
-    # 检查requests模块
-    try:
-        import requests
-    except ImportError:
-        print("❌ 缺少requests模块")
-        print("安装requests: pip install requests")
-        sys.exit(1)
+    if missing_tools:
+        print("❌ 缺少必要工具:")
+        for tool in missing_tools:
+            print(f"  - {tool}")
+        print("\n请安装缺少的工具后再运行脚本")
+        print("安装java: pkg install openjdk-17")
+        sys.exit(EXIT_USAGE)
     
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1:
+        sys.exit(cli(sys.argv[1:]))
+    main()
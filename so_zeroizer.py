@@ -3,6 +3,22 @@ import sys
 import os
 import mmap
 import time
+import re
+import codecs
+import argparse
+import json
+import hashlib
+import bisect
+import heapq
+import struct
+import threading
+import contextlib
+import shutil
+import zipfile
+import fnmatch
+import tempfile
+import glob
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 
 class Colors:
@@ -141,23 +157,32 @@ class ArtDisplay:
         ArtDisplay.show_menu()
 
 class ArtisticProgress:
-    """艺术进度条类"""
-    def __init__(self, total, length=40):
+    """艺术进度条类 - 按已扫描字节计算进度，重绘频率受 min_interval 限制"""
+    def __init__(self, total, length=40, min_interval=0.25, enabled=True):
         self.total = total
         self.length = length
+        self.min_interval = min_interval
+        self.enabled = enabled
         self.current = 0
         self.start_time = time.time()
+        self.last_draw = 0
         self.art_frames = ['🌑', '🌒', '🌓', '🌔', '🌕', '🌖', '🌗', '🌘']
         self.frame_index = 0
         
     def update(self, increment=1, found_count=0):
-        """更新艺术进度条"""
+        """更新艺术进度条 (increment 为新扫描的字节数)"""
         self.current += increment
-        percent = min(100, (self.current / self.total) * 100)
+        if not self.enabled:
+            return
+        now = time.time()
+        if now - self.last_draw < self.min_interval and self.current < self.total:
+            return
+        self.last_draw = now
+        percent = min(100, (self.current / self.total) * 100) if self.total else 100
         
         # 计算统计信息
-        elapsed = time.time() - self.start_time
-        speed = self.current / elapsed if elapsed > 0 else 0
+        elapsed = now - self.start_time
+        speed = self.current / 1024 / 1024 / elapsed if elapsed > 0 else 0
         
         # 艺术动画帧
         art_frame = self.art_frames[self.frame_index]
@@ -171,7 +196,7 @@ class ArtisticProgress:
         sys.stdout.write('\r\033[K')
         sys.stdout.write(
             f"{art_frame} {Colors.CYAN}{bar} {Colors.MAGENTA}{percent:5.1f}% "
-            f"{Colors.YELLOW}│ {Colors.BLUE}🚀 {speed:.1f}项/秒 "
+            f"{Colors.YELLOW}│ {Colors.BLUE}🚀 {speed:.1f}MB/秒 "
             f"{Colors.YELLOW}│ {Colors.GREEN}🎯 {found_count}处{Colors.END}"
         )
         sys.stdout.flush()
@@ -179,28 +204,761 @@ class ArtisticProgress:
     def complete(self, total_found):
         """完成艺术进度条"""
         elapsed = time.time() - self.start_time
+        if not self.enabled:
+            print(f"✅ 完成: 修改 {total_found} 处, 耗时 {elapsed:.2f}s")
+            return
         sys.stdout.write('\r\033[K')
         
         print(f"{Colors.GREEN}✅ {Colors.BOLD}广告去除完成!{Colors.END}")
         print(f"{Colors.CYAN}   ⏱️  耗时: {elapsed:.1f}s {Colors.YELLOW}│ 🎯 修改: {total_found}处{Colors.END}")
         print(f"{Colors.MAGENTA}   ✨ 辉少专用广告去除!{Colors.END}")
 
-class SOZeroizer:
-    def __init__(self):
-        self.so_file_path = "/storage/emulated/0/MT2/apks/libapp.so"
-        self.strings_to_zero = [
-            b"playmoviead", b"movie_ad", b"recommend_page",
-            b"loading_page", b"appicon_9", b"index_page_promt",
-            b"product_banner", b"home_suspend_", b"bannerImageUrl",
-            b"/product", b"/darknet", b"/ai", b"/square",
-            b"/SharePage", b"/domain/app.version",b"jumpUrl",b"announcement"
+class PatternMatcher:
+    """多模式匹配器 - 一次扫描找出全部模式
+
+    重叠规则: 长者优先，等长时偏移小者优先；被选中的区间互不重叠。
+    模式较少时逐个用 find (C层memchr，最快)；模式多时编译为一个前缀树正则，
+    整个文件只扫一遍，耗时随文件大小增长而不随模式数量增长。
+    """
+    FIND_LIMIT = 96
+
+    def __init__(self, patterns):
+        self.patterns = []
+        for pattern in patterns:
+            if not pattern:
+                raise ValueError("模式不能为空")
+            if pattern not in self.patterns:
+                self.patterns.append(bytes(pattern))
+        self.max_len = max((len(pattern) for pattern in self.patterns), default=0)
+        self.trie = {}
+        for index, pattern in enumerate(self.patterns):
+            node = self.trie
+            for byte in pattern:
+                node = node.setdefault(byte, {})
+            node[None] = index
+        self.regex = None
+        if len(self.patterns) > self.FIND_LIMIT:
+            self.regex = re.compile(self._trie_regex(self.trie))
+
+    @classmethod
+    def _trie_regex(cls, node):
+        branches = [
+            re.escape(bytes([byte])) + cls._trie_regex(child)
+            for byte, child in sorted((k, v) for k, v in node.items() if k is not None)
+        ]
+        if not branches:
+            return b''
+        body = branches[0] if len(branches) == 1 else b'(?:' + b'|'.join(branches) + b')'
+        # 贪婪的可选分支保证在同一位置先尝试更长的模式
+        return b'(?:' + body + b')?' if None in node else body
+
+    def spec(self):
+        """可pickle的构造参数，供进程池中的工作进程重建匹配器"""
+        return ("patterns", self.patterns)
+
+    def patterns_at(self, data, pos, end):
+        """返回在pos处出现的全部模式下标"""
+        node = self.trie
+        found = []
+        for i in range(pos, min(pos + self.max_len, end)):
+            node = node.get(data[i])
+            if node is None:
+                break
+            if None in node:
+                found.append(node[None])
+        return found
+
+    def _find_pattern(self, data, index, start, end):
+        pattern = self.patterns[index]
+        pos = data.find(pattern, start, end)
+        while pos != -1:
+            yield pos, len(pattern), index
+            pos = data.find(pattern, pos + 1, end)
+
+    def candidates(self, data, start=0, end=None):
+        """产出全部出现位置 (offset, length, pattern_index)，包括互相重叠的
+
+        两条路径产出完全相同的序列: 按 (offset, length) 升序，无重复。
+        """
+        end = len(data) if end is None else end
+        if self.regex is None:
+            yield from heapq.merge(*(
+                self._find_pattern(data, index, start, end) for index in range(len(self.patterns))))
+            return
+
+        # 正则只负责快速定位"这里有命中"；命中区间内的每个位置再用前缀树逐一确认，
+        # 从而不漏掉与命中重叠的其他模式。checked只增不减，每个位置只确认一次，
+        # 产出与find路径相同 (不含重复项)
+        checked = start
+        for match in self.regex.finditer(data, start, end):
+            pos = max(match.start(), checked)
+            limit = max(match.end(), checked)
+            while pos < limit:
+                for index in self.patterns_at(data, pos, end):
+                    yield pos, len(self.patterns[index]), index
+                    limit = max(limit, pos + len(self.patterns[index]))
+                pos += 1
+            checked = limit
+
+    @staticmethod
+    def resolve(candidates):
+        """按重叠规则挑选命中，返回按偏移排序的 (offset, length, index) 列表"""
+        ordered = sorted(candidates, key=lambda item: (-item[1], item[0]))
+        starts, chosen = [], []
+        for offset, length, index in ordered:
+            slot = bisect.bisect_right(starts, offset)
+            if slot > 0 and chosen[slot - 1][0] + chosen[slot - 1][1] > offset:
+                continue
+            if slot < len(starts) and starts[slot] < offset + length:
+                continue
+            starts.insert(slot, offset)
+            chosen.insert(slot, (offset, length, index))
+        return chosen
+
+    def chunk_candidates(self, data, start, end, limit=None):
+        """扫描 [start, end) 并向后多读 max_len-1 字节 (不超过limit)，只返回起点在块内的命中"""
+        scan_end = min(end + self.max_len - 1, len(data) if limit is None else limit)
+        return [item for item in self.candidates(data, start, scan_end) if item[0] < end]
+
+    def find_all(self, data, start=0, end=None, chunk_size=None, on_progress=None):
+        """chunk_size/on_progress: 分块扫描，每块结束后以本块字节数回调 on_progress"""
+        end = len(data) if end is None else end
+        if not chunk_size:
+            matches = self.resolve(self.candidates(data, start, end))
+            if on_progress:
+                on_progress(end - start)
+            return matches
+        candidates = []
+        for chunk_start in range(start, end, chunk_size):
+            chunk_end = min(chunk_start + chunk_size, end)
+            candidates.extend(self.chunk_candidates(data, chunk_start, chunk_end, end))
+            if on_progress:
+                on_progress(chunk_end - chunk_start)
+        return self.resolve(candidates)
+
+    def find_in_ranges(self, data, ranges, chunk_size=None, on_progress=None):
+        """只在给定的 [(start, end), ...] 区间内查找，命中不会跨越区间边界"""
+        matches = []
+        for start, end in ranges:
+            matches.extend(self.find_all(data, start, end, chunk_size, on_progress))
+        return sorted(matches)
+
+    def scan_file(self, path, workers=1, chunk_size=16 * 1024 * 1024, on_progress=None, ranges=None):
+        """多进程分块扫描文件，结果与 find_all / find_in_ranges 完全一致
+
+        每块向后多读 max_len-1 字节，保证跨块边界的命中不丢；只保留起点落在本块内的命中，
+        因此合并时无需去重。写回仍由调用方单线程完成。
+        """
+        size = os.path.getsize(path)
+        ranges = ranges if ranges is not None else [(0, size)]
+        if workers <= 1 or sum(end - start for start, end in ranges) <= chunk_size or not self.max_len:
+            with open(path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return self.find_in_ranges(mm, ranges, chunk_size, on_progress)
+
+        chunks = [
+            (chunk_start, min(chunk_start + chunk_size, end), end)
+            for start, end in ranges for chunk_start in range(start, end, chunk_size)
         ]
+        candidates = []
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            futures = {
+                executor.submit(_scan_chunk, self.spec(), path, start, end, limit): end - start
+                for start, end, limit in chunks
+            }
+            for future in as_completed(futures):
+                candidates.extend(future.result())
+                if on_progress:
+                    on_progress(futures[future])
+        return self.resolve(candidates)
+
+
+class Rule:
+    """一条匹配规则
+
+    种类 (kind):
+      literal  - 字面字符串，支持 \\xNN 转义；utf16=True 时同时匹配UTF-16LE形式
+      hex      - 十六进制字节，?? 匹配任意字节，半字节掩码如 4? / ?a
+      wildcard - 文本通配: ? 匹配一个字节，* 匹配0~max_wildcard个非NUL字节
+      regex    - 字节正则；max_length 为命中长度上限 (超出部分截断，也是分块扫描时的重叠量)
+    动作 (action): zero 置零，replace 定长替换 (短于命中时补\\0)，count 只计数
+    """
+    KINDS = ("literal", "hex", "wildcard", "regex")
+    ACTIONS = ("zero", "replace", "count")
+
+    def __init__(self, kind, value, action="zero", name=None, replacement=None,
+                 utf16=False, max_wildcard=16, max_length=256):
+        if kind not in self.KINDS:
+            raise ValueError(f"未知的规则类型: {kind}")
+        if action not in self.ACTIONS:
+            raise ValueError(f"未知的规则动作: {action}")
+        if action == "replace" and replacement is None:
+            raise ValueError(f"规则 {name or value} 缺少 replacement")
+        self.kind = kind
+        self.value = value
+        self.action = action
+        self.name = name or value
+        self.replacement = replacement
+        self.utf16 = utf16
+        self.max_wildcard = max_wildcard
+        self.max_length = max_length
+        self.replacement_bytes = parse_pattern(replacement) if replacement is not None else None
+        self.regex_source, self.max_len = self._compile()
+        self.regex = re.compile(self.regex_source)
+
+    @classmethod
+    def from_dict(cls, data):
+        kinds = [kind for kind in cls.KINDS if kind in data]
+        if len(kinds) != 1:
+            raise ValueError(f"规则需要且只能有一个 {'/'.join(cls.KINDS)} 字段: {data}")
+        options = {key: data[key] for key in ("action", "name", "replacement", "utf16", "max_wildcard", "max_length")
+                   if key in data}
+        return cls(kinds[0], data[kinds[0]], **options)
+
+    def to_dict(self):
+        data = {self.kind: self.value, "action": self.action, "name": self.name}
+        if self.replacement is not None:
+            data["replacement"] = self.replacement
+        if self.utf16:
+            data["utf16"] = True
+        if self.kind == "wildcard":
+            data["max_wildcard"] = self.max_wildcard
+        if self.kind == "regex":
+            data["max_length"] = self.max_length
+        return data
+
+    def literals(self):
+        """literal规则展开后的全部字节串"""
+        text = parse_pattern(self.value)
+        variants = [text]
+        if self.utf16:
+            variants.append(text.decode('utf-8', 'surrogateescape').encode('utf-16-le', 'surrogatepass'))
+        return variants
+
+    def _compile(self):
+        """返回 (字节正则源码, 最大命中长度)"""
+        if self.kind == "literal":
+            variants = self.literals()
+            return b'|'.join(re.escape(variant) for variant in variants), max(len(variant) for variant in variants)
+        if self.kind == "hex":
+            tokens = self.value.split()
+            if len(tokens) == 1 and len(tokens[0]) > 2:
+                tokens = [tokens[0][i:i + 2] for i in range(0, len(tokens[0]), 2)]
+            parts = []
+            for token in tokens:
+                if len(token) != 2:
+                    raise ValueError(f"无效的十六进制字节: {token}")
+                values = [value for value in range(256) if all(
+                    digit == '?' or int(digit, 16) == (value >> shift) & 0xf
+                    for digit, shift in zip(token.lower(), (4, 0))
+                )]
+                if len(values) == 256:
+                    parts.append(b'[\\x00-\\xff]')
+                elif len(values) == 1:
+                    parts.append(re.escape(bytes(values)))
+                else:
+                    parts.append(b'[' + b''.join(b'\\x%02x' % value for value in values) + b']')
+            return b''.join(parts), len(tokens)
+        if self.kind == "wildcard":
+            parts, length = [], 0
+            for piece in re.split(r'([?*])', self.value):
+                if piece == '?':
+                    parts.append(b'[\\x00-\\xff]')
+                    length += 1
+                elif piece == '*':
+                    parts.append(b'[^\\x00]{0,%d}' % self.max_wildcard)
+                    length += self.max_wildcard
+                elif piece:
+                    literal = parse_pattern(piece)
+                    parts.append(re.escape(literal))
+                    length += len(literal)
+            return b''.join(parts), length
+        source = self.value.encode('utf-8')
+        re.compile(source)
+        return source, self.max_length
+
+    def replacement_for(self, original):
+        """命中字节 -> 写入的字节 (count动作返回None)"""
+        if self.action == "count":
+            return None
+        if self.action == "zero":
+            return b'\x00' * len(original)
+        if len(self.replacement_bytes) > len(original):
+            raise ValueError(f"规则 {self.name} 的替换内容比命中 ({len(original)} 字节) 长")
+        return self.replacement_bytes.ljust(len(original), b'\x00')
+
+
+class RuleSet:
+    """规则集合 - 来自规则文件 (JSON) 或旧式的字面模式列表"""
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        if not self.rules:
+            raise ValueError("规则集合为空")
+
+    @classmethod
+    def from_patterns(cls, patterns):
+        """字面模式列表 -> 全部为置零动作的literal规则"""
+        return cls(Rule("literal", pattern.decode('latin-1').encode('unicode_escape').decode('ascii'),
+                        name=pattern.decode('utf-8', 'backslashreplace'))
+                   for pattern in patterns)
+
+    @classmethod
+    def from_dicts(cls, items):
+        return cls(Rule.from_dict(item) for item in items)
+
+    @classmethod
+    def load(cls, path):
+        """规则文件: {"rules": [...]} 或直接是规则列表"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls.from_dicts(data["rules"] if isinstance(data, dict) else data)
+
+    def to_dicts(self):
+        return [rule.to_dict() for rule in self.rules]
+
+    def matcher(self):
+        return RuleMatcher(self)
+
+
+class RuleMatcher(PatternMatcher):
+    """把整个规则集合编译成一个匹配器，单遍扫描
+
+    全部为literal规则时直接复用 PatternMatcher 的快速路径；否则所有规则合成一个正则定位命中，
+    命中区间内再逐位置用各规则自己的正则确认是哪条规则，重叠处理与 PatternMatcher 相同 (长者优先)。
+    candidates 产出的下标为规则下标。
+    """
+
+    def __init__(self, rule_set):
+        self.rule_set = rule_set
+        rules = rule_set.rules
+        self.literal_only = all(rule.kind == "literal" for rule in rules)
+        if self.literal_only:
+            patterns, self.pattern_rules = [], []
+            for index, rule in enumerate(rules):
+                for literal in rule.literals():
+                    if literal not in patterns:
+                        patterns.append(literal)
+                        self.pattern_rules.append(index)
+            super().__init__(patterns)
+            return
+        self.patterns = []
+        self.max_len = max(rule.max_len for rule in rules)
+        # 用非捕获分组: 带捕获分组的分支会让sre放弃首字节预筛选，慢一个数量级
+        self.regex = re.compile(b'|'.join(b'(?:%s)' % rule.regex_source for rule in rules))
+
+    def spec(self):
+        return ("rules", self.rule_set.to_dicts())
+
+    def rules_at(self, data, pos, end):
+        """pos处各规则的(贪婪)命中 [(length, rule_index)]
+
+        命中长度以 max_len 为上限 (endpos截断)，保证分块扫描与整体扫描结果一致。
+        """
+        found = []
+        for index, rule in enumerate(self.rule_set.rules):
+            match = rule.regex.match(data, pos, min(end, pos + rule.max_len))
+            if match and match.end() > pos:
+                found.append((match.end() - pos, index))
+        return found
+
+    def candidates(self, data, start=0, end=None):
+        if self.literal_only:
+            for offset, length, index in super().candidates(data, start, end):
+                yield offset, length, self.pattern_rules[index]
+            return
+        end = len(data) if end is None else end
+        checked = start
+        for match in self.regex.finditer(data, start, end):
+            pos = max(match.start(), checked)
+            limit = max(match.end(), pos + 1)
+            while pos < limit:
+                for length, index in self.rules_at(data, pos, end):
+                    yield pos, length, index
+                    limit = max(limit, pos + length)
+                pos += 1
+            checked = limit
+
+
+_MATCHER_CACHE = {}
+
+
+def matcher_from_spec(spec):
+    key = json.dumps([spec[0], [item.hex() if isinstance(item, bytes) else item for item in spec[1]]],
+                     sort_keys=True)
+    matcher = _MATCHER_CACHE.get(key)
+    if matcher is None:
+        kind, items = spec
+        matcher = PatternMatcher(items) if kind == "patterns" else RuleSet.from_dicts(items).matcher()
+        _MATCHER_CACHE[key] = matcher
+    return matcher
+
+
+def _scan_chunk(spec, path, start, end, limit=None):
+    """进程池任务: 返回起点在 [start, end) 内的候选命中 (扫描不越过limit)"""
+    matcher = matcher_from_spec(spec)
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return matcher.chunk_candidates(mm, start, end, limit)
+
+
+class FileView:
+    """按需 pread 的只读文件视图，提供 ElfFile 用到的切片/下标/find，不映射整个文件"""
+
+    def __init__(self, fd, size=None):
+        self.fd = fd
+        self.size = os.fstat(fd).st_size if size is None else size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, _ = key.indices(self.size)
+            return os.pread(self.fd, max(0, stop - start), start)
+        if key < 0:
+            key += self.size
+        if not 0 <= key < self.size:
+            raise IndexError(key)
+        return os.pread(self.fd, 1, key)[0]
+
+    def find(self, sub, start=0, block=4096):
+        pos = start
+        while pos < self.size:
+            data = os.pread(self.fd, block + len(sub) - 1, pos)
+            found = data.find(sub)
+            if found != -1:
+                return pos + found
+            pos += block
+        return -1
+
+
+class ElfFile:
+    """最小ELF解析 - 节头表、程序头表和动态符号表 (32/64位，大小端均支持)
+
+    用于把扫描限制在字符串实际所在的节，如 .rodata/.dynstr，或 Flutter 的 Dart 快照数据。
+    """
+    SHT_NOBITS = 8
+    SHT_DYNSYM = 11
+    PT_LOAD = 1
+    SHN_XINDEX = 0xffff
+    DART_SNAPSHOT_SYMBOLS = ("_kDartVmSnapshotData", "_kDartIsolateSnapshotData")
+
+    def __init__(self, data):
+        if data[:4] != b'\x7fELF':
+            raise ValueError("不是ELF文件")
+        if data[4] not in (1, 2) or data[5] not in (1, 2):
+            raise ValueError("不支持的ELF类型")
+        self.data = data
+        self.is_64 = data[4] == 2
+        self.endian = '<' if data[5] == 1 else '>'
+        self.sections = []
+        self.segments = []
+        self._parse()
+
+    def _unpack(self, fmt, offset):
+        fmt = self.endian + fmt
+        return struct.unpack(fmt, self.data[offset:offset + struct.calcsize(fmt)])
+
+    def _parse(self):
+        if self.is_64:
+            phoff, shoff = self._unpack('QQ', 0x20)
+            phentsize, phnum, shentsize, shnum, shstrndx = self._unpack('5H', 0x36)
+        else:
+            phoff, shoff = self._unpack('II', 0x1c)
+            phentsize, phnum, shentsize, shnum, shstrndx = self._unpack('5H', 0x2a)
+
+        for i in range(phnum):
+            offset = phoff + i * phentsize
+            if self.is_64:
+                p_type, _, p_offset, p_vaddr, _, p_filesz = self._unpack('IIQQQQ', offset)
+            else:
+                p_type, p_offset, p_vaddr, _, p_filesz = self._unpack('5I', offset)
+            self.segments.append({"type": p_type, "offset": p_offset, "vaddr": p_vaddr, "filesz": p_filesz})
+
+        if not shoff:
+            return
+        fmt = 'IIQQQQI' if self.is_64 else '7I'
+
+        def section_header(index):
+            name, sh_type, _, addr, sh_offset, size, link = self._unpack(fmt, shoff + index * shentsize)
+            return name, sh_type, addr, sh_offset, size, link
+
+        # 节数量/字符串表下标过大时，真实值存放在第0个节头里
+        first = section_header(0)
+        if shnum == 0:
+            shnum = first[4]
+        if shstrndx == self.SHN_XINDEX:
+            shstrndx = first[5]
+        headers = [first] + [section_header(i) for i in range(1, shnum)]
+
+        names_offset = headers[shstrndx][3] if shstrndx < len(headers) else None
+        for name, sh_type, addr, sh_offset, size, link in headers:
+            self.sections.append({
+                "name": self._cstring(names_offset + name) if names_offset is not None else "",
+                "type": sh_type, "addr": addr, "offset": sh_offset, "size": size, "link": link,
+            })
+
+    def _cstring(self, offset):
+        end = self.data.find(b'\0', offset)
+        return bytes(self.data[offset:end]).decode('utf-8', 'replace')
+
+    def section(self, name):
+        return next((section for section in self.sections if section["name"] == name), None)
+
+    def vaddr_to_offset(self, vaddr):
+        for segment in self.segments:
+            if segment["type"] == self.PT_LOAD and segment["vaddr"] <= vaddr < segment["vaddr"] + segment["filesz"]:
+                return vaddr - segment["vaddr"] + segment["offset"]
+        return None
+
+    def symbols(self):
+        """遍历 .dynsym，产出 (名称, 虚拟地址, 大小)"""
+        for section in self.sections:
+            if section["type"] != self.SHT_DYNSYM:
+                continue
+            strtab = self.sections[section["link"]]["offset"]
+            entsize = 24 if self.is_64 else 16
+            for offset in range(section["offset"], section["offset"] + section["size"], entsize):
+                if self.is_64:
+                    name, _, _, _, value, size = self._unpack('IBBHQQ', offset)
+                else:
+                    name, value, size = self._unpack('III', offset)
+                yield self._cstring(strtab + name), value, size
+
+    def ranges(self, selectors):
+        """选择器 -> 合并后的文件区间 [(start, end), ...]
+
+        选择器: 节名 (如 .rodata)，sym:符号名，或 dart (Dart VM/Isolate 快照数据)。
+        """
+        wanted_symbols, required_symbols = set(), set()
+        ranges = []
+        for selector in selectors:
+            if selector == "dart":
+                wanted_symbols.update(self.DART_SNAPSHOT_SYMBOLS)
+            elif selector.startswith("sym:"):
+                wanted_symbols.add(selector[4:])
+                required_symbols.add(selector[4:])
+            else:
+                section = self.section(selector)
+                if section is None:
+                    raise ValueError(f"ELF中没有节: {selector}")
+                if section["type"] != self.SHT_NOBITS and section["size"]:
+                    ranges.append((section["offset"], section["offset"] + section["size"]))
+
+        found = set()
+        for name, value, size in self.symbols() if wanted_symbols else ():
+            if name in wanted_symbols and size:
+                offset = self.vaddr_to_offset(value)
+                if offset is not None:
+                    ranges.append((offset, min(offset + size, len(self.data))))
+                    found.add(name)
+        missing = required_symbols - found
+        if "dart" in selectors and not found & set(self.DART_SNAPSHOT_SYMBOLS):
+            missing.add("/".join(self.DART_SNAPSHOT_SYMBOLS))
+        if missing:
+            raise ValueError(f"ELF中没有符号: {', '.join(sorted(missing))}")
+
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+
+DEFAULT_SO_PATH = "/storage/emulated/0/MT2/apks/libapp.so"
+DEFAULT_PATTERNS = [
+    b"playmoviead", b"movie_ad", b"recommend_page",
+    b"loading_page", b"appicon_9", b"index_page_promt",
+    b"product_banner", b"home_suspend_", b"bannerImageUrl",
+    b"/product", b"/darknet", b"/ai", b"/square",
+    b"/SharePage", b"/domain/app.version",b"jumpUrl",b"announcement"
+]
+
+# 进度条按块刷新，块越小刷新越细
+PROGRESS_CHUNK = 4 * 1024 * 1024
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+PLAN_VERSION = 2
+
+
+def file_sha256(path):
+    """流式计算文件SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_json_atomic(path, data):
+    """先写临时文件并fsync，再原子替换，中途崩溃不会留下半个文件"""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_plan(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        plan = json.load(f)
+    if plan.get("version") != PLAN_VERSION:
+        raise ValueError(f"不支持的补丁计划版本: {plan.get('version')}")
+    return plan
+
+
+class UndoJournal:
+    """稀疏撤销日志 - 只记录被修改区间的原始字节，代替整文件备份
+
+    每次修改追加一代 (generation): 写文件前先以 pending 状态落盘，写完后再记录修改后的哈希。
+    中途崩溃时日志里仍有全部原始字节，restore 可以恢复。日志路径为 <文件>.undo.json。
+    """
+    VERSION = 1
+
+    def __init__(self, target_path):
+        self.target_path = target_path
+        self.path = target_path + ".undo.json"
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            self.data = {"version": self.VERSION, "file": os.path.basename(target_path), "generations": []}
+        if self.data.get("version") != self.VERSION:
+            raise ValueError(f"不支持的撤销日志版本: {self.data.get('version')}")
+
+    @property
+    def generations(self):
+        return self.data["generations"]
+
+    def begin(self, pre_sha256, plan):
+        """写入前调用: 保存每个补丁区间的原始字节"""
+        if self.generations and self.generations[-1]["post_sha256"] is None:
+            raise ValueError("上次修改未完成，请先执行 --restore 恢复")
+        self.generations.append({
+            "pre_sha256": pre_sha256,
+            "post_sha256": None,
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "ranges": [{"offset": patch["offset"], "original": patch["original"]} for patch in plan["patches"]],
+        })
+        write_json_atomic(self.path, self.data)
+
+    def commit(self, post_sha256):
+        """写入并flush之后调用"""
+        self.generations[-1]["post_sha256"] = post_sha256
+        write_json_atomic(self.path, self.data)
+
+    def restore(self, everything=False):
+        """撤销最近一代 (everything=True 时撤销全部)，返回恢复的代数"""
+        restored = 0
+        while self.generations:
+            generation = self.generations[-1]
+            with open(self.target_path, 'r+b') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE) as mm:
+                    # pending的一代可能只写了一部分，原始字节写回是幂等的，无需校验
+                    current = hashlib.sha256(mm).hexdigest()
+                    if generation["post_sha256"] and current != generation["post_sha256"]:
+                        raise ValueError("文件在修改后又被改动过，无法按日志恢复")
+                    for item in generation["ranges"]:
+                        original = bytes.fromhex(item["original"])
+                        mm[item["offset"]:item["offset"] + len(original)] = original
+                    mm.flush()
+                    if generation["pre_sha256"] and hashlib.sha256(mm).hexdigest() != generation["pre_sha256"]:
+                        raise ValueError("恢复后的哈希与修改前不一致")
+            self.generations.pop()
+            restored += 1
+            if self.generations:
+                write_json_atomic(self.path, self.data)
+            else:
+                os.remove(self.path)
+            if not everything:
+                break
+        return restored
+
+
+class PatchManifest:
+    """已处理文件清单 - 按SHA-256记录每个文件的处理结果和补丁计划
+
+    处理后的文件哈希记为 output，再次遇到直接跳过；
+    处理前的哈希记为 input，再次遇到同样内容的文件时直接套用缓存的计划，无需扫描。
+    计划文件保存在清单旁的 <清单名>.plans/ 目录中。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.plan_dir = path + ".plans"
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            self.data = {"version": 1, "entries": {}}
+
+    def lookup(self, sha256, rule_key):
+        return self.data["entries"].get(f"{sha256}:{rule_key}")
+
+    def load_plan(self, entry):
+        return load_plan(os.path.join(self.plan_dir, entry["plan"]))
+
+    def record(self, plan, output_sha256, source=None):
+        """记录一次成功的处理并持久化计划"""
+        input_sha256, rule_key = plan["file_sha256"], plan["rule_key"]
+        plan_name = f"{input_sha256}-{rule_key[:16]}.json"
+        with self._lock:
+            os.makedirs(self.plan_dir, exist_ok=True)
+            write_json_atomic(os.path.join(self.plan_dir, plan_name), plan)
+            common = {"rule_key": rule_key, "plan": plan_name, "changes": len(plan["patches"]),
+                      "source": source, "time": datetime.now().isoformat(timespec="seconds")}
+            entries = self.data["entries"]
+            entries[f"{input_sha256}:{rule_key}"] = dict(common, role="input", output_sha256=output_sha256)
+            entries[f"{output_sha256}:{rule_key}"] = dict(common, role="output", input_sha256=input_sha256)
+            write_json_atomic(self.path, self.data)
+
+
+class SOZeroizer:
+    def __init__(self, metrics=None, workers=1, chunk_size=16 * 1024 * 1024,
+                 so_file_path=None, patterns=None, interactive=True, progress=True, sections=None,
+                 manifest=None, backup="journal", rules=None, window_size=None):
+        """metrics: 可选的 cs.StageMetrics，记录 scan/patch 两个阶段;
+        workers: 扫描进程数 (>1 时大文件分块并行扫描); chunk_size: 每块字节数;
+        interactive: False 时不做任何动画停顿; progress: 是否绘制进度条;
+        sections: ELF节/符号选择器 (见 ElfFile.ranges)，只扫描和修改这些区间;
+        manifest: PatchManifest，跳过已处理的文件并复用缓存的补丁计划;
+        backup: "journal" 稀疏撤销日志，"copy" 整文件 .bak 备份，"none" 不备份;
+        rules: RuleSet，给出时代替 strings_to_zero (支持掩码/通配/正则和替换/计数动作);
+        window_size: 给出时按窗口流式读取，不映射整个文件 (适合32位设备和超大文件)
+        """
+        self.window_size = window_size
+        self.rules = rules
+        self.backup = backup
+        self.sections = list(sections or [])
+        self.manifest = manifest
+        self.skipped = False
+        self.metrics = metrics
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.interactive = interactive
+        self.progress = progress
+        self.so_file_path = so_file_path or DEFAULT_SO_PATH
+        self.strings_to_zero = list(patterns or DEFAULT_PATTERNS)
         self.total_changes = 0
+        self.scanned_bytes = 0
+        self.rule_counts = {}
+        self.plan = None
+        self.output_sha256 = None
+        self.error = None   # 最近一次失败的原因 (供批量报告使用)
 
     def check_file(self):
         """检查文件是否存在"""
         if not os.path.exists(self.so_file_path):
             print(f"{Colors.RED}❌ 错误: 文件不存在{Colors.END}")
+            self.error = "文件不存在"
             return False
         
         file_size = os.path.getsize(self.so_file_path)
@@ -209,7 +967,9 @@ class SOZeroizer:
         return True
 
     def create_backup(self):
-        """创建备份文件"""
+        """创建备份文件 (journal模式下撤销日志在写入前由 process_strings 记录)"""
+        if self.backup != "copy":
+            return True
         backup_path = self.so_file_path + '.bak'
         if not os.path.exists(backup_path):
             try:
@@ -219,47 +979,317 @@ class SOZeroizer:
                 return True
             except Exception as e:
                 print(f"{Colors.RED}❌ 备份失败: {e}{Colors.END}")
+                self.error = f"备份失败: {e}"
                 return False
         else:
             print(f"{Colors.YELLOW}⚠️  备份文件已存在{Colors.END}")
             return True
 
-    def process_strings(self):
-        """艺术化处理广告"""
+    def _stage(self, name, **fields):
+        """有metrics时记录阶段，否则为空上下文"""
+        if self.metrics is None:
+            return contextlib.nullcontext({})
+        return self.metrics.stage(name, **fields)
+
+    def find_matches(self, data, progress=None):
+        """扫描阶段 - 只读，返回按偏移排序的 (offset, length, pattern_index) 列表
+
+        全部模式一次扫描 (见 PatternMatcher)；重叠时长者优先，
+        如 "/product_banner" 中置零的是 "product_banner" 而不是 "/product"。
+        """
+        matcher = self.rule_set().matcher()
+        ranges = self.scan_ranges(data)
+        self.scanned_bytes = sum(end - start for start, end in ranges)
+        on_progress = None
+        if progress:
+            progress.total = self.scanned_bytes
+            on_progress = lambda scanned: progress.update(scanned, self.total_changes)
+        if self.workers > 1 and self.scanned_bytes > self.chunk_size:
+            return matcher.scan_file(self.so_file_path, self.workers, self.chunk_size, on_progress, ranges)
+        chunk_size = PROGRESS_CHUNK if progress and progress.enabled else None
+        return matcher.find_in_ranges(data, ranges, chunk_size, on_progress)
+
+    def scan_ranges(self, data):
+        """要扫描的文件区间；未指定 sections 时为整个文件"""
+        if not self.sections:
+            return [(0, len(data))]
+        return ElfFile(data).ranges(self.sections)
+
+    def rule_set(self):
+        """当前生效的规则集合；未指定rules时由 strings_to_zero 生成"""
+        if self.rules is None:
+            self.rules = RuleSet.from_patterns(self.strings_to_zero)
+        return self.rules
+
+    def rule_key(self):
+        """规则+节选择的指纹，决定缓存的计划能否复用"""
+        config = {"rules": self.rule_set().to_dicts(), "sections": self.sections}
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+    def plan_patches(self, data, matches, base=0, counts=None):
+        """命中 -> 补丁列表；data 为从文件偏移 base 开始的字节，counts 按规则名累计命中数
+
+        count 动作的规则只计入 counts，不产生补丁。
+        """
+        rules = self.rule_set().rules
+        patches = []
+        for offset, length, index in matches:
+            rule = rules[index]
+            if counts is not None:
+                counts[rule.name] = counts.get(rule.name, 0) + 1
+            original = bytes(data[offset - base:offset - base + length])
+            replacement = rule.replacement_for(original)
+            if replacement is not None:
+                patches.append({"offset": offset, "rule": index, "original": original.hex(),
+                                "replacement": replacement.hex()})
+        return patches
+
+    def make_plan(self, data, matches, file_hash=None, file_size=None, patches=None, counts=None):
+        """扫描结果 -> 补丁计划 (可保存为JSON，之后不扫描直接应用)
+
+        流式扫描时 data 为 None，直接传入已生成的 patches/counts 和 file_size。
+        """
+        if patches is None:
+            counts = {}
+            patches = self.plan_patches(data, matches, counts=counts)
+        return {
+            "version": PLAN_VERSION,
+            "file_sha256": file_hash,
+            "file_size": len(data) if file_size is None else file_size,
+            "rule_key": self.rule_key(),
+            "rules": self.rule_set().to_dicts(),
+            "sections": self.sections,
+            "counts": counts,
+            "patches": patches,
+        }
+
+    def verify_plan(self, data, plan, file_hash=None):
+        """确认计划适用于当前文件: 哈希(若有)一致且每处原始字节都对得上"""
+        if plan.get("file_sha256") and file_hash and plan["file_sha256"] != file_hash:
+            raise ValueError("文件哈希与补丁计划不一致")
+        if plan.get("file_size") not in (None, len(data)):
+            raise ValueError("文件大小与补丁计划不一致")
+        for patch in plan["patches"]:
+            original = bytes.fromhex(patch["original"])
+            offset = patch["offset"]
+            if data[offset:offset + len(original)] != original:
+                raise ValueError(f"偏移 0x{offset:x} 处的原始字节与补丁计划不一致")
+
+    def apply_plan(self, mm, plan):
+        """写入阶段 - 按计划写入替换字节，返回写入字节数"""
+        written = 0
+        for patch in plan["patches"]:
+            replacement = bytes.fromhex(patch["replacement"])
+            mm[patch["offset"]:patch["offset"] + len(replacement)] = replacement
+            written += len(replacement)
+        return written
+
+    def stream_windows(self, fd, size, plan=None, progress=None):
+        """窗口流式扫描 - 每次只读 window_size (+重叠) 字节，内存占用与文件大小无关
+
+        返回 (补丁列表, 命中计数, 修改前哈希, 修改后哈希)。
+        窗口末尾若有一串互相重叠、且可能与下一窗口命中重叠的候选，则窗口在这串候选的起点截止，
+        下一窗口从该处重新扫描；若这串候选就从窗口起点开始 (如长串相同字节)，则加大窗口直到整串闭合。
+        按重叠规则的选择只取决于相互重叠的候选，因此结果与整体扫描完全一致。
+        plan 给出时不扫描，只逐窗口校验原始字节并计算哈希。
+        """
+        matcher = None if plan else self.rule_set().matcher()
+        ranges = [(0, size)]
+        if matcher and self.sections:
+            ranges = ElfFile(FileView(fd, size)).ranges(self.sections)
+        overlap = matcher.max_len - 1 if matcher else 0
+        window = max(self.window_size, 2 * overlap + 1)
+        pending = sorted(plan["patches"], key=lambda patch: patch["offset"]) if plan else []
+        patches, counts = [], dict(plan.get("counts", {})) if plan else {}
+        pre_hash, post_hash = hashlib.sha256(), hashlib.sha256()
+        self.scanned_bytes = 0 if plan else sum(end - start for start, end in ranges)
+
+        pos = 0
+        while pos < size:
+            span = window
+            while True:
+                window_end = min(pos + span, size)
+                read_end = min(window_end + overlap, size)
+                buf = bytearray(os.pread(fd, read_end - pos, pos))
+
+                boundary = window_end
+                if not matcher:
+                    break
+                candidates = []
+                for start, end in ranges:
+                    lo, hi = max(start, pos), min(end, read_end)
+                    if lo < min(hi, window_end):
+                        candidates += [(offset + pos, length, index)
+                                       for offset, length, index in matcher.candidates(buf, lo - pos, hi - pos)
+                                       if offset + pos < window_end]
+                if window_end < size:
+                    # 找出延伸到窗口之外的重叠串，推迟到下一窗口处理
+                    cluster_start = cluster_end = None
+                    for offset, length, _ in sorted(candidates):
+                        if cluster_end is None or offset >= cluster_end:
+                            if cluster_end is not None and cluster_end > window_end:
+                                break
+                            cluster_start, cluster_end = offset, offset + length
+                        else:
+                            cluster_end = max(cluster_end, offset + length)
+                    if cluster_end is not None and cluster_end > window_end:
+                        boundary = cluster_start
+                if boundary > pos:
+                    break
+                # 重叠串从窗口起点一直延伸到窗口外 (如长串相同字节)，加大窗口直到整串闭合
+                span *= 2
+
+            if matcher:
+                window_patches = self.plan_patches(
+                    buf, matcher.resolve(item for item in candidates if item[0] < boundary), pos, counts)
+                patches += window_patches
+            else:
+                window_patches = []
+                while pending and pending[0]["offset"] < boundary:
+                    window_patches.append(pending.pop(0))
+                for patch in window_patches:
+                    original = bytes.fromhex(patch["original"])
+                    # 跨窗口的补丁: 读到的部分在buf内，其余直接pread核对
+                    if bytes(os.pread(fd, len(original), patch["offset"])) != original:
+                        raise ValueError(f"偏移 0x{patch['offset']:x} 处的原始字节与补丁计划不一致")
+
+            pre_hash.update(memoryview(buf)[:boundary - pos])
+            for patch in window_patches:
+                replacement = bytes.fromhex(patch["replacement"])
+                start = patch["offset"] - pos
+                head = replacement[:max(0, boundary - pos - start)]
+                buf[start:start + len(head)] = head
+                # 越过窗口的尾部留给下一窗口
+                if len(head) < len(replacement):
+                    pending.insert(0, {"offset": patch["offset"] + len(head),
+                                       "original": patch["original"][2 * len(head):],
+                                       "replacement": replacement[len(head):].hex()})
+            post_hash.update(memoryview(buf)[:boundary - pos])
+            if progress:
+                progress.update(boundary - pos, len(patches))
+            pos = boundary
+        return patches, counts, pre_hash.hexdigest(), post_hash.hexdigest()
+
+    def process_streaming(self, plan=None, plan_out=None, plan_only=False, file_hash=None):
+        """窗口流式处理: 不映射整个文件，扫描完成后只把修改的区间 pwrite 回去"""
+        try:
+            size = os.path.getsize(self.so_file_path)
+            progress = ArtisticProgress(size, enabled=self.progress)
+            fd = os.open(self.so_file_path, os.O_RDONLY if plan_only else os.O_RDWR)
+            try:
+                with self._stage("scan" if plan is None else "verify", window=self.window_size) as record:
+                    patches, counts, pre_hash, post_hash = self.stream_windows(fd, size, plan, progress)
+                    record["bytes_processed"] = size
+                if file_hash and file_hash != pre_hash:
+                    raise ValueError("文件在处理过程中被修改")
+                if plan is None:
+                    plan = self.make_plan(None, None, pre_hash, size, patches, counts)
+                elif plan.get("file_sha256") and plan["file_sha256"] != pre_hash:
+                    raise ValueError("文件哈希与补丁计划不一致")
+                self.plan = plan
+                self.rule_counts = plan.get("counts", {})
+
+                if plan_out:
+                    write_json_atomic(plan_out, plan)
+                    print(f"{Colors.GREEN}✅ 补丁计划已保存: {plan_out} ({len(plan['patches'])}处){Colors.END}")
+                if plan_only:
+                    return True
+
+                if plan["patches"]:
+                    journal = UndoJournal(self.so_file_path) if self.backup == "journal" else None
+                    with self._stage("patch") as record:
+                        if journal:
+                            journal.begin(pre_hash, plan)
+                        written = 0
+                        for patch in plan["patches"]:
+                            written += os.pwrite(fd, bytes.fromhex(patch["replacement"]), patch["offset"])
+                        os.fsync(fd)
+                        record["bytes_processed"] = written
+                    if journal:
+                        journal.commit(post_hash)
+                    self.total_changes += len(plan["patches"])
+                self.output_sha256 = post_hash
+                if self.manifest:
+                    self.manifest.record(plan, post_hash, self.so_file_path)
+                progress.complete(self.total_changes)
+                return True
+            finally:
+                os.close(fd)
+        except Exception as e:
+            print(f"\n{Colors.RED}❌ 处理失败: {e}{Colors.END}")
+            self.error = str(e)
+            return False
+
+    def process_strings(self, plan=None, plan_out=None, plan_only=False, file_hash=None):
+        """艺术化处理广告
+
+        plan: 已有的补丁计划，给出时跳过扫描，只校验后写入;
+        plan_out: 把计划保存到此路径; plan_only: 只生成计划不修改文件;
+        file_hash: 调用方已算好的文件SHA-256，省去再读一遍
+        """
+        if self.window_size:
+            return self.process_streaming(plan, plan_out, plan_only, file_hash)
         try:
-            progress = ArtisticProgress(len(self.strings_to_zero))
+            progress = ArtisticProgress(os.path.getsize(self.so_file_path), enabled=self.progress)
+            access = mmap.ACCESS_READ if plan_only else mmap.ACCESS_WRITE
             
-            with open(self.so_file_path, 'r+b') as f:
-                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE) as mm:
+            with open(self.so_file_path, 'rb' if plan_only else 'r+b') as f:
+                with mmap.mmap(f.fileno(), 0, access=access) as mm:
                     
-                    print(f"\n{Colors.BOLD}🎨 开始去除广告...{Colors.END}\n")
-                    time.sleep(1)
+                    if self.interactive:
+                        print(f"\n{Colors.BOLD}🎨 开始去除广告...{Colors.END}\n")
+                        time.sleep(1)
                     
-                    for i, target_string in enumerate(self.strings_to_zero):
-                        target_len = len(target_string)
-                        found_count = 0
-                        
-                        # 搜索并置零
-                        pos = 0
-                        while True:
-                            found_pos = mm.find(target_string, pos)
-                            if found_pos == -1:
-                                break
-                            
-                            mm[found_pos:found_pos+target_len] = b'\x00' * target_len
-                            found_count += 1
-                            self.total_changes += 1
-                            pos = found_pos + target_len
-                        
-                        progress.update(1, self.total_changes)
-                        time.sleep(0.1)
+                    journal = None
+                    if self.backup == "journal" and not plan_only:
+                        journal = UndoJournal(self.so_file_path)
+                    
+                    if file_hash is None and (plan_out or self.manifest or journal or (plan and plan.get("file_sha256"))):
+                        with self._stage("hash") as record:
+                            record["bytes_processed"] = len(mm)
+                            file_hash = hashlib.sha256(mm).hexdigest()
+                    
+                    if plan is None:
+                        with self._stage("scan", rules=len(self.rule_set().rules), workers=self.workers) as record:
+                            matches = self.find_matches(mm, progress)
+                            record["bytes_processed"] = self.scanned_bytes
+                            record["matches"] = len(matches)
+                        plan = self.make_plan(mm, matches, file_hash)
+                    else:
+                        with self._stage("verify", patches=len(plan["patches"])):
+                            self.verify_plan(mm, plan, file_hash)
+                        print(f"{Colors.BLUE}📋 套用补丁计划，跳过扫描{Colors.END}")
+                    self.plan = plan
+                    self.rule_counts = plan.get("counts", {})
+                    
+                    if plan_out:
+                        write_json_atomic(plan_out, plan)
+                        print(f"{Colors.GREEN}✅ 补丁计划已保存: {plan_out} ({len(plan['patches'])}处){Colors.END}")
+                    if plan_only:
+                        return True
+                    
+                    if plan["patches"]:
+                        with self._stage("patch") as record:
+                            if journal:
+                                journal.begin(file_hash, plan)
+                            record["bytes_processed"] = self.apply_plan(mm, plan)
+                            mm.flush()
+                        self.total_changes += len(plan["patches"])
+                        if file_hash:
+                            self.output_sha256 = hashlib.sha256(mm).hexdigest()
+                        if journal:
+                            journal.commit(self.output_sha256)
+                    else:
+                        self.output_sha256 = file_hash
+                    if self.manifest and file_hash:
+                        self.manifest.record(plan, self.output_sha256, self.so_file_path)
                     
-                    mm.flush()
                     progress.complete(self.total_changes)
                     return True
                     
         except Exception as e:
             print(f"\n{Colors.RED}❌ 处理失败: {e}{Colors.END}")
+            self.error = str(e)
             return False
 
     def run(self):
@@ -292,15 +1322,422 @@ class SOZeroizer:
         
         return success
 
+    def restore(self, everything=False):
+        """按撤销日志恢复文件"""
+        try:
+            journal = UndoJournal(self.so_file_path)
+            if not journal.generations:
+                print(f"{Colors.YELLOW}⚠️  没有撤销日志: {os.path.basename(self.so_file_path)}{Colors.END}")
+                return False
+            restored = journal.restore(everything)
+            print(f"{Colors.GREEN}✅ 已恢复 {restored} 次修改: {os.path.basename(self.so_file_path)}{Colors.END}")
+            return True
+        except (OSError, ValueError) as e:
+            print(f"{Colors.RED}❌ 恢复失败: {e}{Colors.END}")
+            return False
+
+    def process_apk(self, apk_path, output_apk, library="libapp.so", sign=False, workers=None):
+        """直接修改APK内的 lib/<abi>/<library>
+
+        各ABI的库在进程池中并发解压、扫描、置零；最后只重写一次APK:
+        被修改的库替换为新内容，其余条目原样复制。sign=True 时用 cs.py 的内置签名器重新签名。
+        """
+        from cs import repack_apk
+        try:
+            with zipfile.ZipFile(apk_path, 'r') as zip_file:
+                libraries = [
+                    info.filename for info in zip_file.infolist()
+                    if info.filename.count('/') == 2 and info.filename.startswith('lib/')
+                    and fnmatch.fnmatch(info.filename.rsplit('/', 1)[1], library)
+                ]
+        except (OSError, zipfile.BadZipFile) as e:
+            print(f"{Colors.RED}❌ 无法读取APK: {e}{Colors.END}")
+            return False
+        if not libraries:
+            print(f"{Colors.YELLOW}⚠️  APK中没有 lib/*/{library}{Colors.END}")
+            return False
+
+        options = {"rules": self.rule_set().to_dicts(), "sections": self.sections,
+                   "window_size": self.window_size}
+        work_dir = tempfile.mkdtemp(prefix="so_zeroizer_apk_")
+        try:
+            with self._stage("apk_libs", libraries=len(libraries)) as record:
+                max_workers = min(len(libraries), workers or os.cpu_count() or 1)
+                with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                    results = list(executor.map(
+                        _patch_apk_library, [apk_path] * len(libraries), libraries,
+                        [work_dir] * len(libraries), [options] * len(libraries)
+                    ))
+                record["bytes_processed"] = sum(result["bytes"] for result in results)
+
+            replacements = {}
+            for result in results:
+                if result["error"]:
+                    print(f"{Colors.RED}❌ {result['arcname']}: {result['error']}{Colors.END}")
+                    return False
+                print(f"{Colors.BLUE}📦 {result['arcname']}: {result['changes']}处{Colors.END}")
+                self.total_changes += result["changes"]
+                if result["changes"]:
+                    replacements[result["arcname"]] = result["path"]
+
+            with self._stage("repack", replaced=len(replacements)) as record:
+                record["bytes_processed"] = os.path.getsize(apk_path)
+                repack_apk(apk_path, output_apk, replacements)
+            if sign:
+                from cs import ApkSigner, DebugSigningKey, DEBUG_KEY_PATH
+                with self._stage("sign") as record:
+                    record["bytes_processed"] = os.path.getsize(output_apk)
+                    ApkSigner(DebugSigningKey.load_or_create(DEBUG_KEY_PATH)).sign(output_apk)
+            print(f"{Colors.GREEN}✅ 已生成: {output_apk} (替换 {len(replacements)} 个库，"
+                  f"共修改 {self.total_changes} 处){Colors.END}")
+            return True
+        except Exception as e:
+            print(f"{Colors.RED}❌ APK处理失败: {e}{Colors.END}")
+            return False
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def run_headless(self, plan=None, plan_out=None, plan_only=False, file_hash=None):
+        """无交互运行: 不显示欢迎界面/菜单，不播放提示音"""
+        if not self.check_file():
+            return False
+        
+        if self.manifest and file_hash is None:
+            with self._stage("hash") as record:
+                record["bytes_processed"] = os.path.getsize(self.so_file_path)
+                file_hash = file_sha256(self.so_file_path)
+        if self.manifest:
+            entry = self.manifest.lookup(file_hash, self.rule_key())
+            if entry and entry["role"] == "output":
+                print(f"{Colors.YELLOW}⏭️  已处理过，跳过{Colors.END}")
+                self.skipped = True
+                return True
+            if entry and plan is None:
+                plan = self.manifest.load_plan(entry)
+        
+        if not plan_only and not self.create_backup():
+            print(f"{Colors.RED}❌ 无法继续，备份创建失败{Colors.END}")
+            return False
+        return self.process_strings(plan, plan_out, plan_only, file_hash)
+
+
+def _patch_apk_library(apk_path, arcname, work_dir, options):
+    """进程池任务: 解压APK中的一个库到临时文件并就地置零"""
+    started = time.time()
+    path = os.path.join(work_dir, arcname.replace('/', '_'))
+    result = {"arcname": arcname, "path": path, "changes": 0, "bytes": 0, "error": None}
+    try:
+        with zipfile.ZipFile(apk_path, 'r') as zip_file:
+            with zip_file.open(arcname) as src, open(path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        zeroizer = SOZeroizer(so_file_path=path, rules=RuleSet.from_dicts(options["rules"]),
+                              sections=options["sections"], interactive=False, progress=False, backup="none",
+                              window_size=options.get("window_size"))
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            ok = zeroizer.process_strings()
+        if not ok:
+            result["error"] = zeroizer.error or "扫描失败"
+        result["changes"] = zeroizer.total_changes
+        result["bytes"] = os.path.getsize(path)
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = round(time.time() - started, 3)
+    return result
+
+
+def expand_inputs(inputs, include="*.so"):
+    """目录 (递归，按 include 过滤文件名)、通配符和普通路径 -> 去重后的文件列表"""
+    files, seen = [], set()
+    for item in inputs:
+        if os.path.isdir(item):
+            found = []
+            for root, _, names in os.walk(item):
+                found += [os.path.join(root, name) for name in names if fnmatch.fnmatch(name, include)]
+        elif glob.has_magic(item):
+            found = [path for path in glob.glob(item, recursive=True) if os.path.isfile(path)]
+        else:
+            found = [item]
+        for path in sorted(found):
+            real_path = os.path.realpath(path)
+            if real_path not in seen:
+                seen.add(real_path)
+                files.append(path)
+    return files
+
+
+def _hash_file(path):
+    """进程池任务: (sha256, 错误信息)"""
+    try:
+        return file_sha256(path), None
+    except OSError as e:
+        return None, str(e)
+
+
+def _batch_group(paths, file_hash, options, plan=None):
+    """进程池任务: 处理内容相同的一组文件 - 第一个扫描生成计划，其余直接套用"""
+    results = []
+    for path in paths:
+        started = time.time()
+        result = {"path": path, "sha256": file_hash, "ok": False, "changes": 0, "bytes_scanned": 0,
+                  "reused_plan": plan is not None, "error": None}
+        try:
+            zeroizer = SOZeroizer(so_file_path=path, rules=RuleSet.from_dicts(options["rules"]),
+                                  sections=options["sections"], interactive=False, progress=False,
+                                  backup=options["backup"], window_size=options.get("window_size"))
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                result["ok"] = zeroizer.run_headless(plan=plan, file_hash=file_hash)
+            result.update(changes=zeroizer.total_changes, bytes_scanned=zeroizer.scanned_bytes,
+                          counts=zeroizer.rule_counts, output_sha256=zeroizer.output_sha256)
+            if result["ok"] and plan is None:
+                plan = zeroizer.plan
+            if not result["ok"]:
+                result["error"] = zeroizer.error or "处理失败"
+        except Exception as e:
+            result["error"] = str(e)
+        result["seconds"] = round(time.time() - started, 3)
+        results.append(result)
+    return results, plan
+
+
+def run_batch(paths, rule_set, sections=(), jobs=None, backup="journal", manifest=None, window_size=None):
+    """批量处理大量 .so 文件，返回与 paths 同序的结果列表
+
+    先在进程池中并行计算哈希，内容相同的文件只扫描一次；每组在一个进程中处理，
+    单个文件失败不影响其他文件。清单 (manifest) 只由主进程读写。
+    """
+    jobs = jobs or os.cpu_count() or 1
+    options = {"rules": rule_set.to_dicts(), "sections": list(sections), "backup": backup,
+               "window_size": window_size}
+    rule_key = SOZeroizer(rules=rule_set, sections=sections).rule_key()
+    results = {}
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        groups = {}
+        for path, (file_hash, error) in zip(paths, executor.map(_hash_file, paths)):
+            if error:
+                results[path] = {"path": path, "ok": False, "error": error}
+            else:
+                groups.setdefault(file_hash, []).append(path)
+
+        futures = {}
+        for file_hash, group in groups.items():
+            entry = manifest.lookup(file_hash, rule_key) if manifest else None
+            if entry and entry["role"] == "output":
+                for path in group:
+                    results[path] = {"path": path, "sha256": file_hash, "ok": True, "skipped": True, "changes": 0}
+                continue
+            plan = manifest.load_plan(entry) if entry else None
+            futures[executor.submit(_batch_group, group, file_hash, options, plan)] = group
+
+        for future in as_completed(futures):
+            group = futures[future]
+            try:
+                group_results, plan = future.result()
+            except Exception as e:
+                group_results, plan = [{"path": path, "ok": False, "error": str(e)} for path in group], None
+            for result in group_results:
+                results[result["path"]] = result
+                mark = "✅" if result["ok"] else "❌"
+                detail = f"{result.get('changes', 0)}处" if result["ok"] else result["error"]
+                print(f"{mark} {result['path']}: {detail}")
+            if manifest and plan:
+                done = next((result for result in group_results if result["ok"]), None)
+                if done and done.get("output_sha256"):
+                    manifest.record(plan, done["output_sha256"], done["path"])
+    return [results[path] for path in paths]
+
+
+def batch_report(results, seconds):
+    """汇总批量结果"""
+    hashes = [result.get("sha256") for result in results if result.get("sha256")]
+    return {
+        "summary": {
+            "files": len(results),
+            "ok": sum(1 for result in results if result["ok"]),
+            "failed": sum(1 for result in results if not result["ok"]),
+            "skipped": sum(1 for result in results if result.get("skipped")),
+            "duplicates": len(hashes) - len(set(hashes)),
+            "changes": sum(result.get("changes", 0) for result in results),
+            "bytes_scanned": sum(result.get("bytes_scanned", 0) for result in results),
+            "seconds": round(seconds, 3),
+        },
+        "files": results,
+    }
+
+
+def parse_pattern(text):
+    """命令行模式串 -> bytes，支持 \\xNN 等转义"""
+    return codecs.escape_decode(text.encode('utf-8'))[0]
+
+
+def load_patterns(path):
+    """模式文件: 每行一个模式，空行和 # 开头的行忽略"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [parse_pattern(line.rstrip('\n')) for line in f if line.strip() and not line.startswith('#')]
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="SO字符串置零工具 (无参数运行时进入交互界面)")
+    parser.add_argument("files", nargs="+", help="要处理的 .so/.apk 文件、目录或通配符")
+    parser.add_argument("-p", "--pattern", action="append", default=[], help="要置零的字符串，可多次指定 (支持\\xNN转义)")
+    parser.add_argument("--patterns-file", help="模式文件，每行一个")
+    parser.add_argument("--rules", help="规则文件 (JSON，支持literal/hex/wildcard/regex及zero/replace/count动作)；"
+                                        "指定后不再使用内置模式列表")
+    parser.add_argument("--no-default-patterns", action="store_true", help="不使用内置模式列表")
+    parser.add_argument("--backup", choices=["journal", "copy", "none"], default="journal",
+                        help="备份方式: journal 只记录被改字节的撤销日志, copy 整文件.bak, none 不备份")
+    parser.add_argument("--no-backup", action="store_const", dest="backup", const="none", help="同 --backup none")
+    parser.add_argument("--restore", action="store_true", help="按撤销日志撤销最近一次修改")
+    parser.add_argument("--restore-all", action="store_true", help="按撤销日志撤销全部修改")
+    parser.add_argument("--sections", default="",
+                        help="只扫描这些ELF节/符号，逗号分隔 (如 .rodata,.dynstr；dart 表示Dart快照数据；sym:名称)")
+    parser.add_argument("--workers", type=int, help="扫描进程数 (默认1；APK模式默认每个ABI一个进程)")
+    parser.add_argument("--chunk-mb", type=int, default=16, help="并行扫描时每块大小 (MB)")
+    parser.add_argument("--window-mb", type=int, default=0,
+                        help="流式模式: 每次只读这么多MB，不映射整个文件 (0 为整体映射)")
+    parser.add_argument("--progress", choices=["auto", "on", "off"], default="auto",
+                        help="进度条: auto 仅在终端中显示")
+    parser.add_argument("--metrics", help="阶段指标输出 (JSONL)")
+    parser.add_argument("--write-plan", help="把补丁计划保存为JSON (单个文件时)")
+    parser.add_argument("--plan-only", action="store_true", help="只扫描并生成计划，不修改文件")
+    parser.add_argument("--apply-plan", help="套用已保存的补丁计划，跳过扫描 (单个文件时)")
+    parser.add_argument("--manifest", help="已处理文件清单: 跳过已处理的文件，相同内容复用计划")
+    parser.add_argument("--apk-out", help="输入为APK时的输出路径 (默认 <名称>_zeroized.apk)")
+    parser.add_argument("--lib", default="libapp.so", help="APK模式下要修改的库名 (支持通配符)")
+    parser.add_argument("--sign", action="store_true", help="APK模式下用内置调试密钥重新签名 (v1+v2)")
+    parser.add_argument("--jobs", type=int, help="批量模式的并行进程数 (默认CPU核数)")
+    parser.add_argument("--include", default="*.so", help="目录输入时匹配的文件名 (默认 *.so)")
+    parser.add_argument("--report", help="批量模式的汇总报告 (JSON)")
+    return parser
+
+
+def cli(argv):
+    """无交互入口，返回退出码: 0 成功, 1 有文件失败, 2 参数错误"""
+    parser = build_arg_parser()
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit as e:
+        return EXIT_OK if e.code == 0 else EXIT_USAGE
+
+    # 恢复只依赖撤销日志/备份，不需要任何模式
+    if args.restore or args.restore_all:
+        failed = sum(1 for path in args.files if not SOZeroizer(so_file_path=path).restore(args.restore_all))
+        return EXIT_FAILED if failed else EXIT_OK
+
+    try:
+        patterns = [] if args.no_default_patterns or args.rules else list(DEFAULT_PATTERNS)
+        if args.patterns_file:
+            patterns += load_patterns(args.patterns_file)
+        patterns += [parse_pattern(pattern) for pattern in args.pattern]
+        rules = RuleSet.from_patterns(patterns).rules if patterns else []
+        if args.rules:
+            rules += RuleSet.load(args.rules).rules
+    except (OSError, ValueError, KeyError, re.error) as e:
+        print(f"{Colors.RED}❌ 模式参数错误: {e}{Colors.END}")
+        return EXIT_USAGE
+    if not rules:
+        print(f"{Colors.RED}❌ 没有要置零的模式{Colors.END}")
+        return EXIT_USAGE
+    rule_set = RuleSet(rules)
+
+    # 参数检查针对展开后的文件列表: 一个目录或通配符也可能展开成多个文件
+    paths = expand_inputs(args.files, args.include)
+    if not paths:
+        print(f"{Colors.RED}❌ 没有找到要处理的文件{Colors.END}")
+        return EXIT_USAGE
+    apks = [path for path in paths if path.lower().endswith('.apk')]
+    libraries = [path for path in paths if path not in apks]
+    batch = bool(args.jobs or args.report or len(libraries) > 1 or len(paths) != len(args.files))
+
+    if (args.write_plan or args.apply_plan) and (batch or len(paths) != 1 or apks):
+        print(f"{Colors.RED}❌ --write-plan/--apply-plan 只能用于单个 .so 文件 (不支持批量模式){Colors.END}")
+        return EXIT_USAGE
+    if args.apk_out and len(apks) != 1:
+        print(f"{Colors.RED}❌ --apk-out 只能用于单个APK (匹配到 {len(apks)} 个){Colors.END}")
+        return EXIT_USAGE
+    if args.plan_only and not args.write_plan:
+        print(f"{Colors.RED}❌ --plan-only 需要配合 --write-plan{Colors.END}")
+        return EXIT_USAGE
+    if batch and libraries and (args.metrics or args.workers):
+        print(f"{Colors.RED}❌ 批量模式不支持 --metrics/--workers (按文件并行，请用 --jobs){Colors.END}")
+        return EXIT_USAGE
+    plan = None
+    if args.apply_plan:
+        try:
+            plan = load_plan(args.apply_plan)
+        except (OSError, ValueError) as e:
+            print(f"{Colors.RED}❌ 补丁计划错误: {e}{Colors.END}")
+            return EXIT_USAGE
+        # 计划自带规则和节选择，保证规则指纹一致
+        rule_set = RuleSet.from_dicts(plan["rules"])
+        args.sections = ",".join(plan["sections"])
+
+    show_progress = args.progress == "on" or (args.progress == "auto" and sys.stdout.isatty())
+    manifest = PatchManifest(args.manifest) if args.manifest else None
+    metrics = None
+    if args.metrics:
+        from cs import StageMetrics
+        metrics = StageMetrics(sink=args.metrics, tool="so_zeroizer")
+
+    sections = [name for name in args.sections.split(',') if name]
+
+    failed = 0
+    if batch and libraries:
+        started = time.time()
+        results = run_batch(libraries, rule_set, sections, args.jobs, args.backup, manifest,
+                            args.window_mb * 1024 * 1024)
+        report = batch_report(results, time.time() - started)
+        summary = report["summary"]
+        print(f"\n{Colors.BOLD}📊 批量完成: {summary['ok']}/{summary['files']} 成功, 失败 {summary['failed']}, "
+              f"跳过 {summary['skipped']}, 重复 {summary['duplicates']}, 修改 {summary['changes']}处, "
+              f"扫描 {summary['bytes_scanned'] / 1024 / 1024:.1f} MB, 耗时 {summary['seconds']:.1f}s{Colors.END}")
+        if args.report:
+            write_json_atomic(args.report, report)
+        failed += summary["failed"]
+        paths = [path for path in paths if path not in libraries]
+
+    for path in paths:
+        zeroizer = SOZeroizer(
+            metrics, workers=args.workers or 1, chunk_size=args.chunk_mb * 1024 * 1024,
+            so_file_path=path, rules=rule_set, interactive=False, progress=show_progress,
+            window_size=args.window_mb * 1024 * 1024,
+            sections=sections, manifest=manifest, backup=args.backup
+        )
+        try:
+            if path.lower().endswith('.apk'):
+                output_apk = args.apk_out or os.path.splitext(path)[0] + "_zeroized.apk"
+                ok = zeroizer.process_apk(path, output_apk, args.lib, args.sign, args.workers)
+            else:
+                ok = zeroizer.run_headless(plan, args.write_plan, args.plan_only)
+            for name, count in zeroizer.rule_counts.items():
+                print(f"{Colors.CYAN}   📊 {name}: {count}处{Colors.END}")
+            if not ok:
+                failed += 1
+        except Exception as e:
+            print(f"{Colors.RED}❌ {path}: {e}{Colors.END}")
+            failed += 1
+    if metrics:
+        metrics.print_summary()
+    return EXIT_FAILED if failed else EXIT_OK
+
+
 def main():
     """主函数"""
     try:
-        zeroizer = SOZeroizer()
+        metrics = None
+        if os.environ.get("SO_ZEROIZER_METRICS"):
+            from cs import StageMetrics
+            metrics = StageMetrics(sink=os.environ["SO_ZEROIZER_METRICS"], tool="so_zeroizer")
+        zeroizer = SOZeroizer(metrics, workers=int(os.environ.get("SO_ZEROIZER_WORKERS", "1")))
         zeroizer.run()
+        if metrics:
+            metrics.print_summary()
     except KeyboardInterrupt:
         print(f"\n{Colors.BLUE}👋 再见！{Colors.END}")
     except Exception as e:
         print(f"{Colors.RED}❌ 发生错误: {e}{Colors.END}")
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(cli(sys.argv[1:]))
     main()
\ No newline at end of file